@@ -0,0 +1,102 @@
+"""
+Счётчики 1д/7д/30д и последнее появление по шаблонам (error_data).
+
+Два пути с одинаковым результатом:
+  • поштучный — цикл по логам (как раньше в count_and_aggregate);
+  • векторный (NumPy) — шаблоны кодируются целыми числами, даты — массив
+    int64 (мкс от эпохи); счётчики окон — bincount по маскам, последнее
+    появление — индекс максимальной даты в группе (lexsort).
+Векторный путь включается сам, если NumPy установлен и логов не меньше
+VECTOR_MIN_ROWS: на малых объёмах перевод в массивы дороже выигрыша.
+NumPy — необязательная зависимость (в requirements.txt не входит): без
+него всегда поштучный путь. Коллектор считает окна через хранилище
+счётчиков (group_counters.py) и приходит сюда, только когда хранилище
+недоступно.
+
+Семантика общая: окно отсчитывается от naive-даты как от UTC, а
+последнее появление — date.astimezone(UTC), то есть naive-дата трактуется
+как локальное время процесса (как было в count_and_aggregate).
+Даты с часовым поясом векторный путь не берёт — такие пачки считаются
+поштучно.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from group_counters import WINDOWS
+
+VECTOR_MIN_ROWS = 1000
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def aggregate_python(dates: list[datetime], patterns: list[str], now: datetime) -> dict:
+    """Поштучный путь: шаблон → {'counts': {...}, 'last_seen'}; пустые шаблоны пропускаются."""
+    limits = {name: timedelta(days=days) for name, days in WINDOWS.items()}
+    error_data: dict[str, dict] = {}
+    for date, error_pattern in zip(dates, patterns):
+        if not error_pattern:
+            continue
+        data = error_data.get(error_pattern)
+        if data is None:
+            data = error_data[error_pattern] = {'counts': dict.fromkeys(WINDOWS, 0), 'last_seen': None}
+        delta = now - date.replace(tzinfo=timezone.utc)
+        for name, limit in limits.items():
+            if delta <= limit:
+                data['counts'][name] += 1
+        seen = date.astimezone(timezone.utc)
+        if data['last_seen'] is None or seen > data['last_seen']:
+            data['last_seen'] = seen
+    return error_data
+
+
+def aggregate_numpy(dates: list[datetime], patterns: list[str], now: datetime) -> dict | None:
+    """Векторный путь; None — в пачке есть даты с часовым поясом."""
+    codes_of: dict[str, int] = {}
+    codes = np.fromiter((codes_of.setdefault(p, len(codes_of)) for p in patterns),
+                        dtype=np.int64, count=len(patterns))
+    # Вычитание naive-эпохи втрое быстрее np.array(dates, 'datetime64[us]')
+    # и само отсекает aware-даты (TypeError)
+    try:
+        stamps = np.fromiter(((date - _EPOCH) // _US for date in dates),
+                             dtype=np.int64, count=len(dates))
+    except TypeError:
+        return None
+    now_us = (now.astimezone(timezone.utc).replace(tzinfo=None) - _EPOCH) // _US
+    delta = now_us - stamps
+    groups = len(codes_of)
+    counts = {name: np.bincount(codes[delta <= days * 86_400_000_000], minlength=groups)
+              for name, days in WINDOWS.items()}
+    # Последнее появление: после сортировки по (код, дата) — последний индекс каждого кода
+    order = np.lexsort((stamps, codes))
+    sorted_codes = codes[order]
+    ends = np.flatnonzero(np.diff(sorted_codes, append=groups))
+    latest = dict(zip(sorted_codes[ends].tolist(), order[ends].tolist()))
+
+    error_data: dict[str, dict] = {}
+    for pattern, code in codes_of.items():
+        if not pattern:
+            continue
+        error_data[pattern] = {
+            'counts': {name: int(values[code]) for name, values in counts.items()},
+            'last_seen': dates[latest[code]].astimezone(timezone.utc),
+        }
+    return error_data
+
+
+def aggregate(dates: list[datetime], patterns: list[str], now: datetime,
+              vectorized: bool | None = None) -> dict:
+    """error_data по датам и шаблонам логов (пары поэлементно).
+    vectorized: None — по объёму и наличию NumPy; False — поштучно;
+    True — векторно, если NumPy есть."""
+    if vectorized is None:
+        vectorized = len(patterns) >= VECTOR_MIN_ROWS
+    if vectorized and np is not None and patterns:
+        error_data = aggregate_numpy(dates, patterns, now)
+        if error_data is not None:
+            return error_data
+    return aggregate_python(dates, patterns, now)
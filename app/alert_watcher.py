@@ -8,7 +8,9 @@
   4. Шлёт ОДНО сводное уведомление в alert_chat_id, но не чаще раза в 30 минут,
      сколько бы логов ни падало. Накопленное за период уходит одним сообщением.
 
-Курсор продвигается каждый запуск, поэтому одно событие учитывается один раз.
+Курсор продвигается после каждой страницы хвоста (telegram_fetch.fetch_pages,
+по возрастанию id), поэтому одно событие учитывается один раз и не теряется
+при всплеске или простое.
 
 Защита от перегрузки Telegram/прокси (иначе мешает сбору telegram_to_sheets.py):
   • flock-lock (alert_watcher.lock) не даёт прогонам накладываться друг на друга;
@@ -23,20 +25,22 @@ import shutil
 import sqlite3
 import random
 import fcntl
+import contextlib
 from datetime import datetime, timedelta
 
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from telethon import TelegramClient
 
 from telegram_proxy import get_telegram_proxy
 from telegram_to_sheets import prepare_session_paths, CATEGORY_SHEET_TITLE
+from sheets_client import open_spreadsheet
+from sheets_snapshot import load_snapshot
+from telegram_fetch import FLOOD_SLEEP_THRESHOLD, fetch_pages
 
 # ===== Константы =====
 BASE_DIR = '/app'
 LOG_PATH = os.path.join(BASE_DIR, 'logs/alert_watcher.log')
 CONFIG_PATH = os.path.join(BASE_DIR, 'config.json')
-CREDENTIALS_FILE = os.path.join(BASE_DIR, 'google-credentials.json')
 ALERT_LAST_ID_FILE = os.path.join(BASE_DIR, 'alert_last_id.txt')
 ALERT_STATE_FILE = os.path.join(BASE_DIR, 'alert_state.json')
 LOCK_PATH = os.path.join(BASE_DIR, 'alert_watcher.lock')
@@ -48,8 +52,8 @@ ALERT_INTERVAL_MIN = 30
 MAX_LINES_PER_MESSAGE = 25
 # Ограничение на размер накопленного буфера, чтобы не рос бесконечно.
 MAX_PENDING = 500
-# Сколько последних сообщений тянуть за запуск (страховка от пропусков).
-FETCH_LIMIT = 300
+# Сколько секунд за запуск догружать хвост (остаток — в следующий запуск).
+FETCH_BUDGET_SEC = 180
 TELEGRAM_CONNECT_RETRIES = 4
 TELEGRAM_RETRY_DELAYS_SEC = [10, 30, 60]
 
@@ -117,14 +121,14 @@ def can_send(last_sent_iso, now):
 def load_alert_triggers():
     """Читает критичные триггеры из вкладки Categories: строки с непустым столбцом C ('Алерт').
     Возвращает список пар (trigger, category) в порядке листа."""
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     with open(CONFIG_PATH, 'r') as f:
         config = json.load(f)
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    client_gs = gspread.authorize(creds)
-    spreadsheet = client_gs.open_by_key(config['google_sheet_id'])
-    sheet = spreadsheet.worksheet(CATEGORY_SHEET_TITLE)
-    rows = sheet.get_all_values()
+    spreadsheet = open_spreadsheet(config['google_sheet_id'])
+    # Только колонки A:C (категория, триггер, алерт) — одним снимком
+    snapshot = load_snapshot(spreadsheet, {CATEGORY_SHEET_TITLE: 'A:C'})
+    if not snapshot.has(CATEGORY_SHEET_TITLE):
+        raise gspread.exceptions.WorksheetNotFound(CATEGORY_SHEET_TITLE)
+    rows = snapshot.values(CATEGORY_SHEET_TITLE)
     triggers = []
     seen = set()
     for row in rows[1:]:
@@ -234,6 +238,7 @@ async def main():
                 config['api_id'],
                 config['api_hash'],
                 proxy=telegram_proxy,
+                flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD,
             )
             try:
                 for _ in range(5):
@@ -266,23 +271,29 @@ async def main():
             return
 
         last_id = read_last_id()
-        messages = await client.get_messages(int(config['chat_id']), limit=FETCH_LIMIT, min_id=last_id)
-        new_messages = [m for m in messages if m.id > last_id]
-
         state = read_state()
         now = datetime.now()
 
-        if new_messages:
-            new_messages.sort(key=lambda m: m.id)
-            matches = find_matches(new_messages, triggers)
-            if matches:
-                state['pending'].extend(matches)
-                # Защита от бесконечного роста: храним самые свежие.
-                if len(state['pending']) > MAX_PENDING:
-                    state['pending'] = state['pending'][-MAX_PENDING:]
-                logging.info("Найдено критичных: %s (в буфере: %s)", len(matches), len(state['pending']))
-            # Курсор двигаем всегда — каждое событие учитываем один раз.
-            save_last_id(new_messages[-1].id)
+        # Хвост с курсора — страницами по возрастанию id: после простоя или
+        # всплеска старые события не теряются, курсор и буфер сохраняются
+        # после каждой страницы
+        started = asyncio.get_running_loop().time()
+        async with contextlib.aclosing(fetch_pages(client, int(config['chat_id']), last_id)) as pages:
+            async for page in pages:
+                matches = find_matches(page, triggers)
+                if matches:
+                    state['pending'].extend(matches)
+                    # Защита от бесконечного роста: храним самые свежие.
+                    if len(state['pending']) > MAX_PENDING:
+                        state['pending'] = state['pending'][-MAX_PENDING:]
+                    logging.info("Найдено критичных: %s (в буфере: %s)", len(matches), len(state['pending']))
+                # Курсор двигаем всегда — каждое событие учитываем один раз.
+                save_last_id(page[-1].id)
+                save_state(state)
+                if asyncio.get_running_loop().time() - started > FETCH_BUDGET_SEC:
+                    # Остаток хвоста — в следующий запуск, уведомление не задерживаем
+                    logging.warning("Догрузка остановлена по бюджету на id %s", page[-1].id)
+                    break
 
         # Шлём накопленное, но не чаще раза в ALERT_INTERVAL_MIN.
         if state['pending'] and can_send(state.get('last_sent'), now):
@@ -0,0 +1,61 @@
+"""Микро-бенчмарк схлопывания JSON на вложенных нагрузках глубины 1–50.
+
+Сравнивает однопроходный _mask_json со старым итеративным вариантом
+(\\{[^{}]*\\} до неподвижной точки — один полный проход на уровень).
+
+Запуск: cd app && python3 -m benchmarks.bench_mask_json [--repeat N]
+Вывод — JSON-строка на каждую глубину (удобно сравнивать между коммитами).
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from normalize import _mask_json  # noqa: E402
+
+_JSON_INNER_RE = re.compile(r'\{[^{}]*\}')
+
+
+def mask_json_iterative(text: str) -> str:
+    """Прежняя реализация — эталон для сравнения."""
+    prev = None
+    while prev != text:
+        prev = text
+        text = _JSON_INNER_RE.sub('\x01', text)
+    text = re.sub(r'(\x01[,;\s]*)+', '\x01', text)
+    return text.replace('\x01', '{}')
+
+
+def nested_payload(depth: int, width: int = 3) -> str:
+    """Ответ маркетплейса: на каждом уровне width полей и вложенный объект."""
+    body = '{"id":1,"name":"x"}'
+    for level in range(depth):
+        fields = ','.join(f'"f{level}_{i}":{i}' for i in range(width))
+        body = f'{{{fields},"items":[{body},{body}],"nested":{body}}}' if level < 3 else \
+            f'{{{fields},"nested":{body}}}'
+    return f'production.ERROR: Ozon API response error for account: {body} tail'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for depth in (1, 2, 5, 10, 20, 30, 40, 50):
+        text = nested_payload(depth)
+        assert _mask_json(text) == mask_json_iterative(text)
+        old = min(timeit.repeat(lambda: mask_json_iterative(text), number=args.repeat, repeat=3))
+        new = min(timeit.repeat(lambda: _mask_json(text), number=args.repeat, repeat=3))
+        print(json.dumps({
+            'bench': 'mask_json', 'depth': depth, 'chars': len(text),
+            'iterative_us': round(old / args.repeat * 1e6, 1),
+            'single_pass_us': round(new / args.repeat * 1e6, 1),
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Детерминированный синтетический корпус логов для бенчмарков.
+
+Сообщения — как в Original data: [{'id', 'date', 'text'}], текст в одну
+строку с timestamp-префиксом Laravel. Семейства ошибок: SQLSTATE с
+SQL-хвостом, Guzzle-ошибки маркетплейсов, JSON-нагрузки (в т.ч. вложенные),
+падения джобов, SYNC-предупреждения, email/UUID, cURL. Частоты семейств и
+шаблонов внутри семейства — с длинным хвостом, как в проде: немного частых
+групп и много редких. Часть сообщений длиннее лимита Telegram (4096) и
+режется на голову + хвосты с подряд идущими id.
+
+Одинаковые (size, seed) дают один и тот же корпус байт в байт.
+
+Запуск: cd app && python3 -m benchmarks.corpus --size 10k > corpus.jsonl
+"""
+
+import argparse
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+TELEGRAM_LIMIT = 4096
+ANCHOR = datetime(2026, 7, 27, 12, 0, 0)   # «сейчас» корпуса
+WINDOW_DAYS = 30                           # окно Original data
+LONG_SHARE = 0.03                          # доля сообщений, разрезанных Telegram
+
+MARKETPLACES = ['Ozon', 'Wildberries', 'Yandex Market', 'Lamoda']
+HOSTS = ['api-seller.ozon.ru', 'suppliers-api.wildberries.ru', 'api.partner.market.yandex.ru']
+JOBS = ['SyncOrdersJob', 'SyncStocksJob', 'SyncPricesJob', 'CalculateAccountDayJob',
+        'ImportReportJob', 'SendWebhookJob', 'RefreshTokenJob']
+EXCEPTIONS = ['ServerProviderException', 'RateLimitException', 'TokenExpiredException',
+              'InvalidResponseException']
+SQL_ERRORS = [
+    ('23000', 'Integrity constraint violation: 1062 Duplicate entry \'{n}-{m}\' for key \'orders_unique\''),
+    ('42S22', 'Column not found: 1054 Unknown column \'{col}\' in \'field list\''),
+    ('HY000', 'General error: 1205 Lock wait timeout exceeded; try restarting transaction'),
+    ('40001', 'Serialization failure: 1213 Deadlock found when trying to get lock'),
+    ('HY000', '[1040] Too many connections'),
+]
+COLUMNS = ['delivery_to_customer', 'commission_amount', 'warehouse_id', 'barcode']
+HTTP_STATUSES = ['400 Bad Request', '401 Unauthorized', '403 Forbidden', '404 Not Found',
+                 '429 Too Many Requests', '500 Internal Server Error', '502 Bad Gateway']
+CURL = [(28, 'Operation timed out after 30001 milliseconds with 0 bytes received'),
+        (6, 'Could not resolve host: {host}'),
+        (7, 'Failed to connect to {host} port 443: Connection refused')]
+REASONS = ['timeout', 'blocked', 'token expired', 'quota exceeded', 'maintenance']
+WORDS = ['order', 'stock', 'price', 'report', 'posting', 'supply', 'return', 'invoice']
+
+
+def _json_payload(rnd: random.Random, depth: int) -> str:
+    fields = [f'"{rnd.choice(WORDS)}_id":{rnd.randrange(10 ** 6)}',
+              f'"status":"{rnd.choice(REASONS)}"']
+    if depth > 0:
+        items = ','.join(_json_payload(rnd, depth - 1) for _ in range(rnd.randint(1, 3)))
+        fields.append(f'"items":[{items}]')
+    return '{' + ','.join(fields) + '}'
+
+
+def _sql(rnd: random.Random) -> str:
+    table = rnd.choice(['orders', 'stocks', 'failed_jobs', 'account_days'])
+    return (f'insert into `{table}` (`account_id`, `external_id`, `payload`) values '
+            f'({rnd.randrange(10 ** 4)}, {rnd.randrange(10 ** 9)}, \'{_json_payload(rnd, 0)}\')')
+
+
+def _sqlstate(rnd: random.Random, variant: int) -> str:
+    code, desc = SQL_ERRORS[variant % len(SQL_ERRORS)]
+    desc = desc.format(n=rnd.randrange(10 ** 5), m=rnd.randrange(10 ** 6),
+                       col=COLUMNS[variant % len(COLUMNS)])
+    return (f'production.ERROR: SQLSTATE[{code}]: {desc} (Connection: mysql, Host: 10.0.0.'
+            f'{rnd.randrange(256)}, Port: 3306, Database: appsellerdata, SQL: {_sql(rnd)})')
+
+
+def _guzzle(rnd: random.Random, variant: int) -> str:
+    host = HOSTS[variant % len(HOSTS)]
+    status = HTTP_STATUSES[variant % len(HTTP_STATUSES)]
+    return (f'production.ERROR: Client error: `GET https://{host}/v3/posting/fbs/list?page='
+            f'{rnd.randrange(100)}&since={ANCHOR:%Y-%m-%d}` resulted in a `{status}` response: '
+            f'{_json_payload(rnd, 0)}')
+
+
+def _api_json(rnd: random.Random, variant: int) -> str:
+    mp = MARKETPLACES[variant % len(MARKETPLACES)]
+    return (f'production.ERROR: {mp} API response error for account: '
+            f'{_json_payload(rnd, variant % 4)}')
+
+
+def _job(rnd: random.Random, variant: int) -> str:
+    job = JOBS[variant % len(JOBS)]
+    exc = EXCEPTIONS[variant % len(EXCEPTIONS)]
+    return (f'production.ERROR: Job App\\Jobs\\{job} failed for account {rnd.randrange(10 ** 4)}: '
+            f'{{"account_id":{rnd.randrange(10 ** 4)},"error":"App\\Exceptions\\{exc} | '
+            f'{rnd.choice(REASONS)}"}}')
+
+
+def _sync(rnd: random.Random, variant: int) -> str:
+    mp = MARKETPLACES[variant % len(MARKETPLACES)]
+    word = WORDS[variant % len(WORDS)]
+    return (f'production.WARNING: SYNC: {word.capitalize()} {rnd.randrange(10 ** 8)} not found in '
+            f'{mp} for account {rnd.randrange(10 ** 4)}, retry at '
+            f'{ANCHOR + timedelta(minutes=rnd.randrange(600)):%Y-%m-%d %H:%M:%S}')
+
+
+def _partner(rnd: random.Random, variant: int) -> str:
+    user = ''.join(rnd.choice('abcdefghijklmnop') for _ in range(rnd.randint(4, 10)))
+    uuid = '-'.join(''.join(rnd.choice('0123456789abcdef') for _ in range(n)) for n in (8, 4, 4, 4, 12))
+    return (f'production.ERROR: Partner not found for {user}@{rnd.choice(["mail.ru", "gmail.com"])} '
+            f'id {uuid} (variant {WORDS[variant % len(WORDS)]})')
+
+
+def _curl(rnd: random.Random, variant: int) -> str:
+    code, desc = CURL[variant % len(CURL)]
+    return f'production.ERROR: cURL error {code}: {desc.format(host=rnd.choice(HOSTS))}'
+
+
+# (генератор, число вариантов внутри семейства, вес семейства)
+FAMILIES = [
+    (_sqlstate, 12, 14), (_guzzle, 21, 18), (_api_json, 16, 16), (_job, 28, 20),
+    (_sync, 32, 20), (_partner, 8, 6), (_curl, 3, 6),
+]
+
+
+def _stack_trace(rnd: random.Random, frames: int) -> str:
+    return ' '.join(
+        f'#{i} /var/www/app.sellerdata.ru/app/Jobs/{rnd.choice(JOBS)}.php({rnd.randrange(20, 900)}): '
+        f'App\\Services\\{rnd.choice(WORDS).capitalize()}Service->handle(Object(App\\Models\\Account))'
+        for i in range(frames))
+
+
+def _message(rnd: random.Random) -> str:
+    gens, variants, weights = zip(*FAMILIES)
+    family = rnd.choices(range(len(FAMILIES)), weights=weights)[0]
+    # Длинный хвост внутри семейства: вариант 0 — самый частый
+    variant = min(int(rnd.paretovariate(1.2)) - 1, variants[family] - 1)
+    return gens[family](rnd, variant)
+
+
+def generate_logs(count: int, seed: int = 42, long_share: float = LONG_SHARE) -> list[dict]:
+    """count сообщений Telegram (хвосты разрезанных логов — отдельные
+    сообщения с подряд идущими id), от старых к новым."""
+    rnd = random.Random(seed)
+    window = WINDOW_DAYS * 86400
+    offsets = sorted((rnd.randrange(window) for _ in range(count)), reverse=True)
+    logs: list[dict] = []
+    next_id = 1
+    while len(logs) < count:
+        date = ANCHOR - timedelta(seconds=offsets[len(logs)])
+        body = _message(rnd)
+        if rnd.random() < long_share:
+            body += ' Stack trace: ' + _stack_trace(rnd, rnd.randint(40, 120))
+        text = f'[{date:%Y-%m-%dT%H:%M:%S}.{rnd.randrange(10 ** 6):06d}+03:00] {body}'
+        for start in range(0, len(text), TELEGRAM_LIMIT):
+            if len(logs) == count:
+                break
+            logs.append({'id': next_id, 'date': date, 'text': text[start:start + TELEGRAM_LIMIT]})
+            next_id += 1
+    return logs
+
+
+def parse_size(value: str) -> int:
+    return SIZES.get(value.lower()) or int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', default='10k', help='10k / 100k / 1m или число')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    for log in generate_logs(parse_size(args.size), seed=args.seed):
+        sys.stdout.write(json.dumps({'id': log['id'], 'date': log['date'].strftime('%Y-%m-%d %H:%M:%S'),
+                                     'text': log['text']}, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
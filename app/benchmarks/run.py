@@ -0,0 +1,187 @@
+"""Бенчмарки нормализации и сборки Groups на синтетическом корпусе.
+
+Замеры (по одному на строку вывода, JSON):
+  normalize[regex|tokenizer] — normalize_error_pattern / tokenize_error_pattern
+                               по склеенным логам;
+  aggregate[python|numpy]    — счётчики окон и последнее появление по готовым
+                               шаблонам (numpy — если NumPy установлен);
+  is_fragment                — классификация каждого сообщения;
+  merge_fragment_chains      — склейка цепочек разрезанных сообщений;
+  iter_merged_logs           — та же склейка потоком (память — одна цепочка);
+  count_and_aggregate        — счётчики 1д/7д/30д (без кэша, один процесс);
+  extract_category           — категория по шаблону (с правилами Categories);
+  build_group_rows           — строки вкладки Groups (половина групп — уже
+                               существующие с вердиктами, часть — в архив).
+
+Поля строки: bench, size (сообщений в корпусе), items (обработано объектов),
+seconds, items_per_s, peak_mb (пик памяти tracemalloc на отдельном прогоне —
+под трассировкой код медленнее, поэтому время меряется без неё). Первая
+строка — bench=meta: версия Python, RULES_VERSION, seed.
+
+count_and_aggregate, extract_category и build_group_rows живут в
+telegram_to_sheets.py и требуют его зависимостей (gspread, telethon — есть
+в контейнере); без них замер выводится со skipped и причиной. Модуль
+импортируется без его logging.basicConfig: бенчмарк не пишет в лог сборщика
+и работает вне контейнера (без /app/logs).
+
+Запуск: cd app && python3 -m benchmarks.run --size 10k --size 100k [--out bench.jsonl]
+Сравнение с прошлым прогоном — по bench+size, поле items_per_s.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import aggregate as agg  # noqa: E402
+from benchmarks.corpus import ANCHOR, generate_logs, parse_size  # noqa: E402
+from normalize import (  # noqa: E402
+    RULES_VERSION, is_fragment, iter_merged_logs, merge_fragment_chains,
+    normalize_error_pattern, tokenize_error_pattern,
+)
+
+CATEGORY_RULES = {
+    'МАРКЕТПЛЕЙС': ['ozon api', 'wildberries api'],
+    'БД': ['deadlock', 'lock wait timeout'],
+    'СЕТЬ': ['curl error'],
+}
+
+
+def _measure(fn, memory: bool) -> tuple[float, float | None]:
+    """Время одного вызова fn и (отдельным прогоном) пик памяти в МБ."""
+    gc.collect()
+    started = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - started
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return seconds, peak_mb
+
+
+def _record(name: str, size: int, items: int, fn, memory: bool) -> dict:
+    seconds, peak_mb = _measure(fn, memory)
+    return {
+        'bench': name, 'size': size, 'items': items, 'seconds': round(seconds, 4),
+        'items_per_s': round(items / seconds, 1) if seconds else None,
+        'peak_mb': round(peak_mb, 2) if peak_mb is not None else None,
+    }
+
+
+def _existing_groups(error_data: dict) -> dict:
+    """Половина групп — уже в Groups с ручными колонками; каждая десятая
+    из них давно не появлялась и уедет в Archive."""
+    groups = {}
+    for i, pattern in enumerate(sorted(error_data)):
+        if i % 2:
+            continue
+        stale = i % 20 == 0
+        groups[pattern] = {
+            'category': '', 'last_seen': '2026-01-01 00:00:00' if stale else f'{ANCHOR:%Y-%m-%d %H:%M:%S}',
+            'status': '', 'verdict': 'действовать' if i % 3 == 0 else 'игнор',
+            'urgency': 'средняя', 'cause': 'причина', 'action': 'действие',
+            'assessed': f'{ANCHOR:%Y-%m-%d}', 'acting_since': '',
+        }
+    # Группы, которых нет в окне: нулевые счётчики / архив
+    for i in range(len(error_data) // 4):
+        groups[f'production.ERROR: forgotten group {i}'] = {
+            'category': 'СТАРОЕ', 'last_seen': '2026-01-01 00:00:00' if i % 2 else '',
+            'status': 'обработано', 'verdict': 'игнор', 'urgency': '', 'cause': '',
+            'action': '', 'assessed': '', 'acting_since': '',
+        }
+    return groups
+
+
+def run(size: int, seed: int, memory: bool) -> list[dict]:
+    logs = generate_logs(size, seed=seed)
+    texts = [log['text'] for log in logs]
+    merged = merge_fragment_chains(logs)
+    merged_texts = [m['text'] for m in merged]
+    results = [
+        _record('is_fragment', size, len(texts),
+                lambda: [is_fragment(t) for t in texts], memory),
+        _record('merge_fragment_chains', size, len(logs),
+                lambda: merge_fragment_chains(logs), memory),
+        _record('iter_merged_logs', size, len(logs),
+                lambda: sum(1 for _ in iter_merged_logs(logs)), memory),
+        _record('normalize[regex]', size, len(merged_texts),
+                lambda: [normalize_error_pattern(t) for t in merged_texts], memory),
+        _record('normalize[tokenizer]', size, len(merged_texts),
+                lambda: [tokenize_error_pattern(t) for t in merged_texts], memory),
+    ]
+    dates = [m['date'] for m in merged]
+    patterns = [normalize_error_pattern(t) for t in merged_texts]
+    now = ANCHOR.replace(tzinfo=timezone.utc)
+    results.append(_record('aggregate[python]', size, len(patterns),
+                           lambda: agg.aggregate_python(dates, patterns, now), memory))
+    if agg.np is not None:
+        results.append(_record('aggregate[numpy]', size, len(patterns),
+                               lambda: agg.aggregate_numpy(dates, patterns, now), memory))
+    else:
+        results.append({'bench': 'aggregate[numpy]', 'size': size, 'skipped': 'NumPy не установлен'})
+
+    try:
+        # При импорте сборщик настраивает логирование в свой файл
+        with mock.patch('logging.basicConfig'):
+            import telegram_to_sheets as tts
+    except ImportError as e:  # нет gspread/telethon
+        reason = f'{type(e).__name__}: {e}'
+        for name in ('count_and_aggregate', 'extract_category', 'build_group_rows'):
+            results.append({'bench': name, 'size': size, 'skipped': reason})
+        return results
+
+    results.append(_record('count_and_aggregate', size, len(logs),
+                           lambda: tts.count_and_aggregate(logs, workers=1), memory))
+    error_data = tts.count_and_aggregate(logs, workers=1)
+    patterns = list(error_data)
+    results.append(_record('extract_category', size, len(patterns),
+                           lambda: [tts.extract_category(p, CATEGORY_RULES) for p in patterns], memory))
+    existing = _existing_groups(error_data)
+    results.append(_record('build_group_rows', size, len(existing) + len(error_data),
+                           lambda: tts.build_group_rows(error_data, existing, CATEGORY_RULES), memory))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', action='append', help='10k / 100k / 1m или число (можно несколько)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-memory', action='store_true', help='без прогона под tracemalloc')
+    parser.add_argument('--out', help='дописать строки в файл (JSON Lines)')
+    args = parser.parse_args()
+
+    lines = [{
+        'bench': 'meta', 'python': platform.python_version(), 'rules_version': RULES_VERSION,
+        'seed': args.seed, 'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }]
+    for size in map(parse_size, args.size or ['10k']):
+        lines += run(size, args.seed, memory=not args.no_memory)
+    out = open(args.out, 'a', encoding='utf-8') if args.out else sys.stdout
+    try:
+        for line in lines:
+            out.write(json.dumps(line, ensure_ascii=False) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    skipped = Counter(line['bench'] for line in lines if 'skipped' in line)
+    if skipped:
+        print(f'Пропущено замеров: {sum(skipped.values())} (см. поле skipped)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Режим демона сборщика: одно долгоживущее подключение к Telegram вместо
+запуска telegram_to_sheets.py по cron раз в 30 минут (старт интерпретатора,
+копия сессии, подключение через прокси с повторами — ради нескольких
+сообщений). Логи попадают в Groups примерно через минуту.
+
+Включается ключом collector_daemon в config.json. Cron запускает скрипт
+каждые 5 минут как сторожа: без ключа или при живом демоне он сразу
+выходит. Демон держит lock сборщика (telegram_to_sheets.lock) — пока он
+работает, прогоны telegram_to_sheets.py по cron пропускаются.
+
+  1. Подключается к Telegram (connect_telegram: те же попытки и паузы) и
+     подписывается на events.NewMessage канала логов.
+  2. Новое сообщение будит цикл; демон ждёт batch_sec, копя пачку, и делает
+     проход run_pipeline: хвост с курсора страницами → хранилище и архив →
+     Original data и Groups.
+  3. Раз в poll_sec проход делается и без событий. События только будят:
+     сообщения читаются из истории с курсора, поэтому пропущенное
+     push-обновление или обрыв не теряют и не дублируют сообщений.
+  4. Обрыв, который Telethon не восстановил сам (client.disconnected), —
+     переподключение с нарастающей паузой RECONNECT_DELAYS_SEC и сразу
+     догрузка с курсора.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+from datetime import date
+
+from telethon import events
+
+from telegram_proxy import get_telegram_proxy
+from telegram_to_sheets import (
+    BASE_DIR, CONFIG_PATH, LOG_PATH, RUN_BUDGET_SEC, acquire_lock,
+    clean_old_logs, connect_telegram, prepare_session_paths, release_lock, run_pipeline,
+)
+from raw_store import RawStore
+from sheets_retry import METRICS, metrics_summary, set_deadline
+
+BATCH_SEC = 60                            # сколько копить пачку после первого события
+POLL_SEC = 300                            # проход без событий (страховка от пропущенных обновлений)
+RECONNECT_DELAYS_SEC = [30, 90, 180, 600]
+
+
+def daemon_settings(config: dict) -> dict | None:
+    """Настройки демона из ключа collector_daemon: true — по умолчанию, либо
+    {"batch_sec": 60, "poll_sec": 300}. None — режим выключен."""
+    value = config.get('collector_daemon')
+    if not value:
+        return None
+    settings = {'batch_sec': BATCH_SEC, 'poll_sec': POLL_SEC}
+    if isinstance(value, dict):
+        settings.update(value)
+    return settings
+
+
+async def serve(client, config: dict, raw_store: RawStore, settings: dict):
+    """Проходы сбора по событиям и таймеру, пока клиент подключён."""
+    wake = asyncio.Event()
+
+    async def on_new_message(event):
+        wake.set()
+
+    client.add_event_handler(on_new_message, events.NewMessage(chats=int(config['chat_id'])))
+    # После (пере)подключения — сразу догрузка того, что пришло без нас
+    wake.set()
+    disconnected = client.disconnected
+    cleaned = None
+    while not disconnected.done():
+        waiter = asyncio.ensure_future(wake.wait())
+        await asyncio.wait({waiter, disconnected}, timeout=settings['poll_sec'],
+                           return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if disconnected.done():
+            break
+        if wake.is_set():
+            # Сообщения, пришедшие за batch_sec, уйдут одним проходом
+            await asyncio.sleep(settings['batch_sec'])
+        wake.clear()
+        if cleaned != date.today():
+            clean_old_logs(LOG_PATH, days=7)
+            if METRICS:
+                logging.info("Повторы запросов к Sheets за сутки: %s", metrics_summary())
+                METRICS.clear()
+            cleaned = date.today()
+        set_deadline(config.get('run_budget_sec', RUN_BUDGET_SEC))
+        try:
+            if await run_pipeline(client, config, raw_store):
+                # Хвост мог остаться (бюджет прохода) или прийти за время прохода
+                wake.set()
+        except Exception as e:
+            logging.error(f"Ошибка прохода демона: {e}", exc_info=True)
+    if not disconnected.cancelled() and disconnected.exception() is not None:
+        logging.warning(f"Соединение с Telegram потеряно: {disconnected.exception()}")
+    else:
+        logging.warning("Соединение с Telegram потеряно.")
+
+
+async def run(config: dict, settings: dict):
+    # docker stop — штатное завершение: сессия копируется обратно
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    session_host_path, tmp_session_name, tmp_session_file = prepare_session_paths(config.get('session_name', 'session'))
+    if not os.path.exists(session_host_path):
+        logging.error("Файл Telegram-сессии %s не найден — демон не запущен.", session_host_path)
+        return
+    os.makedirs(os.path.dirname(tmp_session_file), exist_ok=True)
+    shutil.copy2(session_host_path, tmp_session_file)
+    telegram_proxy = get_telegram_proxy(config)
+    if telegram_proxy:
+        logging.info("Telegram proxy enabled: %s:%s", telegram_proxy[1], telegram_proxy[2])
+    logging.info("Демон сборщика запущен: пачка %s с, опрос %s с", settings['batch_sec'], settings['poll_sec'])
+
+    raw_store = RawStore()
+    failures = 0
+    try:
+        while True:
+            client = None
+            try:
+                client = await connect_telegram(config, tmp_session_name, telegram_proxy)
+                if not await client.is_user_authorized():
+                    logging.error("Telegram-сессия не авторизована — демон остановлен.")
+                    return
+                failures = 0
+                logging.info("Демон подключён к Telegram.")
+                await serve(client, config, raw_store, settings)
+            except Exception as e:
+                logging.error(f"Ошибка демона: {e}", exc_info=True)
+            finally:
+                if client is not None:
+                    try:
+                        await client.disconnect()
+                    except Exception:
+                        pass
+                try:
+                    shutil.copy2(tmp_session_file, session_host_path)
+                except Exception as copy_err:
+                    logging.error(f"Не удалось сохранить Telegram-сессию: {copy_err}")
+            delay = RECONNECT_DELAYS_SEC[min(failures, len(RECONNECT_DELAYS_SEC) - 1)] + random.uniform(0, 15)
+            failures += 1
+            logging.info("Переподключение к Telegram через %.1f с.", delay)
+            await asyncio.sleep(delay)
+    finally:
+        raw_store.close()
+        logging.info("Демон сборщика остановлен. Повторы запросов к Sheets: %s", metrics_summary())
+
+
+if __name__ == '__main__':
+    os.chdir(BASE_DIR)
+    with open(CONFIG_PATH, 'r') as f:
+        config = json.load(f)
+    settings = daemon_settings(config)
+    if settings is None:
+        # Режим выключен — сбор идёт по cron
+        raise SystemExit(0)
+    lock_file = acquire_lock()
+    if lock_file is None:
+        # Демон уже работает или идёт прогон сборщика по cron
+        raise SystemExit(0)
+    try:
+        asyncio.run(run(config, settings))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        release_lock(lock_file)
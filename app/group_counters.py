@@ -0,0 +1,176 @@
+"""
+Счётчики групп 1д/7д/30д в часовых корзинах между запусками.
+
+Коллектор каждые 30 минут заново склеивал, нормализовал и пересчитывал весь
+30-дневный Original data, хотя новых сообщений — единицы. Хранилище
+(/app/group_counters.sqlite) копит появления групп по часам:
+
+  • buckets(group_key, hour, count) — hour: часы от эпохи (UTC),
+    group_key — sha1 шаблона;
+  • messages(msg_id, part, group_key, hour) — уже учтённые логи (part —
+    номер лога внутри сообщения после разрезания склейки). Повторная запись
+    того же сообщения (цепочка, дополненная хвостами в следующем запуске,
+    перезапуск после падения) заменяет прежний вклад, а не удваивает его;
+  • groups(group_key, pattern, last_seen);
+  • meta: version (normalize_cache.rules_version) и last_id — последний
+    учтённый id сообщения.
+
+Запуск добавляет только логи новее last_id, счётчики считаются по корзинам:
+O(групп × корзин) вместо O(сообщений окна). Точность края окна — час:
+крайняя корзина учитывается целиком. В корзинах — шаблоны до майнера:
+кластерные шаблоны обобщаются со временем, и сводятся они при чтении.
+При смене версии правил хранилище очищается и заполняется заново по всему
+окну; файл можно удалить в любой момент.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+from collections import Counter
+from datetime import datetime, timezone
+
+BASE_DIR = '/app'
+COUNTERS_PATH = os.path.join(BASE_DIR, 'group_counters.sqlite')
+
+WINDOWS = {'1d': 1, '7d': 7, '30d': 30}
+KEEP_HOURS = 31 * 24   # окно Original data (30 дней) + запас
+_CHUNK = 500           # параметров в одном IN (...) — ниже лимита SQLite
+
+
+def _hour(date: datetime) -> int:
+    """Номер часа от эпохи; naive-дата — UTC (как в count_and_aggregate)."""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp() // 3600)
+
+
+def _group_key(pattern: str) -> str:
+    return hashlib.sha1(pattern.encode('utf-8')).hexdigest()
+
+
+class GroupCounters:
+    """Часовые корзины групп в SQLite. Один экземпляр — одно подключение."""
+
+    def __init__(self, path: str = COUNTERS_PATH, version: str = ''):
+        self.version = version
+        # timeout: коллектор может пересечься с ручным запуском
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS groups ('
+                          'group_key TEXT PRIMARY KEY, pattern TEXT NOT NULL, last_seen REAL NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                          'group_key TEXT NOT NULL, hour INTEGER NOT NULL, count INTEGER NOT NULL, '
+                          'PRIMARY KEY (group_key, hour))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS messages ('
+                          'msg_id INTEGER NOT NULL, part INTEGER NOT NULL, group_key TEXT NOT NULL, '
+                          'hour INTEGER NOT NULL, PRIMARY KEY (msg_id, part))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS buckets_hour ON buckets (hour)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS messages_hour ON messages (hour)')
+        old_version = self._meta('version')
+        if old_version != version:
+            if old_version is not None:
+                logging.info('Правила нормализации изменились (%s → %s) — счётчики групп '
+                             'пересчитываются по всему окну.', old_version, version)
+            for table in ('groups', 'buckets', 'messages'):
+                self.conn.execute(f'DELETE FROM {table}')
+            self.conn.execute("DELETE FROM meta WHERE key = 'last_id'")
+            self._set_meta('version', version)
+        self.conn.commit()
+
+    def _meta(self, key: str) -> str | None:
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def last_id(self) -> int | None:
+        """Последний учтённый id сообщения; None — хранилище пустое,
+        нужен полный проход по окну."""
+        value = self._meta('last_id')
+        return int(value) if value is not None else None
+
+    def add(self, entries: list[tuple[int, int, str, datetime]]):
+        """entries — (id сообщения, номер лога в сообщении, шаблон, дата).
+        Прежний вклад этих сообщений снимается; лог с пустым шаблоном
+        не считается, но и прежний вклад его сообщения не остаётся."""
+        if not entries:
+            return
+        ids = sorted({msg_id for msg_id, _, _, _ in entries})
+        delta: Counter = Counter()
+        for i in range(0, len(ids), _CHUNK):
+            chunk = ids[i:i + _CHUNK]
+            marks = ','.join('?' * len(chunk))
+            for key, hour in self.conn.execute(
+                    f'SELECT group_key, hour FROM messages WHERE msg_id IN ({marks})', chunk):
+                delta[key, hour] -= 1
+            self.conn.execute(f'DELETE FROM messages WHERE msg_id IN ({marks})', chunk)
+
+        groups: dict[str, tuple[str, float]] = {}
+        messages = []
+        for msg_id, part, pattern, date in entries:
+            if not pattern:
+                continue
+            key, hour = _group_key(pattern), _hour(date)
+            # Последнее появление — как в aggregate: naive-дата в локальном времени
+            seen = date.timestamp()
+            if key not in groups or groups[key][1] < seen:
+                groups[key] = (pattern, seen)
+            messages.append((msg_id, part, key, hour))
+            delta[key, hour] += 1
+
+        self.conn.executemany(
+            'INSERT INTO groups (group_key, pattern, last_seen) VALUES (?, ?, ?) '
+            'ON CONFLICT (group_key) DO UPDATE SET last_seen = max(last_seen, excluded.last_seen)',
+            [(key, pattern, seen) for key, (pattern, seen) in groups.items()])
+        self.conn.executemany('INSERT OR REPLACE INTO messages (msg_id, part, group_key, hour) '
+                              'VALUES (?, ?, ?, ?)', messages)
+        self.conn.executemany(
+            'INSERT INTO buckets (group_key, hour, count) VALUES (?, ?, ?) '
+            'ON CONFLICT (group_key, hour) DO UPDATE SET count = count + excluded.count',
+            [(key, hour, n) for (key, hour), n in delta.items() if n])
+        self.conn.execute('DELETE FROM buckets WHERE count <= 0')
+        self._set_meta('last_id', str(max(ids[-1], self.last_id or 0)))
+        self.conn.commit()
+
+    def expire(self, now: datetime):
+        """Удаляет корзины и учтённые логи старше KEEP_HOURS и группы без корзин."""
+        cutoff = _hour(now) - KEEP_HOURS
+        self.conn.execute('DELETE FROM buckets WHERE hour < ?', (cutoff,))
+        self.conn.execute('DELETE FROM messages WHERE hour < ?', (cutoff,))
+        self.conn.execute('DELETE FROM groups WHERE group_key NOT IN (SELECT group_key FROM buckets)')
+        self.conn.commit()
+
+    def counts(self, now: datetime) -> dict[str, dict]:
+        """Шаблон → {'counts': {'1d', '7d', '30d'}, 'last_seen': datetime UTC}
+        для групп с появлениями за 30 дней."""
+        now_hour = _hour(now)
+        since = [now_hour - days * 24 for days in WINDOWS.values()]
+        sums = ', '.join('SUM(CASE WHEN b.hour >= ? THEN b.count ELSE 0 END)' for _ in since)
+        rows = self.conn.execute(
+            f'SELECT g.pattern, g.last_seen, {sums} FROM buckets b JOIN groups g USING (group_key) '
+            f'WHERE b.hour >= ? GROUP BY b.group_key', (*since, min(since)))
+        result = {}
+        for pattern, last_seen, *values in rows:
+            result[pattern] = {
+                'counts': dict(zip(WINDOWS, values)),
+                'last_seen': datetime.fromtimestamp(last_seen, timezone.utc),
+            }
+        return result
+
+    def close(self):
+        self.conn.close()
+
+
+def open_counters(version: str) -> GroupCounters | None:
+    """Хранилище для коллектора; при недоступном файле — None
+    (счётчики считаются по всему окну, как без хранилища)."""
+    try:
+        return GroupCounters(version=version)
+    except sqlite3.Error as e:
+        logging.warning('Хранилище счётчиков групп недоступно (%s) — считаем по всему окну.', e)
+        return None
@@ -11,7 +11,22 @@ email, UUID, хеши, JSON-нагрузку; сохраняем НИЗКОКА
 из Original data).
 """
 
+import functools
+import hashlib
+import multiprocessing
+import os
 import re
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+# Ручная ревизия правил: увеличить при изменении логики нормализации вне
+# _PROTECT_RE/_MASKS (шаги каскада, чистки). Правки самих шаблонов
+# учитываются в RULES_VERSION автоматически.
+_RULES_REVISION = 2
 
 # Плейсхолдер-защита: что нельзя маскировать, временно прячем.
 _PROTECT_RE = [
@@ -34,7 +49,9 @@ _MASKS = [
     (re.compile(r'\b\d{4}-\d{2}-\d{2}\b'), '<date>'),
     (re.compile(r'\b\d{2}:\d{2}(?::\d{2})?\b'), '<time>'),
     # Email, в т.ч. частично скрытые звёздочками (Nadir*****@gmail.com)
-    (re.compile(r'[\w.+*-]+@[\w*-]+\.[\w.*-]+'), '<email>'),
+    # Начало — только в начале «слова»: иначе поиск перебирает каждую позицию
+    # длинного прогона без @ и становится квадратичным.
+    (re.compile(r'(?<![\w.+*-])[\w.+*-]++@[\w*-]++\.[\w.*-]+'), '<email>'),
     (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<uuid>'),
     (re.compile(r'\b[a-f0-9]{16,64}\b'), '<hash>'),
     # Случайные токены: длинные смешанные буквенно-цифровые строки
@@ -49,22 +66,107 @@ _MASKS = [
     (re.compile(r'\b\d+\b'), '<num>'),
 ]
 
-_JSON_INNER_RE = re.compile(r'\{[^{}]*\}')
+
+def _rules_fingerprint() -> str:
+    h = hashlib.sha1(str(_RULES_REVISION).encode())
+    for rx in _PROTECT_RE:
+        h.update(f'{rx.pattern}\x00{rx.flags}\x00'.encode())
+    for rx, repl in _MASKS:
+        h.update(f'{rx.pattern}\x00{rx.flags}\x00{repl}\x00'.encode())
+    return h.hexdigest()[:12]
+
+
+# Версия правил нормализации: ключ инвалидации сохранённых результатов
+# (normalize_cache.py). Одинаковые правила — одинаковые шаблоны.
+RULES_VERSION = _rules_fingerprint()
+
 _WS_RE = re.compile(r'\s+')
 
 # Имена классов (App\Exceptions\Foo) — различительный признак, даже внутри JSON
 _CLASS_RE = re.compile(r'\b[A-Z][A-Za-z0-9_]*(?:\\[A-Z][A-Za-z0-9_]*)+\b')
 
 
+_BRACE_RE = re.compile(r'[{}]')
+_JSON_STRING = r'"[^"\\]*+(?:\\.[^"\\]*+)*+"'
+_JSON_FLAT = rf'\{{(?:[^"{{}}]++|{_JSON_STRING})*+\}}'
+# Внутри объекта: пропускаем обычный текст и строковые литералы целиком
+# (possessive — без отката) и останавливаемся на следующем событии:
+# объект вложенности ≤ 2 целиком (группа 1) — типичный ответ API закрывается
+# одним матчем; иначе скобка, незакрытая кавычка или конец текста (группа 2).
+_JSON_EVENT_RE = re.compile(
+    rf'(?:[^"{{}}]++|{_JSON_STRING})*+'
+    rf'(?:(\{{(?:[^"{{}}]++|{_JSON_STRING}|{_JSON_FLAT})*+\}})|([{{}}"]|\Z))', re.DOTALL)
+# После незакрытой кавычки строки закрыться уже не могут — только скобки
+_JSON_BRACE_EVENT_RE = re.compile(r'[^{}]*+()([{}]|\Z)')
+_JSON_SEP_RE = re.compile(r'[,;\s]*')
+
+
+def _json_spans(text: str) -> list[tuple[int, int, int]]:
+    """Схлопываемые JSON-объекты: [(start, end_brace, end)], где end_brace —
+    позиция за закрывающей скобкой, end — за поглощёнными разделителями [,;\\s].
+
+    Один проход со стеком скобок: каждая } закрывает ближайшую открытую {,
+    вложенные объекты поглощаются внешним. Непарные скобки (обрезанные
+    Telegram фрагменты) остаются текстом. Внутри объекта строковые литералы
+    пропускаются целиком — скобки в "..." структуру не ломают; вне объекта
+    кавычки ничего не значат, и сканер прыгает сразу к следующей {.
+    Незакрытая кавычка переводит остаток в режим «только скобки»: после неё
+    ни одна строка закрыться уже не может, так что проход остаётся линейным.
+    Соседние объекты, разделённые только [,;\\s], сливаются в один."""
+    stack: list[int] = []
+    spans: list[tuple[int, int]] = []
+    event_re = _JSON_EVENT_RE
+    pos = text.find('{')
+    while pos != -1:
+        if not stack:
+            stack.append(pos)
+            pos += 1
+        restart = -1
+        for m in event_re.finditer(text, pos):
+            if m.lastindex == 1:
+                spans.append(m.span(1))
+                continue
+            ch = m.group(2)
+            if ch == '"':
+                event_re = _JSON_BRACE_EVENT_RE
+                restart = m.end()
+                break
+            if not ch:
+                break
+            if ch == '{':
+                stack.append(m.end() - 1)
+                continue
+            open_pos = stack.pop()
+            while spans and spans[-1][0] > open_pos:
+                spans.pop()
+            spans.append((open_pos, m.end()))
+            if not stack:
+                restart = text.find('{', m.end())
+                break
+        pos = restart
+
+    merged: list[tuple[int, int, int]] = []
+    for start, end_brace in spans:
+        end = _JSON_SEP_RE.match(text, end_brace).end()
+        if merged and merged[-1][2] == start:
+            merged[-1] = (merged[-1][0], end_brace, end)
+        else:
+            merged.append((start, end_brace, end))
+    return merged
+
+
 def _mask_json(text: str) -> str:
-    """Схлопывает JSON-объекты, включая вложенные, до {}."""
-    prev = None
-    # Изнутри наружу: {"a":{"b":1}} → {"a":<json>} → <json>; затем <json> → {}
-    while prev != text:
-        prev = text
-        text = _JSON_INNER_RE.sub('\x01', text)
-    text = re.sub(r'(\x01[,;\s]*)+', '\x01', text)
-    return text.replace('\x01', '{}')
+    """Схлопывает JSON-объекты, включая вложенные, до {} за один проход."""
+    if '{' not in text:
+        return text
+    pieces: list[str] = []
+    pos = 0
+    for start, _end_brace, end in _json_spans(text):
+        pieces.append(text[pos:start])
+        pieces.append('{}')
+        pos = end
+    pieces.append(text[pos:])
+    return ''.join(pieces)
 
 
 def normalize_error_pattern(text: str) -> str:
@@ -138,6 +240,332 @@ def normalize_error_pattern(text: str) -> str:
     return _WS_RE.sub(' ', text).strip()
 
 
+# ===== Однопроходный движок (tokenizer) =====
+# Тот же результат, что у normalize_error_pattern, но без каскада полных
+# копий строки. Защищённые токены и маски собраны в ОДНУ упорядоченную
+# альтернативу (порядок альтернатив = порядок шагов каскада), JSON-объекты
+# и SQL-хвост (Connection: ...) вырезаются по границам, найденным заранее
+# одним проходом по скобкам. Склеенные цепочки в десятки КБ сжимаются
+# на этом проходе, поэтому финальные чистки идут уже по короткой строке.
+#
+# Семантика каскада на экзотических перекрытиях (одна маска начинается
+# раньше и заходит на токен другой) не повторяется буква в букву;
+# совпадение с regex-движком проверяется тестами на корпусе.
+
+_CONNECTION_MARK = '(Connection:'
+_CONNECTION_REPL = _MASKS[0][1]
+_CSV_RUN_RE = re.compile(r'(?:<num>[;,\s|]+){2,}<num>')
+_CSV_TAIL_RE = re.compile(r'(?:<num>;…[;,\s|]*)+')
+_TS_PREFIX_RE = re.compile(r'^[\d<>a-z:.,+\-; T]{1,60}\]\s*')
+_MASKED_TS_PREFIX_RE = re.compile(r'^\[?\s*<datetime>[^\]]{0,20}\]\s*')
+
+
+# С какого символа может начинаться совпадение каждой альтернативы
+# (_PROTECT_RE, затем _MASKS[1:] — в том же порядке). Альтернатива
+# проверяется только в позициях своего класса: иначе движок примерял бы
+# все 15 шаблонов к каждому символу. Внутри класса порядок сохраняется,
+# поэтому приоритет — как у каскада.
+_D, _W, _B, _P = r'\d', r'[^\W\d]', '`', r'[.+*\-]'
+_TOKEN_FIRST_CHARS = [
+    (_W,), (_W,), (_W,), (_B,),                  # SQLSTATE, коды, классы, Guzzle
+    (_D,), (_D,), (_D,),                         # datetime, date, time
+    (_D, _W, _P),                                # email
+    (_D, _W), (_D, _W), (_D, _W),                # uuid, hash, token
+    (_P,), (_W,), (_D,), (_D,),                  # .php:N, слово+число, float, число
+]
+_EMAIL_ALT = len(_PROTECT_RE) + 3
+
+
+def _build_tokenizer(with_email: bool = True):
+    """Одна альтернатива из _PROTECT_RE + _MASKS[1:] и таблица действий:
+    номер группы альтернативы → (None, None) для защищённого токена
+    (выводится как есть) либо (номер группы префикса | None, замена).
+    Без with_email маска email не включается (в тексте нет '@')."""
+    alternatives = [(rx, None) for rx in _PROTECT_RE] + list(_MASKS[1:])
+    assert len(alternatives) == len(_TOKEN_FIRST_CHARS)
+    branches: list[str] = []
+    actions: dict[int, tuple[int | None, str | None]] = {}
+    group = 0
+    for first in (_D, _W, _B, _P):
+        alts: list[str] = []
+        for i, (rx, repl) in enumerate(alternatives):
+            if first not in _TOKEN_FIRST_CHARS[i] or (i == _EMAIL_ALT and not with_email):
+                continue
+            body = rx.pattern
+            if rx.flags & re.IGNORECASE:
+                body = f'(?i:{body})'
+            group += 1
+            outer = group
+            alts.append(f'({body})')
+            if repl is None:
+                actions[outer] = (None, None)
+            elif repl.startswith('\\1'):
+                # Замены вида \1<num>: сохраняем префикс из первой внутренней группы
+                actions[outer] = (outer + 1, repl[2:])
+            else:
+                actions[outer] = (None, repl)
+            group += rx.groups
+        branches.append(f'(?={first})(?:' + '|'.join(alts) + ')')
+    return re.compile('|'.join(branches)), actions
+
+
+_TOKEN_RE, _TOKEN_ACTIONS = _build_tokenizer()
+_TOKEN_NO_EMAIL_RE, _TOKEN_NO_EMAIL_ACTIONS = _build_tokenizer(with_email=False)
+
+# Защищённые токены одним проходом — для сбора различителей из вырезанных
+# JSON/SQL-фрагментов; номер группы = номер шаблона в _PROTECT_RE + 1
+_PROTECT_ANY_RE = re.compile('|'.join(
+    f'((?i:{rx.pattern}))' if rx.flags & re.IGNORECASE else f'({rx.pattern})'
+    for rx in _PROTECT_RE))
+_CLASS_PROTECT_KIND = 2  # _PROTECT_RE[2] — имена классов
+
+
+def _make_emitter(actions):
+    def emit(match: re.Match) -> str:
+        prefix_group, repl = actions[match.lastindex]
+        if repl is None:
+            return match.group(0)
+        if prefix_group is not None:
+            return match.group(prefix_group) + repl
+        return repl
+    return emit
+
+
+_EMIT = _make_emitter(_TOKEN_ACTIONS)
+_EMIT_NO_EMAIL = _make_emitter(_TOKEN_NO_EMAIL_ACTIONS)
+
+
+def _connection_cut(text: str, spans: list[tuple[int, int, int]]) -> int:
+    """Позиция SQL-хвоста «(Connection:» вне JSON-объектов; -1 — хвоста нет."""
+    pos = text.find(_CONNECTION_MARK)
+    i = 0
+    while pos != -1:
+        while i < len(spans) and spans[i][1] <= pos:
+            i += 1
+        if i == len(spans) or pos < spans[i][0]:
+            return pos
+        pos = text.find(_CONNECTION_MARK, spans[i][1])
+    return -1
+
+
+def tokenize_error_pattern(text: str) -> str:
+    """Однопроходный аналог normalize_error_pattern (движок 'tokenizer')."""
+    if not text:
+        return ''
+
+    text = text.strip()
+    m = _TS_PREFIX_RE.match(text)
+    if m:
+        text = text[m.end():]
+
+    spans = _json_spans(text) if '{' in text else []
+    cut = _connection_cut(text, spans) if _CONNECTION_MARK in text else -1
+    if cut != -1:
+        spans = [s for s in spans if s[0] < cut]
+
+    if '@' in text:
+        token_re, emit = _TOKEN_RE, _EMIT
+    else:
+        token_re, emit = _TOKEN_NO_EMAIL_RE, _EMIT_NO_EMAIL
+
+    pieces: list[str] = []
+    dropped: list[str] = []
+    pos = 0
+    for start, end_brace, end in spans:
+        pieces.append(token_re.sub(emit, text[pos:start]))
+        pieces.append('{}')
+        dropped.append(text[start:end_brace])
+        pos = end
+    if cut != -1:
+        pieces.append(token_re.sub(emit, text[pos:cut]))
+        pieces.append(_CONNECTION_REPL)
+        dropped.append(text[cut:])
+    else:
+        pieces.append(token_re.sub(emit, text[pos:]))
+    out = ''.join(pieces)
+
+    if '<num>' in out:
+        out = _CSV_RUN_RE.sub('<num>;…', out)
+        out = _CSV_TAIL_RE.sub('<num>;…', out)
+
+    # Различители, стёртые вместе с JSON/SQL-хвостом: сначала классы
+    # (в порядке появления), затем защищённые токены в порядке _PROTECT_RE
+    if dropped:
+        found = [(m.lastindex - 1, m.group(0))
+                 for part in dropped for m in _PROTECT_ANY_RE.finditer(part)]
+        lost = [p for kind, p in found if kind == _CLASS_PROTECT_KIND and p not in out]
+        for _kind, p in sorted(found, key=lambda item: item[0]):
+            if p not in out and p not in lost:
+                lost.append(p)
+        if lost:
+            out += ' [' + ', '.join(dict.fromkeys(lost)) + ']'
+
+    m = _MASKED_TS_PREFIX_RE.match(out)
+    if m:
+        out = out[m.end():]
+    return _WS_RE.sub(' ', out).strip()
+
+
+NORMALIZE_ENGINES = {
+    'regex': normalize_error_pattern,
+    'tokenizer': tokenize_error_pattern,
+}
+
+
+def get_normalizer(engine: str | None = None, guard=None):
+    """Функция нормализации по имени движка (ключ normalize_engine в config.json).
+    Пустое значение — штатный regex-каскад. guard (ключ normalize_guard):
+    true или {"budget_ms": ..., "max_chars": ...} — обернуть в GuardedNormalizer."""
+    if not engine:
+        normalize = normalize_error_pattern
+    else:
+        try:
+            normalize = NORMALIZE_ENGINES[engine]
+        except KeyError:
+            raise ValueError(f'Неизвестный движок нормализации: {engine}') from None
+    if not guard:
+        return normalize
+    return GuardedNormalizer(normalize, **(guard if isinstance(guard, dict) else {}))
+
+
+# ===== Защищённый режим =====
+# Одно сообщение на десятки КБ с «почти совпадающим» текстом не должно
+# тормозить весь прогон коллектора. Шаблоны масок написаны без
+# квадратичного перебора (проверяется tests/test_normalize_fuzz.py), а
+# защищённый режим страхует от того, что фаззер не нашёл: обрезает вход до
+# max_chars и ограничивает CPU-время на сообщение таймером ITIMER_PROF
+# (движок re проверяет сигналы на откатах, так что прерывается и застрявшая
+# регулярка). При превышении шаблон строится по короткому префиксу — там
+# любые маски дешёвые.
+
+GUARD_BUDGET_MS = 250       # CPU-время на одно сообщение
+GUARD_MAX_CHARS = 20_000    # длиннее — обрезаем (склеенные цепочки)
+FALLBACK_PREFIX = 200       # символов для шаблона при превышении бюджета
+FALLBACK_MARK = ' …'
+_DIGITS_RE = re.compile(r'\d+')
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def _on_budget(signum, frame):
+    raise BudgetExceeded()
+
+
+class GuardedNormalizer:
+    """Нормализация с бюджетом времени и лимитом длины входа.
+
+    stats — счётчики прогона: overruns (превышен бюджет, шаблон по префиксу)
+    и truncated (вход обрезан). Экземпляр передаётся в пул процессов
+    normalize_many; прирост счётчиков в рабочих процессах возвращается
+    вместе с результатами."""
+
+    def __init__(self, normalize=normalize_error_pattern, budget_ms: float = GUARD_BUDGET_MS,
+                 max_chars: int = GUARD_MAX_CHARS):
+        self.normalize = normalize
+        self.budget_ms = budget_ms
+        self.max_chars = max_chars
+        self.stats: Counter = Counter()
+
+    def __getstate__(self):
+        # В рабочий процесс — с нулевыми счётчиками, иначе прирост задвоится
+        state = self.__dict__.copy()
+        state['stats'] = Counter()
+        return state
+
+    @property
+    def label(self) -> str:
+        """Параметры, влияющие на шаблоны (для версии кэша)."""
+        return f'guard:{self.budget_ms:g}ms:{self.max_chars}'
+
+    def __call__(self, text: str) -> str:
+        if not text:
+            return self.normalize(text)
+        if len(text) > self.max_chars:
+            self.stats['truncated'] += 1
+            text = text[:self.max_chars]
+        try:
+            return self._run(text)
+        except BudgetExceeded:
+            self.stats['overruns'] += 1
+            return self.fallback(text)
+
+    @staticmethod
+    def is_fallback(pattern: str) -> bool:
+        """Шаблон получен по префиксу. Превышение бюджета зависит от загрузки
+        машины, поэтому такой шаблон не кэшируется: следующий запуск
+        нормализует текст заново."""
+        return pattern.endswith(FALLBACK_MARK)
+
+    def fallback(self, text: str) -> str:
+        """Шаблон по префиксу: на FALLBACK_PREFIX символах даже квадратичные
+        маски укладываются в микросекунды. Если и префикс не уложился
+        в бюджет — только маскировка чисел."""
+        head = text[:FALLBACK_PREFIX]
+        try:
+            return self._run(head) + FALLBACK_MARK
+        except BudgetExceeded:
+            return _WS_RE.sub(' ', _DIGITS_RE.sub('<num>', head)).strip() + FALLBACK_MARK
+
+    def _run(self, text: str) -> str:
+        budget = self.budget_ms / 1000
+        if threading.current_thread() is not threading.main_thread() \
+                or not hasattr(signal, 'setitimer'):
+            # Сигналы доступны только главному потоку: прервать нельзя,
+            # но результат тот же, что с таймером, — шаблон по префиксу
+            started = time.process_time()
+            result = self.normalize(text)
+            if time.process_time() - started > budget:
+                raise BudgetExceeded()
+            return result
+        previous = signal.signal(signal.SIGPROF, _on_budget)
+        signal.setitimer(signal.ITIMER_PROF, budget)
+        try:
+            return self.normalize(text)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+
+
+# ===== Пакетная нормализация =====
+# Нормализация — чистый CPU-bound Python: один процесс занимает одно ядро.
+# Большие пакеты (первый прогон, сброс кэша, бэкфилл) раздаём пулу процессов
+# кусками; маленькие быстрее посчитать на месте, чем поднимать пул.
+# Процессы пула — через forkserver, не fork: коллектор в это время держит
+# потоки asyncio.to_thread с запросами к Sheets, а fork процесса с живыми
+# потоками может унаследовать захваченные ими блокировки (дедлок).
+
+PARALLEL_MIN_BATCH = 5000   # меньше — последовательно
+CHUNK_SIZE = 2000           # текстов на задачу пула
+POOL_START_METHOD = 'forkserver'
+
+
+def _normalize_chunk(normalize, chunk: list[str]) -> tuple[list[str], Counter | None]:
+    return [normalize(text) for text in chunk], getattr(normalize, 'stats', None)
+
+
+def normalize_many(texts: list[str], workers: int | None = None,
+                   normalize=normalize_error_pattern) -> list[str]:
+    """Шаблоны для texts в том же порядке. workers — число процессов
+    (None — по числу ядер); normalize — функция уровня модуля или
+    GuardedNormalizer (передаются в дочерние процессы через pickle)."""
+    texts = list(texts)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(texts) < PARALLEL_MIN_BATCH:
+        return [normalize(text) for text in texts]
+    chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+    patterns: list[str] = []
+    context = multiprocessing.get_context(POOL_START_METHOD)
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+        for chunk, stats in pool.map(functools.partial(_normalize_chunk, normalize), chunks):
+            patterns.extend(chunk)
+            if stats:
+                normalize.stats.update(stats)
+    return patterns
+
+
 # Заголовки, с которых начинается ЦЕЛОЕ сообщение лога.
 # Всё прочее — обрезок длинного сообщения, разрезанного Telegram
 # (лимит 4096 символов): хвост без начала, анализу не подлежит.
@@ -146,12 +574,84 @@ _HEAD_RE = re.compile(r'^\s*\[?\s*(production\.\w+|Problem:|Resolved)', re.IGNOR
 # Начало нового лога внутри склеенного потока: [2026-07-27T09:00:00...] production.
 _LOG_START_RE = re.compile(r'(?=\[\d{4}-\d{2}-\d{2}[T ][^\]]{0,40}\]\s*production\.)')
 
+# Для классификации хватает начала текста: обрывок timestamp-префикса
+# (до 61 символа), полный [datetime ...] (до ~60) и сам заголовок.
+_HEAD_WINDOW = 256
+_LEADING_WS_RE = re.compile(r'\s*')
+# Шаг 4.5 normalize_error_pattern, но по сырому тексту: [<datetime> ...] ещё
+# не замаскирован, поэтому datetime ищем исходной маской
+_RAW_TS_PREFIX_RE = re.compile(r'\[?\s*(?:' + _MASKS[1][0].pattern + r')[^\]]{0,20}\]\s*')
+
+
+def _head_window(text: str) -> str:
+    """Начало текста после тех же срезов префиксов, что делает
+    normalize_error_pattern. Стоимость не зависит от длины текста."""
+    start = _LEADING_WS_RE.match(text).end()
+    head = text[start:start + _HEAD_WINDOW]
+    m = _TS_PREFIX_RE.match(head)
+    if m:
+        head = head[m.end():]
+    m = _RAW_TS_PREFIX_RE.match(head)
+    if m:
+        head = head[m.end():]
+    return head
+
 
 def is_fragment(text: str) -> bool:
-    """True, если текст — обрезок разрезанного сообщения, а не целый лог."""
+    """True, если текст — обрезок разрезанного сообщения, а не целый лог.
+    Смотрит только на начало текста: полная нормализация ради заголовка
+    удваивала бы стоимость каждого сообщения в merge_fragment_chains."""
     if not text:
         return True
-    return _HEAD_RE.search(normalize_error_pattern(text)[:80]) is None
+    return _HEAD_RE.match(_head_window(text)) is None
+
+
+def _split_chain(head: dict, parts: list[str]):
+    """Склеенная цепочка → отдельные логи. Куски режутся без учёта границ
+    логов: внутри цепочки может начаться СЛЕДУЮЩИЙ лог — разрезаем обратно
+    по маркеру начала лога."""
+    text = parts[0] if len(parts) == 1 else ''.join(parts)
+    for piece in _LOG_START_RE.split(text):
+        if piece and piece.strip():
+            entry = dict(head)
+            entry['text'] = piece
+            yield entry
+
+
+def iter_merged_logs(logs: Iterable[dict]) -> Iterator[dict]:
+    """Потоковая склейка цепочек: logs — [{'id', 'date', 'text'}, ...]
+    по возрастанию id (как в Original data). Повтор предыдущего id (строка,
+    дописанная дважды при повторе append_rows) пропускается, убывание id —
+    ValueError. В памяти только открытая цепочка; склеенные логи отдаются,
+    как только цепочка закрылась (пришла новая голова или хвост, который
+    к ней не относится)."""
+    head: dict | None = None
+    parts: list[str] = []
+    prev_id = None
+    for log in logs:
+        if log['id'] == prev_id:
+            continue
+        if prev_id is not None and log['id'] < prev_id:
+            raise ValueError(f'iter_merged_logs: id не по возрастанию ({prev_id} → {log["id"]})')
+        prev_id = log['id']
+        text = log.get('text', '')
+        if is_fragment(text):
+            # Хвост идёт следующим id за головой (или предыдущим хвостом)
+            if head is not None and log['id'] - head['id'] <= len(parts):
+                parts.append(text)
+                continue
+            # Сирота: головы нет — пропускаем
+        else:
+            if head is not None:
+                yield from _split_chain(head, parts)
+            head, parts = log, [text]
+            continue
+        if head is not None:
+            # Хвост не от этой цепочки: дальше к ней ничего не приклеится
+            yield from _split_chain(head, parts)
+            head, parts = None, []
+    if head is not None:
+        yield from _split_chain(head, parts)
 
 
 def merge_fragment_chains(logs: list[dict]) -> list[dict]:
@@ -160,30 +660,63 @@ def merge_fragment_chains(logs: list[dict]) -> list[dict]:
 
     Telegram режет длинные логи на несколько сообщений: голова + хвосты.
     Хвост всегда идёт следующим id за головой (или предыдущим хвостом).
-    На входе — [{'id', 'date', 'text'}, ...]; на выходе — то же,
+    На входе — [{'id', 'date', 'text'}, ...] в любом порядке; на выходе — то же,
     но фрагменты приклеены к своей голове, отдельных строк не образуют.
-    Хвост-сирота (голова вне выборки) отбрасывается.
+    Хвост-сирота (голова вне выборки) отбрасывается; из строк с одинаковым
+    id берётся последняя.
+    Вход, уже упорядоченный по id, можно склеивать потоком: iter_merged_logs.
     """
-    merged: list[dict] = []
-    for log in sorted(logs, key=lambda x: x['id']):
-        if is_fragment(log.get('text', '')):
-            if merged and log['id'] - merged[-1]['id'] <= merged[-1].get('_parts', 1):
-                merged[-1]['text'] += log['text']
-                merged[-1]['_parts'] = merged[-1].get('_parts', 1) + 1
+    unique = {log['id']: log for log in logs}
+    return list(iter_merged_logs(sorted(unique.values(), key=lambda x: x['id'])))
+
+
+# Лимит символов в одной ячейке Google Sheets
+SHEETS_CELL_LIMIT = 50_000
+
+
+def stitch_batch(logs: list[dict], open_chain: dict | None = None,
+                 cell_limit: int = SHEETS_CELL_LIMIT) -> tuple[list[dict], dict | None, dict | None]:
+    """
+    Склейка цепочек при приёме пачки новых сообщений (граница пачки —
+    каждый запуск сборщика, а не край 30-дневного окна).
+
+    logs — [{'id', 'date', 'text'}, ...] по возрастанию id; open_chain —
+    последняя цепочка прошлого запуска {'id', 'date', 'parts', 'text'}:
+    её голова уже записана в Original data, хвосты могут прийти сейчас.
+    Возвращает (rows, extended, open_chain):
+      rows       — новые строки Original data; цепочка — одна строка с
+                   полным текстом (логи внутри неё не разрезаются: у строки
+                   один id, разрезание — дело _split_chain при чтении);
+      extended   — цепочка прошлого запуска, если к ней приклеились хвосты
+                   (текст строки её головы надо заменить), иначе None;
+      open_chain — последняя цепочка пачки для следующего запуска или None.
+    Сообщения не теряются: хвост-сирота и пустые сообщения пишутся
+    отдельными строками, как раньше; хвост, с которым текст не влез бы в
+    ячейку, — тоже (при чтении он сирота, шаблон даёт голова).
+    """
+    rows: list[dict] = []
+    extended = None
+    chain = dict(open_chain) if open_chain else None
+    chain_row = None    # индекс строки цепочки в rows; None — цепочка прошлого запуска
+    for log in logs:
+        text = log.get('text', '')
+        fragment = is_fragment(text)
+        if text and fragment and chain is not None and log['id'] - chain['id'] <= chain['parts']:
+            chain['parts'] += 1
+            if not chain.get('full') and len(chain['text']) + len(text) <= cell_limit:
+                chain['text'] += text
+                if chain_row is None:
+                    extended = chain
+                else:
+                    rows[chain_row]['text'] = chain['text']
                 continue
-            # Сирота: головы нет — пропускаем
+            chain['full'] = True
+            rows.append(dict(log))
             continue
-        merged.append(dict(log))
-
-    # Куски режутся без учёта границ логов: внутри склеенной цепочки может
-    # начаться СЛЕДУЮЩИЙ лог. Разрезаем обратно по маркеру начала лога.
-    result: list[dict] = []
-    for m in merged:
-        m.pop('_parts', None)
-        pieces = _LOG_START_RE.split(m['text'])
-        pieces = [p for p in pieces if p and p.strip()]
-        for piece in pieces:
-            entry = dict(m)
-            entry['text'] = piece
-            result.append(entry)
-    return result
+        rows.append(dict(log))
+        if fragment:
+            chain = None    # сирота или пустое сообщение: к цепочке больше не приклеится
+        else:
+            chain = {'id': log['id'], 'date': log['date'], 'parts': 1, 'text': text}
+            chain_row = len(rows) - 1
+    return rows, extended, chain
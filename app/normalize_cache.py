@@ -0,0 +1,200 @@
+"""
+Постоянный кэш результатов нормализации между запусками.
+
+Коллектор каждые 30 минут и триаж раз в день заново нормализуют весь
+30-дневный Original data, хотя новых сообщений — единицы. Кэш хранит
+шаблон по хешу текста в локальном SQLite (/app/normalize_cache.sqlite),
+так что в установившемся режиме нормализуются только новые сообщения.
+
+  • ключ — sha1(текст), значение — шаблон;
+  • версия правил (normalize.RULES_VERSION) + имя движка и параметры
+    защищённого режима записаны в meta: при несовпадении кэш очищается целиком;
+  • шаблоны по префиксу от GuardedNormalizer (превышен бюджет времени) не
+    сохраняются — на свободной машине текст может уложиться в бюджет;
+  • вытеснение: записи, к которым не обращались дольше MAX_AGE_DAYS,
+    удаляются; сверх MAX_ROWS — самые давно использованные (LRU по дню);
+  • при смене версии шаблоны прежней версии переезжают в history: по ним
+    коллектор строит карту «старый шаблон → новый» и переносит ручные
+    колонки Groups (rules_migration.py). В history держатся только версия,
+    которой собран текущий Groups (meta groups_version), и предыдущая.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+from normalize import RULES_VERSION, normalize_many
+
+BASE_DIR = '/app'
+CACHE_PATH = os.path.join(BASE_DIR, 'normalize_cache.sqlite')
+
+MAX_ROWS = 200_000     # потолок записей (≈ несколько 30-дневных окон)
+MAX_AGE_DAYS = 35      # окно Original data (30 дней) + запас
+_CHUNK = 500           # параметров в одном IN (...) — ниже лимита SQLite
+
+
+def _today() -> int:
+    return int(time.time() // 86400)
+
+
+def rules_version(engine: str | None = None, guard: str = '') -> str:
+    """Версия шаблонов: правила нормализации + движок + параметры
+    защищённого режима. Общая для кэша и хранилища счётчиков групп."""
+    version = f'{RULES_VERSION}:{engine or "regex"}'
+    return f'{version}:{guard}' if guard else version
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class NormalizeCache:
+    """Кэш шаблонов в SQLite. Один экземпляр — одно подключение."""
+
+    def __init__(self, path: str = CACHE_PATH, engine: str = 'regex',
+                 max_rows: int = MAX_ROWS, max_age_days: int = MAX_AGE_DAYS, guard: str = ''):
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.version = rules_version(engine, guard)
+        # timeout: коллектор и триаж могут открыть кэш одновременно
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS patterns ('
+                          'key TEXT PRIMARY KEY, pattern TEXT NOT NULL, used_day INTEGER NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS patterns_used_day ON patterns (used_day)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS history ('
+                          'version TEXT NOT NULL, key TEXT NOT NULL, pattern TEXT NOT NULL, '
+                          'PRIMARY KEY (version, key))')
+        old_version = self._meta('version')
+        if old_version != self.version:
+            if old_version is not None:
+                logging.info('Правила нормализации изменились (%s → %s) — кэш шаблонов сброшен, '
+                             'прежние шаблоны сохранены для миграции Groups.',
+                             old_version, self.version)
+                keep = {old_version, self.groups_version or old_version}
+                marks = ','.join('?' * len(keep))
+                self.conn.execute(f'DELETE FROM history WHERE version NOT IN ({marks})', tuple(keep))
+                self.conn.execute('INSERT OR REPLACE INTO history (version, key, pattern) '
+                                  'SELECT ?, key, pattern FROM patterns', (old_version,))
+                self._set_meta('previous_version', old_version)
+            self.conn.execute('DELETE FROM patterns')
+            self._set_meta('version', self.version)
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def _meta(self, key: str) -> str | None:
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def groups_version(self) -> str | None:
+        """Версия правил, которой собран текущий лист Groups (None — неизвестна)."""
+        return self._meta('groups_version')
+
+    @property
+    def stale_groups_version(self) -> str | None:
+        """Версия, с которой нужно мигрировать Groups, если он собран не
+        текущими правилами и её шаблоны есть в history. Для Groups без
+        отметки (до появления миграции) — предыдущая версия кэша."""
+        version = self.groups_version or self._meta('previous_version')
+        if version is None or version == self.version:
+            return None
+        row = self.conn.execute('SELECT 1 FROM history WHERE version = ? LIMIT 1', (version,)).fetchone()
+        return version if row else None
+
+    def mark_groups_version(self):
+        """Groups перезаписан текущими правилами: история больше не нужна."""
+        self._set_meta('groups_version', self.version)
+        self.conn.execute('DELETE FROM history')
+        self.conn.commit()
+
+    def previous_patterns(self, texts: list[str], version: str) -> list[str | None]:
+        """Шаблоны texts по правилам версии version (из history); None —
+        текст при тех правилах не нормализовался."""
+        keys = [_text_key(t or '') for t in texts]
+        found: dict[str, str] = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), _CHUNK):
+            chunk = unique[i:i + _CHUNK]
+            marks = ','.join('?' * len(chunk))
+            found.update(self.conn.execute(
+                f'SELECT key, pattern FROM history WHERE version = ? AND key IN ({marks})',
+                (version, *chunk)))
+        return [found.get(key) for key in keys]
+
+    def lookup(self, texts: list[str], normalize, workers: int | None = 1) -> list[str]:
+        """Шаблоны для texts в том же порядке. Промахи нормализуются
+        функцией normalize (пакетом через normalize_many) и сохраняются
+        (кроме шаблонов по префиксу — normalize.is_fallback)."""
+        keys = [_text_key(t or '') for t in texts]
+        today = _today()
+        found: dict[str, str] = {}
+        stale: list[str] = []
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), _CHUNK):
+            chunk = unique[i:i + _CHUNK]
+            marks = ','.join('?' * len(chunk))
+            for key, pattern, used_day in self.conn.execute(
+                    f'SELECT key, pattern, used_day FROM patterns WHERE key IN ({marks})', chunk):
+                found[key] = pattern
+                if used_day < today:
+                    stale.append(key)
+
+        missing: dict[str, str] = {}
+        for text, key in zip(texts, keys):
+            if key not in found and key not in missing:
+                missing[key] = text
+        fresh = dict(zip(missing, normalize_many(list(missing.values()), workers=workers,
+                                                 normalize=normalize)))
+        self.misses += len(fresh)
+        self.hits += len(texts) - len(fresh)
+        result = [found[key] if key in found else fresh[key] for key in keys]
+
+        # Дата использования обновляется раз в сутки — без записи на каждый хит
+        if stale:
+            self.conn.executemany('UPDATE patterns SET used_day = ? WHERE key = ?',
+                                  [(today, key) for key in stale])
+        is_fallback = getattr(normalize, 'is_fallback', None)
+        if is_fallback is not None:
+            fresh = {k: p for k, p in fresh.items() if not is_fallback(p)}
+        if fresh:
+            self.conn.executemany('INSERT OR REPLACE INTO patterns (key, pattern, used_day) '
+                                  'VALUES (?, ?, ?)', [(k, p, today) for k, p in fresh.items()])
+        self.conn.commit()
+        return result
+
+    def evict(self):
+        """Удаляет записи старше max_age_days и лишнее сверх max_rows (LRU)."""
+        self.conn.execute('DELETE FROM patterns WHERE used_day < ?',
+                          (_today() - self.max_age_days,))
+        (count,) = self.conn.execute('SELECT COUNT(*) FROM patterns').fetchone()
+        if count > self.max_rows:
+            self.conn.execute(
+                'DELETE FROM patterns WHERE key IN ('
+                'SELECT key FROM patterns ORDER BY used_day LIMIT ?)', (count - self.max_rows,))
+        self.conn.commit()
+
+    def close(self):
+        try:
+            self.evict()
+        finally:
+            self.conn.close()
+
+
+def open_cache(engine: str | None = None, normalize=None) -> NormalizeCache | None:
+    """Кэш для скрипта; при недоступном файле — None (работаем без кэша).
+    normalize — функция нормализации: у GuardedNormalizer её параметры
+    (label) входят в версию кэша."""
+    try:
+        return NormalizeCache(engine=engine or 'regex', guard=getattr(normalize, 'label', ''))
+    except sqlite3.Error as e:
+        logging.warning('Кэш нормализации недоступен (%s) — нормализуем без кэша.', e)
+        return None
@@ -0,0 +1,175 @@
+"""
+Долгий архив сырых сообщений: сжатые JSONL-файлы по дням.
+
+Хранилище сырых логов (raw_store.py) держит 35 дней, вкладка Original
+data — 30; после этого сообщение терялось, и перенормализация, дозаливка
+или вопрос «с какого дня это началось» требовали повторной выгрузки из
+Telegram. Коллектор дописывает каждое принятое сообщение (и дополненные
+хвостами головы цепочек) в архив:
+
+  /app/raw_archive/2025-06-09.jsonl.gz   — строки {"id", "date", "text"}
+  /app/raw_archive/index.json            — {день: {min_id, max_id, count}}
+
+  • файл дня дописывается новым gzip-членом (режим 'ab'): старые байты не
+    переписываются, склеенные члены читаются как один поток (zcat тоже
+    читает файл целиком); член, оборванный падением, читатель пропускает;
+  • повтор id (голова, дополненная хвостом в следующем запуске) — новая
+    запись; читатель отдаёт последнюю версию;
+  • индекс (по дням: диапазон id и число записей) позволяет найти сообщение
+    по id (find) или выбрать дни диапазона дат, не открывая файлы;
+  • iter_records(since, until) читает по одному дню — в памяти не больше
+    одного файла;
+  • хранится retention_days дней (config.json: raw_archive_days), старые
+    файлы удаляет expire().
+"""
+
+import gzip
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+BASE_DIR = '/app'
+ARCHIVE_DIR = os.path.join(BASE_DIR, 'raw_archive')
+INDEX_FILE = 'index.json'
+SUFFIX = '.jsonl.gz'
+GZIP_MAGIC = b'\x1f\x8b\x08'
+RETENTION_DAYS = 365
+
+
+def _day(date: str) -> str:
+    """'2025-06-09 13:59:20' → '2025-06-09'."""
+    return str(date)[:10]
+
+
+class RawArchive:
+    """Архив в каталоге path. Индекс читается при открытии и пишется после put/expire."""
+
+    def __init__(self, path: str = ARCHIVE_DIR, retention_days: int = RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        os.makedirs(path, exist_ok=True)
+        self.index = self._load_index()
+
+    def _file(self, day: str) -> str:
+        return os.path.join(self.path, day + SUFFIX)
+
+    def _load_index(self) -> dict:
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self.rebuild_index()
+
+    def _save_index(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        tmp_path = f'{index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, sort_keys=True)
+        os.replace(tmp_path, index_path)
+
+    def rebuild_index(self) -> dict:
+        """Индекс заново по файлам (потерян или повреждён)."""
+        index = {}
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(SUFFIX):
+                ids = [record['id'] for record in self._read_day(name[:-len(SUFFIX)])]
+                if ids:
+                    index[name[:-len(SUFFIX)]] = {'min_id': min(ids), 'max_id': max(ids), 'count': len(ids)}
+        self.index = index
+        return index
+
+    def put(self, rows: list[list]) -> int:
+        """Строки [id, date, text] (как в хранилище): по gzip-члену на каждый
+        затронутый день. Возвращает число записей."""
+        by_day: dict[str, list[dict]] = {}
+        for row in rows:
+            record = {'id': int(row[0]), 'date': str(row[1]), 'text': row[2] if len(row) > 2 else ''}
+            by_day.setdefault(_day(record['date']), []).append(record)
+        for day, records in by_day.items():
+            payload = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+            with open(self._file(day), 'ab') as f:
+                f.write(gzip.compress(payload.encode('utf-8')))
+            ids = [record['id'] for record in records]
+            entry = self.index.get(day)
+            if entry is None:
+                entry = self.index[day] = {'min_id': min(ids), 'max_id': max(ids), 'count': 0}
+            entry['min_id'] = min(entry['min_id'], *ids)
+            entry['max_id'] = max(entry['max_id'], *ids)
+            entry['count'] += len(ids)
+        if by_day:
+            self._save_index()
+        return sum(len(records) for records in by_day.values())
+
+    def _read_day(self, day: str):
+        """Записи файла дня в порядке записи (с повторами id). Член, оборванный
+        падением при записи, пропускается: чтение продолжается со следующего."""
+        try:
+            with open(self._file(day), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        pos = 0
+        while pos < len(data):
+            member = zlib.decompressobj(wbits=31)
+            try:
+                text = member.decompress(data[pos:])
+                if not member.eof:
+                    raise zlib.error('incomplete member')
+            except zlib.error:
+                pos = data.find(GZIP_MAGIC, pos + 1)
+                if pos == -1:
+                    return
+                continue
+            pos = len(data) - len(member.unused_data)
+            for line in text.decode('utf-8').splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def days(self, since: datetime | None = None, until: datetime | None = None) -> list[str]:
+        """Дни архива в [since, until) по индексу, по возрастанию."""
+        first = since.strftime('%Y-%m-%d') if since else ''
+        last = until.strftime('%Y-%m-%d') if until else '9999-12-31'
+        return sorted(day for day in self.index if first <= day <= last)
+
+    def iter_records(self, since: datetime | None = None, until: datetime | None = None):
+        """Записи {'id', 'date', 'text'} с since <= date < until — по дням,
+        внутри дня по id; у повторённого id — последняя версия."""
+        low = since.strftime('%Y-%m-%d %H:%M:%S') if since else ''
+        high = until.strftime('%Y-%m-%d %H:%M:%S') if until else None
+        for day in self.days(since, until):
+            latest = {}
+            for record in self._read_day(day):
+                latest[record['id']] = record
+            for msg_id in sorted(latest):
+                record = latest[msg_id]
+                if record['date'] >= low and (high is None or record['date'] < high):
+                    yield record
+
+    def find(self, msg_id: int) -> dict | None:
+        """Последняя версия сообщения msg_id; файлы — только дни, чей диапазон id его накрывает."""
+        found = None
+        for day in sorted(self.index):
+            entry = self.index[day]
+            if entry['min_id'] <= msg_id <= entry['max_id']:
+                for record in self._read_day(day):
+                    if record['id'] == msg_id:
+                        found = record
+        return found
+
+    def expire(self, now: datetime | None = None) -> int:
+        """Удаляет дни старше retention_days; возвращает их число."""
+        cutoff = ((now or datetime.now()) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        expired = [day for day in self.index if day < cutoff]
+        for day in expired:
+            try:
+                os.remove(self._file(day))
+            except FileNotFoundError:
+                pass
+            del self.index[day]
+        if expired:
+            self._save_index()
+        return len(expired)
@@ -0,0 +1,168 @@
+"""
+Локальное хранилище сырых логов — основной источник Original data.
+
+Раньше единственным хранилищем сырых логов была вкладка Original data:
+коллектор скачивал её целиком дважды за запуск, триаж и unknown_transaction —
+ещё по разу. Теперь коллектор сначала пишет новые сообщения в SQLite
+(/app/raw_logs.sqlite, WAL), а скрипты читают окно отсюда
+(read_original_rows). Вкладка остаётся проекцией для людей: коллектор
+только дописывает в неё, правит дополненные головы цепочек и подрезает
+протухший префикс (plan_sheet_sync) — без полной перезаливки.
+
+  • messages(id, date, text) — id сообщения Telegram (у склеенной цепочки —
+    id головы), date — 'YYYY-MM-DD HH:MM:SS' как во вкладке;
+  • запись идемпотентна: повтор того же id заменяет строку — так
+    дописываются хвосты цепочки, пришедшие в следующем запуске, и так же
+    безопасен перезапуск после падения;
+  • хранится MAX_AGE_DAYS (окно 30 дней + запас), старое удаляет expire().
+
+Пустое хранилище (первый запуск) коллектор заполняет одной выгрузкой
+вкладки; читатели до этого момента читают вкладку, как раньше.
+"""
+
+import logging
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+BASE_DIR = '/app'
+RAW_STORE_PATH = os.path.join(BASE_DIR, 'raw_logs.sqlite')
+RAW_SHEET_TITLE = 'Original data'
+
+WINDOW_DAYS = 30       # окно анализа (как у вкладки)
+MAX_AGE_DAYS = 35      # окно + запас на поздние запуски триажа
+
+
+def _date_str(date: datetime) -> str:
+    return date.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class RawStore:
+    """Сырые логи в SQLite. Один экземпляр — одно подключение."""
+
+    def __init__(self, path: str = RAW_STORE_PATH):
+        # timeout: коллектор пишет, пока триаж читает
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS messages ('
+                          'id INTEGER PRIMARY KEY, date TEXT NOT NULL, text TEXT NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS messages_date ON messages (date)')
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        (count,) = self.conn.execute('SELECT COUNT(*) FROM messages').fetchone()
+        return count
+
+    def put(self, rows: list[list]):
+        """Строки [id, date, text] (как во вкладке): новые добавляются,
+        существующие id перезаписываются."""
+        self.conn.executemany('INSERT OR REPLACE INTO messages (id, date, text) VALUES (?, ?, ?)',
+                              [(int(r[0]), str(r[1]), r[2] if len(r) > 2 else '') for r in rows])
+        self.conn.commit()
+
+    def seed(self, sheet_rows: list[list[str]]) -> int:
+        """Первичное заполнение из выгрузки вкладки (с заголовком или без).
+        Строки без числового id пропускаются. Возвращает число строк."""
+        rows = [r for r in sheet_rows if len(r) >= 2 and str(r[0]).strip().isdigit()]
+        self.put(rows)
+        return len(rows)
+
+    def rows(self, since: datetime | None = None) -> list[list[str]]:
+        """Строки [id, date, text] по возрастанию id — тот же вид, что
+        get_all_values() вкладки без заголовка. since — только не старше."""
+        if since is None:
+            cursor = self.conn.execute('SELECT id, date, text FROM messages ORDER BY id')
+        else:
+            cursor = self.conn.execute('SELECT id, date, text FROM messages WHERE date > ? ORDER BY id',
+                                       (_date_str(since),))
+        return [[str(msg_id), date, text] for msg_id, date, text in cursor]
+
+    def expire(self, max_age_days: int = MAX_AGE_DAYS) -> int:
+        """Удаляет строки старше max_age_days; возвращает их число."""
+        cutoff = _date_str(datetime.now() - timedelta(days=max_age_days))
+        deleted = self.conn.execute('DELETE FROM messages WHERE date < ?', (cutoff,)).rowcount
+        self.conn.commit()
+        return deleted
+
+    def close(self):
+        self.conn.close()
+
+
+def read_original_rows(spreadsheet=None, days: int = WINDOW_DAYS,
+                       path: str = RAW_STORE_PATH) -> list[list[str]]:
+    """Строки Original data за days дней без заголовка: из локального
+    хранилища, а пока оно пустое или недоступно — из вкладки spreadsheet
+    (get_all_values, как раньше)."""
+    if os.path.exists(path):
+        try:
+            store = RawStore(path)
+            try:
+                if len(store):
+                    return store.rows(since=datetime.now() - timedelta(days=days))
+            finally:
+                store.close()
+        except sqlite3.Error as e:
+            logging.warning('Хранилище сырых логов недоступно (%s) — читаем вкладку.', e)
+    if spreadsheet is None:
+        return []
+    return spreadsheet.worksheet(RAW_SHEET_TITLE).get_all_values()[1:]
+
+
+def _parse_date(value: str) -> datetime | None:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+
+
+def plan_sheet_sync(sheet_rows: list[list[str]], store_rows: list[list[str]],
+                    pending: dict, cutoff: datetime) -> dict:
+    """
+    Что поменять во вкладке, чтобы она повторяла окно хранилища, не
+    перезаливая её целиком.
+
+    sheet_rows — столбцы A:B вкладки (ID, Дата; с заголовком, если он есть);
+    store_rows — окно хранилища (rows(since=cutoff)); pending — дополненные
+    хвостами головы {id: {'date', 'text'}}. Возвращает:
+      header  — True: первой строки-заголовка нет, вставить RAW_HEADER;
+      patches — [(номер строки, текст)]: новый текст головы в столбец C
+                (номера — после вставки заголовка, до удаления);
+      append  — строки [id, date, text] для дозаписи: всё из хранилища новее
+                последнего id вкладки (так же догоняются строки, не дошедшие
+                до вкладки в упавшем запуске);
+      expired — сколько строк сразу под заголовком старше cutoff: строки
+                дописываются по порядку дат, поэтому протухшие — всегда
+                префикс. Строка с нечитаемой датой префикс обрывает (не удаляем);
+      rewrite — True: во вкладке нет головы из окна с id меньше последнего
+                (запуск упал между хранилищем и вкладкой). Дозапись в конец
+                сломала бы порядок по id, на котором держится подрезка
+                префикса, — вкладку нужно переписать целиком: заголовок и
+                append (всё окно хранилища); header/patches/expired тогда пусты.
+    """
+    header = not sheet_rows or not any(cell.strip() for cell in sheet_rows[0])
+    body = sheet_rows if header else sheet_rows[1:]
+    expired = 0
+    for row in body:
+        date = _parse_date(row[1]) if len(row) > 1 else None
+        if date is None or date > cutoff:
+            break
+        expired += 1
+    index = {row[0].strip(): i for i, row in enumerate(body) if row}
+    last_id = max((int(row[0]) for row in body if row and row[0].strip().isdigit()), default=0)
+
+    patches = []
+    for head_id, chain in pending.items():
+        i = index.get(str(head_id))
+        if i is None:
+            date = _parse_date(chain['date'])
+            if int(head_id) <= last_id and (date is None or date > cutoff):
+                return {'header': False, 'patches': [], 'expired': 0, 'rewrite': True,
+                        'append': [[int(r[0]), r[1], r[2]] for r in store_rows]}
+        elif i >= expired:
+            patches.append((i + 2, chain['text']))
+    append = [[int(r[0]), r[1], r[2]] for r in store_rows if int(r[0]) > last_id]
+    return {'header': header, 'patches': patches, 'append': append, 'expired': expired, 'rewrite': False}
@@ -0,0 +1,93 @@
+"""
+Миграция ключей Groups при смене правил нормализации.
+
+Любая правка _MASKS/_PROTECT_RE меняет строки шаблонов: старые строки
+Groups перестают совпадать с новыми ключами, и ручные вердикты осиротевают
+(нулевые счётчики → Archive), а те же ошибки заводятся заново без оценки.
+
+Карта миграции строится по сырым текстам 30-дневного окна: для каждого
+текста известен шаблон по прежним правилам (history в normalize_cache) и по
+новым. Группа перекладывается, только если её тексты теперь дают другой
+шаблон:
+  • переименование (1 → 1) — ручные колонки переезжают как есть;
+  • разделение (1 → N) — каждая новая группа получает копию колонок;
+  • слияние (N → 1) — колонки берутся у источника с самым строгим вердиктом
+    (действовать > понаблюдать > игнорировать > пусто), при равенстве —
+    у источника с большим числом текстов; «Впервые в действовать» — самая
+    ранняя дата среди источников с вердиктом «действовать»;
+  • группа без текстов в окне перекладывается по normalize(старый шаблон):
+    шаблон — тоже текст, и новые правила чаще всего дают из него новый ключ.
+Если новый ключ уже занят неизменённой группой, она имеет приоритет,
+а источник остаётся под старым ключом.
+"""
+
+from collections import Counter, defaultdict
+
+VERDICT_RANK = {'действовать': 3, 'понаблюдать': 2, 'игнорировать': 1}
+
+
+def migration_map(old_keys: list[str | None], new_keys: list[str]) -> dict[str, Counter]:
+    """Старый ключ → Counter(новый ключ → число текстов). Пары поэлементно;
+    тексты без старого шаблона (None) и пустые шаблоны пропускаются."""
+    mapping: dict[str, Counter] = defaultdict(Counter)
+    for old, new in zip(old_keys, new_keys):
+        if old and new:
+            mapping[old][new] += 1
+    return dict(mapping)
+
+
+def _verdict_rank(saved: dict) -> int:
+    return VERDICT_RANK.get(saved.get('verdict', '').strip().lower(), 0)
+
+
+def merge_saved(sources: list[tuple[dict, int]]) -> dict:
+    """Ручные колонки для группы, собранной из нескольких: [(saved, вес)]."""
+    best, _ = max(sources, key=lambda s: (_verdict_rank(s[0]), s[1]))
+    merged = dict(best)
+    merged['last_seen'] = max(saved.get('last_seen', '') for saved, _ in sources)
+    if _verdict_rank(best) == VERDICT_RANK['действовать']:
+        since = [saved.get('acting_since', '') for saved, _ in sources
+                 if _verdict_rank(saved) == VERDICT_RANK['действовать'] and saved.get('acting_since')]
+        merged['acting_since'] = min(since) if since else merged.get('acting_since', '')
+    return merged
+
+
+def migrate_groups(existing_groups: dict, mapping: dict[str, Counter],
+                   renormalize=None) -> tuple[dict, Counter]:
+    """Перекладывает existing_groups (шаблон → ручные колонки) на новые
+    ключи. Возвращает (новый existing_groups, отчёт: renamed/split/merged/kept)."""
+    targets: dict[str, Counter] = {}
+    for pattern in existing_groups:
+        if pattern in mapping:
+            targets[pattern] = mapping[pattern]
+        elif renormalize is not None:
+            new = renormalize(pattern)
+            targets[pattern] = Counter({new: 1}) if new else Counter({pattern: 1})
+        else:
+            targets[pattern] = Counter({pattern: 1})
+
+    report: Counter = Counter()
+    result = {p: saved for p, saved in existing_groups.items() if set(targets[p]) == {p}}
+    incoming: dict[str, list[tuple[dict, int]]] = defaultdict(list)
+    for pattern, saved in existing_groups.items():
+        if pattern in result:
+            continue
+        if len(targets[pattern]) > 1:
+            report['split'] += 1
+        for new, weight in targets[pattern].items():
+            incoming[new].append((saved, weight))
+
+    placed: set[int] = set()
+    for new, sources in incoming.items():
+        if new in result:
+            continue  # занято неизменённой группой
+        result[new] = merge_saved(sources) if len(sources) > 1 else dict(sources[0][0])
+        report['merged' if len(sources) > 1 else 'renamed'] += 1
+        placed.update(id(saved) for saved, _ in sources)
+    # Источник, ни одна из новых групп которого не досталась ему, остаётся
+    # под старым ключом — вердикт не теряется
+    for pattern, saved in existing_groups.items():
+        if pattern not in result and id(saved) not in placed:
+            result[pattern] = saved
+            report['kept'] += 1
+    return result, report
@@ -7,14 +7,13 @@ import random
 from datetime import datetime
 
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from telethon import TelegramClient
 
+from sheets_client import open_spreadsheet
 from telegram_proxy import get_telegram_proxy
 
 BASE_DIR = "/app"
 CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
-CREDENTIALS_FILE = os.path.join(BASE_DIR, "google-credentials.json")
 LOG_PATH = os.path.join(BASE_DIR, "logs/daily_summary.log")
 STATE_PATH = os.path.join(BASE_DIR, "daily_summary_state.json")
 LOCK_PATH = os.path.join(BASE_DIR, "daily_summary.lock")
@@ -60,13 +59,7 @@ def build_message(config):
     Если свежего дайджеста нет — НЕ отправляем ничего (сознательно без
     фолбэка): пустая сводка хуже отсутствующей, а отсутствие заметно.
     Возвращает None, если отправлять нечего."""
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    client_gs = gspread.authorize(creds)
-    spreadsheet = client_gs.open_by_key(config["google_sheet_id"])
+    spreadsheet = open_spreadsheet(config["google_sheet_id"])
     try:
         digest = spreadsheet.worksheet("Digest")
     except gspread.exceptions.WorksheetNotFound:
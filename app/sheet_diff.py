@@ -0,0 +1,178 @@
+"""
+Дифф-запись таблиц-вкладок: вместо clear + append всей вкладки —
+только изменившиеся ячейки и, если поменялся порядок строк, минимум
+перестановок.
+
+Groups пересобирается каждые 30 минут, а меняются в нём обычно несколько
+счётчиков. Полная перезапись гоняла всю вкладку и открывала окно между
+clear и append, в котором терялись вердикты, записанные триажем
+параллельно. План строится по снимку, который коллектор уже прочитал:
+
+  1. строки, которых нет в новой таблице (архив, миграция, дубли, пустые),
+     удаляются deleteDimension — снизу вверх, подряд идущие одним запросом;
+  2. оставшиеся строки, чей порядок не изменился (наибольшая возрастающая
+     подпоследовательность по новому порядку), не трогаются; остальные
+     переносятся moveDimension, новые — вставляются insertDimension;
+  3. ячейки, отличающиеся от снимка, пишутся одним values.batchUpdate —
+     по диапазону на каждую подряд идущую серию изменённых колонок строки.
+Ячейка, совпадающая со снимком, не пишется: правка триажа, сделанная
+после чтения снимка, в ней сохраняется.
+
+Строки сопоставляются по ключевой колонке (для Groups — шаблон ошибки).
+
+Номера строк в плане — номера снимка. Снимок читается в начале запуска,
+а пишется план через минуты (подключение к Telegram, догрузка, подсчёт):
+строку, вставленную, удалённую или пересортированную за это время вручную
+или триажем, план удалил бы или перезаписал не ту. Поэтому перед
+планированием ключевая колонка перечитывается (один values.get), и если
+она разошлась со снимком (same_key_column), план не строится — нужна
+полная перезапись.
+"""
+
+from bisect import bisect_left
+
+
+def col_letter(index: int) -> str:
+    """0 → A, 25 → Z, 26 → AA."""
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+
+def _stable_positions(targets: list[int]) -> set[int]:
+    """Индексы наибольшей возрастающей подпоследовательности targets."""
+    tails: list[int] = []        # минимальный хвост для каждой длины
+    tail_idx: list[int] = []
+    prev = [-1] * len(targets)
+    for i, t in enumerate(targets):
+        pos = bisect_left(tails, t)
+        if pos == len(tails):
+            tails.append(t)
+            tail_idx.append(i)
+        else:
+            tails[pos] = t
+            tail_idx[pos] = i
+        prev[i] = tail_idx[pos - 1] if pos else -1
+    stable = set()
+    i = tail_idx[-1] if tail_idx else -1
+    while i != -1:
+        stable.add(i)
+        i = prev[i]
+    return stable
+
+
+def _row_ops(sheet_id: int, first_row: int, old_keys: list, new_keys: list) -> tuple[list[dict], int]:
+    """Запросы batchUpdate, приводящие порядок строк old_keys к new_keys.
+    first_row — индекс API (с нуля) первой строки данных. Возвращает
+    (запросы, число перенесённых и вставленных строк)."""
+    wanted = {key: i for i, key in enumerate(new_keys)}
+    seen = set()
+    drop = []
+    for i, key in enumerate(old_keys):
+        if key in wanted and key not in seen:
+            seen.add(key)
+        else:
+            drop.append(i)
+    requests = []
+    # Удаление снизу вверх: индексы выше по вкладке не сдвигаются
+    runs: list[list[int]] = []
+    for i in reversed(drop):
+        if runs and runs[-1][0] == i + 1:
+            runs[-1][0] = i
+        else:
+            runs.append([i, i + 1])
+    for start, end in runs:
+        requests.append({'deleteDimension': {'range': {
+            'sheetId': sheet_id, 'dimension': 'ROWS',
+            'startIndex': first_row + start, 'endIndex': first_row + end}}})
+
+    dropped = set(drop)
+    current = [key for i, key in enumerate(old_keys) if i not in dropped]
+    stable_idx = _stable_positions([wanted[key] for key in current])
+    stable = {current[i] for i in stable_idx}
+    moved = 0
+    for j, key in enumerate(new_keys):
+        if key in stable:
+            continue
+        # Ставим сразу после предыдущей строки новой таблицы: порядок уже
+        # расставленных сохраняется, стабильные строки не двигаются
+        dest = current.index(new_keys[j - 1]) + 1 if j else 0
+        if key not in seen:
+            current.insert(dest, key)
+            requests.append({'insertDimension': {'range': {
+                'sheetId': sheet_id, 'dimension': 'ROWS',
+                'startIndex': first_row + dest, 'endIndex': first_row + dest + 1},
+                'inheritFromBefore': dest > 0}})
+            moved += 1
+            continue
+        src = current.index(key)
+        if src == dest:
+            continue
+        # destinationIndex — в координатах ДО изъятия строки
+        requests.append({'moveDimension': {
+            'source': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                       'startIndex': first_row + src, 'endIndex': first_row + src + 1},
+            'destinationIndex': first_row + dest}})
+        current.insert(dest - 1 if src < dest else dest, current.pop(src))
+        moved += 1
+    return requests, moved
+
+
+def same_key_column(snapshot: list[list[str]], column: list, key_col: int) -> bool:
+    """Совпадает ли свежо прочитанная ключевая колонка (column, с заголовком;
+    пустые ячейки — '' или None) с той же колонкой снимка. Пустой хвост
+    не учитывается: API его не отдаёт."""
+    def trimmed(cells):
+        cells = [(cell or '').strip() for cell in cells]
+        while cells and not cells[-1]:
+            cells.pop()
+        return cells
+
+    return trimmed(row[key_col] if len(row) > key_col else '' for row in snapshot) == trimmed(column)
+
+
+def plan_table_update(sheet_id: int, title: str, header: list[str], snapshot: list[list[str]],
+                      new_rows: list[list[str]], key_col: int) -> dict | None:
+    """
+    План дифф-записи: snapshot — вкладка, прочитанная целиком (с заголовком),
+    new_rows — новые строки данных (без заголовка) в нужном порядке.
+    Возвращает {'requests', 'data', 'moved', 'cells'}: запросы для
+    spreadsheets.batchUpdate (перестановки строк), диапазоны для
+    values.batchUpdate и статистику. None — заголовок снимка не совпадает с
+    header (колонки переставлены или вкладка пуста): нужна полная перезапись.
+    """
+    if not snapshot or [cell.strip() for cell in snapshot[0][:len(header)]] != header:
+        return None
+    width = len(header)
+
+    def key_of(row):
+        return row[key_col].strip() if len(row) > key_col else ''
+
+    old_rows = snapshot[1:]
+    old_by_key: dict[str, list[str]] = {}
+    for row in old_rows:
+        old_by_key.setdefault(key_of(row), row)
+    old_keys = [key_of(row) for row in old_rows]
+    new_keys = [key_of(row) for row in new_rows]
+    requests, moved = _row_ops(sheet_id, 1, old_keys, new_keys)
+
+    data = []
+    cells = 0
+    for j, row in enumerate(new_rows):
+        old = old_by_key.get(new_keys[j], []) if new_keys[j] else []
+        old = old[:width] + [''] * (width - len(old))
+        changed = [i for i in range(width) if str(row[i]) != old[i]]
+        cells += len(changed)
+        # Подряд идущие изменённые колонки — одним диапазоном
+        start = None
+        for n, i in enumerate(changed):
+            if start is None:
+                start = i
+            if n + 1 == len(changed) or changed[n + 1] != i + 1:
+                data.append({'range': f"'{title}'!{col_letter(start)}{j + 2}:{col_letter(i)}{j + 2}",
+                             'values': [[str(v) for v in row[start:i + 1]]]})
+                start = None
+    return {'requests': requests, 'data': data, 'moved': moved, 'cells': cells}
@@ -0,0 +1,70 @@
+"""
+Общий доступ к Google Sheets для всех скриптов: одна учётная запись
+google-auth и один gspread.Client на процесс поверх keep-alive сессии.
+
+Раньше каждый скрипт авторизовался сам (oauth2client
+ServiceAccountCredentials + gspread.authorize), а коллектор вдобавок
+поднимал вторую авторизацию google-auth и discovery-клиент
+build('sheets', 'v4') — лишние импорты, загрузка discovery-документа и
+отдельные TLS-рукопожатия. Теперь:
+
+    spreadsheet = open_spreadsheet(config['google_sheet_id'])
+    spreadsheet.batch_update({'requests': [...]})   # вместо discovery-клиента
+
+  • credentials() — google.oauth2 из /app/google-credentials.json, токен
+    обновляется сам (AuthorizedSession);
+  • client() — gspread.Client с requests-сессией, соединения к
+    sheets.googleapis.com переиспользуются (пул POOL_SIZE на хост);
+  • оба кэшируются на процесс: повторные open_spreadsheet не авторизуются
+    заново;
+  • каждый запрос проходит общую для всех процессов квоту (sheets_quota).
+"""
+
+import functools
+import os
+
+import gspread
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+from sheets_quota import throttle
+
+BASE_DIR = '/app'
+CREDENTIALS_FILE = os.path.join(BASE_DIR, 'google-credentials.json')
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive',
+]
+POOL_SIZE = 10   # соединений на хост: хватает параллельных запросов коллектора
+
+
+@functools.lru_cache(maxsize=None)
+def credentials(path: str = CREDENTIALS_FILE) -> Credentials:
+    """Учётная запись сервиса (одна на процесс)."""
+    return Credentials.from_service_account_file(path, scopes=SCOPES)
+
+
+class PacedSession(AuthorizedSession):
+    """AuthorizedSession, где каждый запрос сначала берёт жетон общей квоты
+    (sheets_quota): GET — чтение, остальное — запись. Обновление токена
+    идёт мимо (своим транспортом)."""
+
+    def request(self, method, url, *args, **kwargs):
+        throttle('read' if method.upper() == 'GET' else 'write')
+        return super().request(method, url, *args, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def client(path: str = CREDENTIALS_FILE) -> gspread.Client:
+    """gspread.Client поверх keep-alive сессии с пулом соединений и квотой."""
+    creds = credentials(path)
+    session = PacedSession(creds)
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('https://', adapter)
+    return gspread.Client(auth=creds, session=session)
+
+
+def open_spreadsheet(sheet_id: str, path: str = CREDENTIALS_FILE) -> gspread.Spreadsheet:
+    """Таблица по ключу через общий клиент."""
+    return client(path).open_by_key(sheet_id)
@@ -0,0 +1,73 @@
+"""
+Общая для всех процессов квота запросов к Google Sheets (token bucket).
+
+Пять задач cron (коллектор, alert_watcher, триаж, unknown_tx, сводка)
+ходят в одну таблицу от одного сервисного аккаунта, а квота API — 60
+чтений и 60 записей в минуту на пользователя. Пересекаясь, они ловили 429
+и засыпали на 120 с. Теперь каждый HTTP-запрос к Sheets (sheets_client)
+сначала берёт жетон из общего ведра:
+
+  • вёдра read (GET) и write (остальные методы) лежат в одном файле
+    /app/sheets_quota.json, доступ — под fcntl.flock: все процессы видят
+    одно состояние;
+  • ведро пополняется на PER_MINUTE жетонов в минуту и вмещает не больше
+    BURST: за любые 60 секунд уходит не больше BURST + PER_MINUTE
+    запросов (= 60);
+  • жетон берётся «в долг»: если ведро пусто, запрос резервирует место
+    в очереди и ждёт ровно до своего жетона — процессы расходятся по
+    времени равномерно, без общих двухминутных пауз.
+
+Файл состояния недоступен — запросы идут без ожидания (как раньше).
+"""
+
+import fcntl
+import json
+import logging
+import os
+import time
+
+BASE_DIR = '/app'
+QUOTA_PATH = os.path.join(BASE_DIR, 'sheets_quota.json')
+PER_MINUTE = 54   # пополнение ведра, жетонов в минуту
+BURST = 6         # ёмкость ведра: BURST + PER_MINUTE = квота API (60 в минуту)
+
+
+def reserve(kind: str, tokens: float = 1, path: str = QUOTA_PATH, now: float | None = None,
+            per_minute: float = PER_MINUTE, burst: float = BURST) -> float:
+    """Берёт tokens жетонов из ведра kind ('read'/'write'); возвращает,
+    сколько секунд подождать до их появления (0 — можно сразу)."""
+    rate = per_minute / 60
+    with open(path, 'a+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                state = {}
+            now = time.time() if now is None else now
+            bucket = state.get(kind) or {'tokens': burst, 'stamp': now}
+            # Пополнение с прошлого обращения; долг (tokens < 0) гасится так же
+            available = min(burst, bucket['tokens'] + max(0.0, now - bucket['stamp']) * rate)
+            available -= tokens
+            state[kind] = {'tokens': available, 'stamp': now}
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return max(0.0, -available / rate)
+
+
+def throttle(kind: str, tokens: float = 1, path: str = QUOTA_PATH) -> float:
+    """Блокирующее ожидание жетона; возвращает, сколько секунд ждали."""
+    try:
+        wait = reserve(kind, tokens, path)
+    except OSError as e:
+        logging.debug('Квота Sheets недоступна (%s) — без ожидания.', e)
+        return 0.0
+    if wait:
+        logging.info('Квота Sheets (%s): ждём %.1f с', kind, wait)
+        time.sleep(wait)
+    return wait
@@ -0,0 +1,186 @@
+"""
+Повторы запросов к Google Sheets при временных ошибках — общий слой для
+всех скриптов.
+
+retry_gspread — вызовы gspread (в том числе spreadsheet.batch_update вместо
+прежнего discovery-клиента). Политика:
+
+  • повторяются только временные ошибки: HTTP 408/409/429/5xx (и
+    «temporarily unavailable» в тексте) и сетевые сбои; постоянные ошибки
+    API, WorksheetNotFound и ошибки программы (TypeError, KeyError, ...) —
+    сразу наверх;
+  • пауза — Retry-After ответа, если сервер его прислал, иначе
+    экспоненциальная с джиттером; на 429 без подсказки — не меньше
+    QUOTA_MIN_WAIT (окно квоты — минута, основное сглаживание делает
+    sheets_quota);
+  • предохранитель (circuit breaker) на каждый метод: после
+    BREAKER_THRESHOLD неудач подряд метод BREAKER_COOLDOWN секунд
+    отказывает сразу (CircuitOpenError), затем пропускает пробный вызов;
+  • бюджет прогона (set_deadline): пауза, которая не укладывается в
+    остаток, не делается — ошибка уходит наверх сразу, и запуск не
+    наезжает на следующий слот cron;
+  • каждая повторная попытка и пауза учитываются в METRICS (metrics_summary
+    — строка для лога в конце прогона).
+
+Коллектор асинхронный: синхронные вызовы gspread уходят в пул потоков
+(asyncio.to_thread), так что независимые запросы идут параллельно.
+Синхронным скриптам (unknown_transaction.py) — call_gspread, тот же цикл
+повторов через asyncio.run.
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import re
+import time
+from collections import Counter
+
+import gspread
+from google.auth.exceptions import TransportError as GoogleTransportError
+from requests import exceptions as requests_exceptions
+
+TRANSIENT_HTTP_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+NETWORK_ERRORS = (GoogleTransportError, requests_exceptions.RequestException, ConnectionError, TimeoutError)
+QUOTA_MIN_WAIT = 15       # пауза на 429 без Retry-After, с
+MAX_WAIT = 120            # потолок одной паузы, с
+BREAKER_THRESHOLD = 5     # неудач подряд до размыкания
+BREAKER_COOLDOWN = 60     # сколько метод отказывает сразу, с
+
+METRICS: Counter = Counter()
+_breakers: dict[str, dict] = {}
+_deadline: float | None = None
+
+
+class CircuitOpenError(RuntimeError):
+    """Метод отключён предохранителем после серии неудач."""
+
+
+def set_deadline(seconds: float | None):
+    """Бюджет прогона от текущего момента (None — без ограничения)."""
+    global _deadline
+    _deadline = None if seconds is None else time.monotonic() + seconds
+
+
+def remaining() -> float | None:
+    """Остаток бюджета прогона, с (None — без ограничения)."""
+    return None if _deadline is None else max(0.0, _deadline - time.monotonic())
+
+
+def metrics_summary() -> str:
+    return ', '.join(f'{key}={round(value, 1)}' for key, value in sorted(METRICS.items())) or 'без повторов'
+
+
+def _status(e: gspread.exceptions.APIError) -> int | None:
+    response = getattr(e, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    if status is None:
+        match = re.search(r'\[(\d{3})\]', str(e))
+        if match:
+            status = int(match.group(1))
+    return status
+
+
+def _retry_after(e: gspread.exceptions.APIError) -> float | None:
+    """Retry-After ответа в секундах (число или HTTP-дата); None — подсказки нет."""
+    headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(e: Exception) -> tuple[bool, int | None, float | None]:
+    """(временная ли ошибка, HTTP-статус, Retry-After)."""
+    if isinstance(e, gspread.exceptions.WorksheetNotFound):
+        return False, None, None
+    if isinstance(e, gspread.exceptions.APIError):
+        status = _status(e)
+        message = str(e).lower()
+        transient = (
+            status in TRANSIENT_HTTP_STATUSES or
+            'temporarily unavailable' in message or
+            'internal error encountered' in message or
+            'operation was aborted' in message
+        )
+        return transient, status, _retry_after(e)
+    return isinstance(e, NETWORK_ERRORS), None, None
+
+
+def _calc_sleep(current_delay, status=None, retry_after=None, base_jitter=2):
+    if retry_after is not None:
+        return min(retry_after, MAX_WAIT)
+    if status == 429:
+        current_delay = max(current_delay, QUOTA_MIN_WAIT)
+    return min(current_delay + random.uniform(0, base_jitter), MAX_WAIT)
+
+
+def _breaker_check(endpoint: str):
+    breaker = _breakers.get(endpoint)
+    if breaker and breaker['open_until'] > time.monotonic():
+        METRICS['breaker_rejected'] += 1
+        raise CircuitOpenError(f'{endpoint}: предохранитель разомкнут после {breaker["failures"]} неудач подряд')
+
+
+def _breaker_record(endpoint: str, ok: bool):
+    breaker = _breakers.setdefault(endpoint, {'failures': 0, 'open_until': 0.0})
+    if ok:
+        breaker['failures'] = 0
+        breaker['open_until'] = 0.0
+        return
+    breaker['failures'] += 1
+    if breaker['failures'] >= BREAKER_THRESHOLD:
+        if breaker['open_until'] <= time.monotonic():
+            METRICS['breaker_opened'] += 1
+            logging.warning("Предохранитель %s разомкнут на %s с", endpoint, BREAKER_COOLDOWN)
+        breaker['open_until'] = time.monotonic() + BREAKER_COOLDOWN
+
+
+async def retry_gspread(func, *args, retries=5, delay=3, backoff=2, **kwargs):
+    endpoint = getattr(func, '__name__', repr(func))
+    current_delay = delay
+    for attempt in range(retries):
+        _breaker_check(endpoint)
+        try:
+            if asyncio.iscoroutinefunction(func):
+                result = await func(*args, **kwargs)
+            else:
+                # Синхронный gspread — в пуле потоков: event loop не блокируется
+                # на время запроса и ожидания квоты
+                result = await asyncio.to_thread(func, *args, **kwargs)
+        except Exception as e:
+            transient, status, retry_after = classify(e)
+            if not transient:
+                raise
+            _breaker_record(endpoint, ok=False)
+            if attempt == retries - 1:
+                raise
+            pause = _calc_sleep(current_delay, status=status, retry_after=retry_after)
+            left = remaining()
+            if left is not None and pause >= left:
+                METRICS['deadline_exceeded'] += 1
+                logging.error("%s: пауза %.0f с не укладывается в бюджет прогона (осталось %.0f с)",
+                              endpoint, pause, left)
+                raise
+            logging.warning("Sheets transient error (%s) on attempt %s/%s for %s: %s; sleep %.1f s",
+                            status or type(e).__name__, attempt + 1, retries, endpoint, e, pause)
+            METRICS['retries'] += 1
+            METRICS[f'retries.{endpoint}'] += 1
+            METRICS['sleep_sec'] += pause
+            await asyncio.sleep(pause)
+            current_delay *= backoff
+        else:
+            _breaker_record(endpoint, ok=True)
+            return result
+
+
+def call_gspread(func, *args, **kwargs):
+    """retry_gspread для синхронного кода (вне работающего event loop)."""
+    return asyncio.run(retry_gspread(func, *args, **kwargs))
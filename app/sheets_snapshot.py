@@ -0,0 +1,72 @@
+"""
+Снимок таблицы за два запроса: метаданные вкладок + значения нужных
+диапазонов одним values.batchGet.
+
+Старт коллектора шёл чередой последовательных запросов: worksheet() на
+каждую вкладку (gspread каждый раз заново тянет метаданные таблицы),
+get_all_values() для проверки заголовков, отдельное чтение Categories и
+повторное чтение Groups. load_snapshot берёт метаданные один раз и
+читает все диапазоны одним batchGet с проекцией колонок:
+
+    snapshot = load_snapshot(spreadsheet, {
+        'Original data': 'A:B',   # только ID и дата
+        'Groups': None,           # вкладка целиком
+        'Categories': 'A:C',
+    })
+    snapshot.values('Groups')     # [[...], ...], как get_all_values (без выравнивания длины строк)
+    snapshot.worksheet('Groups')  # gspread.Worksheet без лишнего запроса; None — вкладки нет
+
+Вкладки, которых нет в таблице, в batchGet не запрашиваются (иначе API
+отклоняет весь запрос): values() для них — []. spreadsheet — объект
+gspread.Spreadsheet (fetch_sheet_metadata и values_batch_get есть в
+gspread 5.x); подходит всем скриптам, что открывают таблицу через gspread.
+"""
+
+import gspread
+
+
+def a1_range(title: str, columns: str | None = None) -> str:
+    """'Groups', 'A:N' → "'Groups'!A:N"; без колонок — вкладка целиком."""
+    quoted = "'" + title.replace("'", "''") + "'"
+    return f'{quoted}!{columns}' if columns else quoted
+
+
+class SheetsSnapshot:
+    """Свойства вкладок и прочитанные значения на момент загрузки."""
+
+    def __init__(self, spreadsheet, properties: dict[str, dict], values: dict[str, list[list[str]]]):
+        self.spreadsheet = spreadsheet
+        self.properties = properties
+        self._values = values
+
+    def has(self, title: str) -> bool:
+        return title in self.properties
+
+    def sheet_id(self, title: str) -> int | None:
+        props = self.properties.get(title)
+        return props['sheetId'] if props else None
+
+    def values(self, title: str) -> list[list[str]]:
+        return self._values.get(title, [])
+
+    def worksheet(self, title: str):
+        """gspread.Worksheet из уже загруженных свойств (без запроса к API)."""
+        props = self.properties.get(title)
+        if props is None:
+            return None
+        return gspread.Worksheet(self.spreadsheet, props)
+
+
+def load_snapshot(spreadsheet, ranges: dict[str, str | None]) -> SheetsSnapshot:
+    """Метаданные вкладок и значения ranges (вкладка → колонки или None)."""
+    metadata = spreadsheet.fetch_sheet_metadata(params={'fields': 'sheets.properties'})
+    properties = {sheet['properties']['title']: sheet['properties'] for sheet in metadata.get('sheets', [])}
+    titles = [title for title in ranges if title in properties]
+    values: dict[str, list[list[str]]] = {}
+    if titles:
+        response = spreadsheet.values_batch_get(
+            [a1_range(title, ranges[title]) for title in titles],
+            params={'majorDimension': 'ROWS', 'valueRenderOption': 'FORMATTED_VALUE'})
+        for title, value_range in zip(titles, response.get('valueRanges', [])):
+            values[title] = value_range.get('values', [])
+    return SheetsSnapshot(spreadsheet, properties, values)
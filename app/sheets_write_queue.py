@@ -0,0 +1,61 @@
+"""
+Отложенная запись в таблицу: правки копятся и уходят минимумом запросов.
+
+Коллектор за запуск делает несколько записей подряд: патчи Original data,
+удаление протухшего префикса, перестановки строк Groups и изменённые
+ячейки. Каждая была отдельным запросом к квоте записей. WriteQueue
+принимает их по порядку и при drain() склеивает:
+
+  • подряд идущие правки значений (update) — в один values.batchUpdate;
+    повторная запись того же диапазона заменяет прежнюю (последняя правка
+    побеждает, место в запросе — первое);
+  • подряд идущие структурные запросы (request: deleteDimension,
+    moveDimension, ...) — в один spreadsheets.batchUpdate.
+Порядок «значения ↔ структура» сохраняется: координаты правок считаются
+в состоянии вкладки на момент их постановки в очередь.
+
+drain() отдаёт пары (метод таблицы, именованные аргументы) и очищает
+очередь — вызывающий выполняет их через свой слой повторов:
+
+    for method, kwargs in queue.drain():
+        await retry_gspread(method, **kwargs)
+"""
+
+
+class WriteQueue:
+    def __init__(self, spreadsheet, value_input_option: str = 'RAW'):
+        self.spreadsheet = spreadsheet
+        self.value_input_option = value_input_option
+        self._runs: list[tuple[str, object]] = []   # ('values', {range: values}) | ('requests', [...])
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def update(self, range_name: str, values: list[list]):
+        """Значения в диапазон A1 (как values_update)."""
+        if not self._runs or self._runs[-1][0] != 'values':
+            self._runs.append(('values', {}))
+        pending = self._runs[-1][1]
+        pending[range_name] = values
+
+    def request(self, *requests: dict):
+        """Структурные запросы spreadsheets.batchUpdate."""
+        if not requests:
+            return
+        if not self._runs or self._runs[-1][0] != 'requests':
+            self._runs.append(('requests', []))
+        self._runs[-1][1].extend(requests)
+
+    def drain(self) -> list[tuple]:
+        """Склеенные вызовы (метод, kwargs) по порядку; очередь очищается."""
+        calls = []
+        for kind, payload in self._runs:
+            if kind == 'values':
+                calls.append((self.spreadsheet.values_batch_update, {'body': {
+                    'valueInputOption': self.value_input_option,
+                    'data': [{'range': range_name, 'values': values} for range_name, values in payload.items()],
+                }}))
+            else:
+                calls.append((self.spreadsheet.batch_update, {'body': {'requests': payload}}))
+        self._runs = []
+        return calls
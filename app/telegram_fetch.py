@@ -0,0 +1,35 @@
+"""
+Догрузка истории канала без потерь: страницами по возрастанию id.
+
+get_messages(limit=N, min_id=last_id) отдаёт N САМЫХ НОВЫХ сообщений, а
+курсор после этого уходит на последнее — при всплеске больше N сообщений
+между запусками (или после простоя) более старые молча пропадали.
+fetch_pages идёт от курсора вверх (iter_messages(reverse=True)) и отдаёт
+страницы по page_size — вызывающий обрабатывает страницу, сдвигает курсор
+на её последний id и только потом берёт следующую. Объём хвоста влияет на
+задержку, но не на полноту: прерванная догрузка продолжится со страницы,
+на которой остановилась.
+
+Темп: между запросами истории (по 100 сообщений) — wait_time секунд;
+FloodWait до flood_sleep_threshold клиента Telethon пережидает сам
+(клиенты создаются с FLOOD_SLEEP_THRESHOLD).
+"""
+
+PAGE_SIZE = 500
+WAIT_TIME_SEC = 0.5            # пауза между запросами истории
+FLOOD_SLEEP_THRESHOLD = 120    # FloodWait до стольких секунд пережидается без ошибки
+
+
+async def fetch_pages(client, chat_id: int, min_id: int, page_size: int = PAGE_SIZE,
+                      wait_time: float = WAIT_TIME_SEC):
+    """Сообщения новее min_id страницами по page_size, по возрастанию id."""
+    page = []
+    async for message in client.iter_messages(chat_id, min_id=min_id, reverse=True, wait_time=wait_time):
+        if message.id <= min_id:
+            continue
+        page.append(message)
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
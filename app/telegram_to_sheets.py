@@ -4,20 +4,16 @@ import json
 import asyncio
 import logging
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
+from collections import Counter, defaultdict
 import re
 import random
 import functools
 import sqlite3
 import shutil
+import contextlib
+import fcntl
 
 import gspread
-from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials as GoogleCreds
-from google.auth.exceptions import TransportError as GoogleTransportError
-from oauth2client.service_account import ServiceAccountCredentials
-from requests import exceptions as requests_exceptions
 from telethon import TelegramClient
 
 from telegram_proxy import get_telegram_proxy
@@ -26,11 +22,14 @@ from telegram_proxy import get_telegram_proxy
 BASE_DIR = '/app'
 LOG_PATH = os.path.join(BASE_DIR, 'logs/telegram_to_sheets.log')
 LAST_ID_FILE = os.path.join(BASE_DIR, 'last_message_id.txt')
+CHAIN_STATE_FILE = os.path.join(BASE_DIR, 'open_chain.json')
 CONFIG_PATH = os.path.join(BASE_DIR, 'config.json')
-CREDENTIALS_FILE = os.path.join(BASE_DIR, 'google-credentials.json')
+LOCK_PATH = os.path.join(BASE_DIR, 'telegram_to_sheets.lock')
 TMP_DIR = '/tmp'
 TELEGRAM_CONNECT_RETRIES = 6
 TELEGRAM_RETRY_DELAYS_SEC = [30, 90, 180]
+RUN_BUDGET_SEC = 25 * 60  # запуск каждые 30 минут: повторы не должны наезжать на следующий
+CATCHUP_RESERVE_SEC = 5 * 60  # догрузка истории оставляет столько бюджета на запись в таблицу
 
 # Логирование
 logging.basicConfig(
@@ -74,6 +73,44 @@ def save_last_id(last_id):
     except Exception as e:
         logging.error(f"Ошибка записи last_message_id.txt: {e}")
 
+def read_chain_state() -> dict:
+    """Склейка между запусками: chain — незакрытая цепочка прошлой пачки
+    (stitch_batch), pending — id головы → склеенный текст, который ещё
+    не дошёл до вкладки Original data и счётчиков групп (запуск упал
+    после записи в хранилище)."""
+    state = {'chain': None, 'pending': {}}
+    if os.path.exists(CHAIN_STATE_FILE):
+        try:
+            with open(CHAIN_STATE_FILE, 'r', encoding='utf-8') as f:
+                state.update(json.load(f))
+        except Exception as e:
+            logging.error(f"Ошибка чтения open_chain.json: {e}")
+    return state
+
+def save_chain_state(state: dict):
+    try:
+        tmp_path = f'{CHAIN_STATE_FILE}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, CHAIN_STATE_FILE)
+    except Exception as e:
+        logging.error(f"Ошибка записи open_chain.json: {e}")
+
+def acquire_lock(path=LOCK_PATH):
+    """Lock сборщика: один проход по курсору за раз (прогон cron или демон).
+    Открытый файл с захваченным lock; None — lock уже занят."""
+    lock_file = open(path, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def release_lock(lock_file):
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()
+
 def clean_log(text):
     if not text:
         return ''
@@ -84,8 +121,25 @@ def clean_log(text):
 
 # Нормализация вынесена в normalize.py: обезличиваются ВСЕ логи,
 # различительные токены (SQLSTATE-коды, классы, HTTP-статусы) сохраняются.
-from normalize import merge_fragment_chains, normalize_error_pattern  # noqa: E402
-
+from normalize import (  # noqa: E402
+    GuardedNormalizer, get_normalizer, merge_fragment_chains, normalize_error_pattern,
+    normalize_many, stitch_batch,
+)
+from normalize_cache import open_cache, rules_version  # noqa: E402
+from group_counters import open_counters  # noqa: E402
+from aggregate import aggregate  # noqa: E402
+from raw_archive import RETENTION_DAYS as RAW_ARCHIVE_RETENTION_DAYS, RawArchive  # noqa: E402
+from raw_store import RAW_SHEET_TITLE, RawStore, plan_sheet_sync  # noqa: E402
+from rules_migration import merge_saved, migrate_groups, migration_map  # noqa: E402
+from sheet_diff import plan_table_update, same_key_column  # noqa: E402
+from sheets_snapshot import load_snapshot  # noqa: E402
+from sheets_write_queue import WriteQueue  # noqa: E402
+from sheets_client import open_spreadsheet  # noqa: E402
+from sheets_retry import metrics_summary, remaining, retry_gspread, set_deadline  # noqa: E402
+from telegram_fetch import FLOOD_SLEEP_THRESHOLD, fetch_pages  # noqa: E402
+from template_miner import TemplateMiner  # noqa: E402
+
+RAW_HEADER = ['ID', 'Дата', 'Текст']
 GROUPS_HEADER = [
     "ID", "Категория", "Ошибка (шаблон)",
     "За 1 день", "За 7 дней", "За 30 дней", "Последнее появление",
@@ -181,97 +235,23 @@ def extract_error_and_address(text):
 
     return cleaned_text.strip(), address
 
-TRANSIENT_HTTP_STATUSES = {408, 409, 429, 500, 502, 503, 504}
-
-
-def _calc_sleep(current_delay, status=None, base_jitter=2, min_quota_wait=120):
-    if status == 429:
-        return min_quota_wait
-    return current_delay + random.uniform(0, base_jitter)
-
-
-async def retry_gspread(func, *args, retries=5, delay=3, backoff=2, **kwargs):
-    current_delay = delay
-    for attempt in range(retries):
+async def load_category_rules(spreadsheet, snapshot=None):
+    """Правила категорий из вкладки Categories. snapshot (SheetsSnapshot) —
+    строки берутся из уже прочитанного снимка, без отдельных запросов."""
+    if snapshot is not None and snapshot.has(CATEGORY_SHEET_TITLE):
+        rows = snapshot.values(CATEGORY_SHEET_TITLE)
+    else:
         try:
-            result = func(*args, **kwargs)
-            if asyncio.iscoroutine(result):
-                return await result
-            return result
+            sheet = await retry_gspread(spreadsheet.worksheet, CATEGORY_SHEET_TITLE)
         except gspread.exceptions.WorksheetNotFound:
-            raise
-        except gspread.exceptions.APIError as e:
-            status = None
-            if hasattr(e, 'response') and e.response is not None:
-                status = getattr(e.response, 'status', None) or getattr(e.response, 'status_code', None)
-            if status is None:
-                match = re.search(r'\[(\d{3})\]', str(e))
-                if match:
-                    status = int(match.group(1))
-            message = str(e).lower()
-            is_transient = (
-                (status in TRANSIENT_HTTP_STATUSES) or
-                ('temporarily unavailable' in message) or
-                ('internal error encountered' in message) or
-                ('operation was aborted' in message)
+            sheet = await retry_gspread(
+                spreadsheet.add_worksheet,
+                title=CATEGORY_SHEET_TITLE,
+                rows='200',
+                cols='2'
             )
-            if not is_transient or attempt == retries - 1:
-                raise
-            logging.warning("gspread transient error (%s) on attempt %s/%s: %s", status, attempt + 1, retries, e)
-            await asyncio.sleep(_calc_sleep(current_delay, status=status))
-            current_delay *= backoff
-        except (GoogleTransportError, requests_exceptions.RequestException, OSError) as e:
-            if attempt == retries - 1:
-                raise
-            logging.warning("Network error on attempt %s/%s for %s: %s", attempt + 1, retries, func.__name__, e)
-            await asyncio.sleep(_calc_sleep(current_delay))
-            current_delay *= backoff
-        except Exception as e:
-            if attempt == retries - 1:
-                raise
-            logging.warning("Unexpected error on attempt %s/%s for %s: %s", attempt + 1, retries, func.__name__, e)
-            await asyncio.sleep(_calc_sleep(current_delay))
-            current_delay *= backoff
-
-
-async def retry_google_api(api_call, retries=5, delay=3, backoff=2):
-    current_delay = delay
-    for attempt in range(retries):
-        try:
-            return api_call()
-        except HttpError as e:
-            if e.resp.status not in TRANSIENT_HTTP_STATUSES or attempt == retries - 1:
-                raise
-            logging.warning("Google API transient HttpError %s on attempt %s/%s", e.resp.status, attempt + 1, retries)
-            await asyncio.sleep(_calc_sleep(current_delay, status=e.resp.status))
-            current_delay *= backoff
-        except (GoogleTransportError, requests_exceptions.RequestException, OSError) as e:
-            if attempt == retries - 1:
-                raise
-            logging.warning("Google API network error on attempt %s/%s: %s", attempt + 1, retries, e)
-            await asyncio.sleep(_calc_sleep(current_delay))
-            current_delay *= backoff
-        except Exception as e:
-            if attempt == retries - 1:
-                raise
-            logging.warning("Unexpected Google API error on attempt %s/%s: %s", attempt + 1, retries, e)
-            await asyncio.sleep(_calc_sleep(current_delay))
-            current_delay *= backoff
-
-
-async def load_category_rules(spreadsheet):
-    try:
-        sheet = await retry_gspread(spreadsheet.worksheet, CATEGORY_SHEET_TITLE)
-    except gspread.exceptions.WorksheetNotFound:
-        sheet = await retry_gspread(
-            spreadsheet.add_worksheet,
-            title=CATEGORY_SHEET_TITLE,
-            rows='200',
-            cols='2'
-        )
-        await update_range(spreadsheet, f"{CATEGORY_SHEET_TITLE}!A1:B1", [CATEGORY_HEADER])
-
-    rows = await retry_gspread(sheet.get_all_values)
+            await update_range(spreadsheet, f"{CATEGORY_SHEET_TITLE}!A1:B1", [CATEGORY_HEADER])
+        rows = await retry_gspread(sheet.get_all_values)
     if not rows:
         await update_range(spreadsheet, f"{CATEGORY_SHEET_TITLE}!A1:B1", [CATEGORY_HEADER])
         rows = [CATEGORY_HEADER]
@@ -290,204 +270,443 @@ async def load_category_rules(spreadsheet):
     return rules
 
 
-def count_and_aggregate(logs):
+def count_and_aggregate(logs, normalize=normalize_error_pattern, cache=None, miner=None,
+                        workers=None, counters=None, changed_ids=()):
+    """Счётчики 1д/7д/30д и последнее появление по шаблонам.
+    cache (NormalizeCache) — шаблоны уже виденных текстов берутся из него;
+    miner (TemplateMiner) — ключом группы становится шаблон кластера;
+    workers — процессы для нормализации больших пакетов (normalize_many);
+    counters (GroupCounters) — появления копятся в часовых корзинах между
+    запусками: обрабатываются только логи новее counters.last_id и
+    сообщения changed_ids (цепочки, дополненные хвостами), счётчики
+    считаются по корзинам."""
     now = datetime.now(timezone.utc)
-    error_data = defaultdict(lambda: {
-        'counts': {'1d': 0, '7d': 0, '30d': 0},
-        'last_seen': None
-    })
+    if counters is not None and counters.last_id is not None:
+        changed = set(changed_ids)
+        logs = [log for log in logs if log['id'] > counters.last_id or log['id'] in changed]
     # Склеиваем цепочки разрезанных сообщений (голова + хвосты)
-    for log in merge_fragment_chains(logs):
-        raw_text, _address = extract_error_and_address(log['text'])
-        error_pattern = normalize_error_pattern(raw_text)
-        if not error_pattern:
+    merged = merge_fragment_chains(logs)
+    raw_texts = [extract_error_and_address(log['text'])[0] for log in merged]
+    if cache is not None:
+        patterns = cache.lookup(raw_texts, normalize, workers=workers)
+    else:
+        patterns = normalize_many(raw_texts, workers=workers, normalize=normalize)
+    if counters is not None:
+        parts = Counter()
+        entries = []
+        for log, error_pattern in zip(merged, patterns):
+            entries.append((log['id'], parts[log['id']], error_pattern, log['date']))
+            parts[log['id']] += 1
+        counters.add(entries)
+        counters.expire(now)
+        if miner is None:
+            return counters.counts(now)
+        for p in patterns:
+            if p:
+                miner.add(p)
+        # Шаблоны в корзинах — до майнера: сводим по текущим кластерам
+        error_data = {}
+        for pattern, data in counters.counts(now).items():
+            key = miner.match(pattern) or pattern
+            if key not in error_data:
+                error_data[key] = data
+                continue
+            folded = error_data[key]
+            folded['counts'] = {w: folded['counts'][w] + n for w, n in data['counts'].items()}
+            folded['last_seen'] = max(folded['last_seen'], data['last_seen'])
+        return error_data
+    if miner is not None:
+        # Шаблон кластера обобщается по ходу прогона — берём итоговый
+        cluster_ids = [miner.add(p) if p else None for p in patterns]
+        patterns = [miner.template(cid) if cid is not None else '' for cid in cluster_ids]
+    # Без хранилища счётчиков — всё окно в памяти (векторно, если есть NumPy)
+    return aggregate([log['date'] for log in merged], patterns, now)
+
+def build_rules_migration(logs, cache, normalize, version, miner=None, workers=None):
+    """Карта миграции Groups (rules_migration.migration_map) с правил
+    version на текущие: шаблоны тех же сырых текстов, что считает
+    count_and_aggregate, по прежним правилам (history кэша) и по новым.
+    С майнером старый ключ — шаблон его кластера (состояние до прогона)."""
+    merged = merge_fragment_chains(logs)
+    raw_texts = [extract_error_and_address(log['text'])[0] for log in merged]
+    old_patterns = cache.previous_patterns(raw_texts, version)
+    new_patterns = cache.lookup(raw_texts, normalize, workers=workers)
+    if miner is not None:
+        old_patterns = [(miner.match(p) or p) if p else p for p in old_patterns]
+    return migration_map(old_patterns, new_patterns)
+
+
+def remap_groups_to_templates(existing_groups, miner):
+    """Переключает ключи Groups на шаблоны кластеров майнера, чтобы ручные
+    колонки переехали вместе с обобщённой группой. Несколько строк, ушедших
+    в один шаблон, сливаются (rules_migration.merge_saved: самый строгий
+    вердикт; при равных — строка, чей шаблон уже совпадал с кластерным)."""
+    renamed = miner.renamed()
+    incoming = defaultdict(list)
+    for pattern, saved in existing_groups.items():
+        target = renamed.get(pattern) or miner.match(pattern) or pattern
+        incoming[target].append((saved, 1 if target == pattern else 0))
+    return {target: merge_saved(sources) if len(sources) > 1 else sources[0][0]
+            for target, sources in incoming.items()}
+
+
+def read_existing_groups(group_rows_all: list[list[str]]) -> dict:
+    """Ручные колонки Groups по шаблону. Колонки читаем ПО ИМЕНАМ: порядок
+    колонок менялся (ID переехал в начало), позиционное чтение затирало бы
+    ручные вердикты при переходе."""
+    old_header = group_rows_all[0] if group_rows_all else []
+    col_idx = {name.strip(): i for i, name in enumerate(old_header) if name.strip()}
+
+    def old_col(row, name):
+        i = col_idx.get(name)
+        return row[i].strip() if i is not None and len(row) > i else ''
+
+    existing_groups = {}  # шаблон -> сохранённые ручные колонки
+    for row in group_rows_all[1:]:
+        pattern = old_col(row, 'Ошибка (шаблон)')
+        if not pattern:
+            continue
+        existing_groups[pattern] = {
+            'category': old_col(row, 'Категория'),
+            'last_seen': old_col(row, 'Последнее появление'),
+            'status': old_col(row, 'Статус'),
+            'verdict': old_col(row, 'Вердикт'),
+            'urgency': old_col(row, 'Срочность'),
+            'cause': old_col(row, 'Причина'),
+            'action': old_col(row, 'Действие'),
+            'assessed': old_col(row, 'Оценено'),
+            'acting_since': old_col(row, 'Впервые в действовать'),
+        }
+    return existing_groups
+
+
+def build_group_rows(error_data, existing_groups, category_rules=None):
+    """Строки вкладки Groups: (final_rows, archive_rows, число новых групп).
+
+    - счётчики свежих групп из error_data;
+    - группы, не встреченные в 30-дневном окне, получают нулевые счётчики
+      (раньше хранили застывшие числа — это враньё в данных);
+    - ручные колонки (Статус/Вердикт/Срочность/Причина/Действие/Оценено)
+      сохраняются как есть;
+    - группы без появлений дольше RETENTION_DAYS уезжают в archive_rows."""
+    now_utc = datetime.now(timezone.utc)
+    retention_cutoff = (now_utc - timedelta(days=RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+
+    final_rows = []
+    archive_rows = []
+    seen_patterns = set()
+
+    def build_row(pattern, counts, last_seen, saved):
+        category = (saved or {}).get('category', '').strip() or extract_category(pattern, category_rules)
+        status = (saved or {}).get('status', '').strip()
+        verdict = (saved or {}).get('verdict', '')
+        if not status:
+            status = 'не обработано' if not verdict.strip() else 'обработано'
+        s = saved or {}
+        # «Впервые в действовать»: ставится в день, когда группа получила
+        # вердикт «действовать», и держится, пока вердикт не сменится.
+        # По ней считается «висит N дней» в блоке 🔁 дайджеста.
+        acting_since = s.get('acting_since', '').strip()
+        if verdict.strip().lower() == 'действовать':
+            acting_since = acting_since or datetime.now().strftime('%Y-%m-%d')
+        else:
+            acting_since = ''
+        return [
+            group_id(pattern), category, pattern,
+            str(counts['1d']), str(counts['7d']), str(counts['30d']), last_seen,
+            status, verdict, s.get('urgency', ''),
+            s.get('cause', ''), s.get('action', ''), s.get('assessed', ''),
+            acting_since,
+        ]
+
+    # Порядок строк: сортировка по «За 1 день» (по требованию владельца).
+    # Ориентир в дайджестах — колонка ID (первая), а не номер строки.
+    zero = {'1d': 0, '7d': 0, '30d': 0}
+    for pattern, saved in existing_groups.items():
+        data = error_data.get(pattern)
+        if data is not None:
+            last_seen_str = data['last_seen'].strftime('%Y-%m-%d %H:%M:%S') if data['last_seen'] else ''
+            final_rows.append(build_row(
+                pattern, data['counts'],
+                max(last_seen_str, saved.get('last_seen', '')), saved
+            ))
+            seen_patterns.add(pattern)
+            continue
+        # Не встречалась в окне: счётчики в ноль; совсем протухшая — в архив
+        row = build_row(pattern, zero, saved.get('last_seen', ''), saved)
+        if saved.get('last_seen', '') and saved['last_seen'] < retention_cutoff:
+            archive_rows.append(row)
+        else:
+            final_rows.append(row)
+
+    # Новые группы — вниз, между собой по объёму за 30 дней
+    for pattern, data in sorted(error_data.items(), key=lambda x: x[1]['counts']['30d'], reverse=True):
+        if pattern in seen_patterns or pattern in existing_groups:
             continue
-        data = error_data[error_pattern]
-        delta = now - log['date'].replace(tzinfo=timezone.utc)
-        if delta <= timedelta(days=1):
-            data['counts']['1d'] += 1
-        if delta <= timedelta(days=7):
-            data['counts']['7d'] += 1
-        if delta <= timedelta(days=30):
-            data['counts']['30d'] += 1
-        if data['last_seen'] is None or log['date'].astimezone(timezone.utc) > data['last_seen']:
-            data['last_seen'] = log['date'].astimezone(timezone.utc)
-    return error_data
+        last_seen_str = data['last_seen'].strftime('%Y-%m-%d %H:%M:%S') if data['last_seen'] else ''
+        final_rows.append(build_row(pattern, data['counts'], last_seen_str, None))
+        seen_patterns.add(pattern)
+
+    # Сортировка по «За 1 день», затем по «За 30 дней»
+    d1_i = GROUPS_HEADER.index('За 1 день')
+    d30_i = GROUPS_HEADER.index('За 30 дней')
+    final_rows.sort(key=lambda r: (int(r[d1_i] or 0), int(r[d30_i] or 0)), reverse=True)
+    return final_rows, archive_rows, len(seen_patterns - set(existing_groups))
 
 # ===== Основная логика =====
 
-async def main():
-    config = {}
-    client = None
-    session_host_path = None
-    tmp_session_file = None
-    try:
-        os.chdir(BASE_DIR)
-        clean_old_logs(LOG_PATH, days=7)
-        with open(CONFIG_PATH, 'r') as f:
-            config = json.load(f)
-        session_host_path, tmp_session_name, tmp_session_file = prepare_session_paths(config.get('session_name', 'session'))
-        if not os.path.exists(session_host_path):
-            logging.error(
-                "Файл Telegram-сессии %s не найден. "
-                "Запустите `docker exec telegram-to-sheets-app python -m telethon.sessions` для авторизации.",
-                session_host_path
-            )
-            return
+async def open_sheets(config: dict, store_empty: bool):
+    """Таблица, снимок и вкладки коллектора (недостающие создаются).
+    Возвращает (spreadsheet, snapshot, sheet_raw, sheet_groups,
+    group_rows_all, category_rules)."""
+    spreadsheet = await retry_gspread(open_spreadsheet, config['google_sheet_id'])
+    # Все чтения таблицы за запуск — один снимок: метаданные вкладок и
+    # values.batchGet по нужным колонкам (вместо worksheet() и
+    # get_all_values() на каждую вкладку). Original data целиком — только
+    # пока локальное хранилище пусто (первый запуск), иначе лишь ID и дата
+    snapshot = await retry_gspread(load_snapshot, spreadsheet, {
+        RAW_SHEET_TITLE: 'A:C' if store_empty else 'A:B',
+        'Groups': None,
+        CATEGORY_SHEET_TITLE: 'A:C',
+        ARCHIVE_SHEET_TITLE: 'A1:N1',
+    })
+    sheet_raw = snapshot.worksheet(RAW_SHEET_TITLE)
+    if sheet_raw is None:
+        sheet_raw = await retry_gspread(
+            spreadsheet.add_worksheet,
+            title=RAW_SHEET_TITLE,
+            rows='1000',
+            cols='10'
+        )
+    sheet_groups = snapshot.worksheet('Groups')
+    if sheet_groups is None:
+        sheet_groups = await retry_gspread(
+            spreadsheet.add_worksheet,
+            title='Groups',
+            rows='100',
+            cols='20'
+        )
 
-        os.makedirs(os.path.dirname(tmp_session_file), exist_ok=True)
-        shutil.copy2(session_host_path, tmp_session_file)
+    # Гарантированно добавим заголовки, если пусто. Снимок Groups служит
+    # и базой диффа при записи: вердикты, записанные триажем позже, не
+    # затираются (пишутся только ячейки, изменённые коллектором)
+    group_rows_all = snapshot.values('Groups')
+    if not group_rows_all or not any(cell.strip() for cell in group_rows_all[0]):
+        await update_range(spreadsheet, 'Groups!A1:N1', [GROUPS_HEADER])
+        group_rows_all = [GROUPS_HEADER] + group_rows_all[1:]
 
-        telegram_proxy = get_telegram_proxy(config)
-        if telegram_proxy:
-            logging.info("Telegram proxy enabled: %s:%s", telegram_proxy[1], telegram_proxy[2])
+    category_rules = await load_category_rules(spreadsheet, snapshot)
+    return spreadsheet, snapshot, sheet_raw, sheet_groups, group_rows_all, category_rules
 
-        last_connect_error = None
-        for attempt in range(1, TELEGRAM_CONNECT_RETRIES + 1):
-            # Пересоздаём клиента на каждой попытке: при сбое прокси-пул отдаёт
-            # другой upstream-прокси. Иначе ретраи залипают на одном мёртвом прокси
-            # (одиночные коннекты проходят, а застрявший клиент таймаутит весь прогон).
-            if client is not None:
-                try:
-                    await client.disconnect()
-                except Exception:
-                    pass
-            client = TelegramClient(
-                tmp_session_name,
-                config['api_id'],
-                config['api_hash'],
-                proxy=telegram_proxy,
-            )
-            try:
-                for i in range(5):
-                    try:
-                        await client.connect()
-                        last_connect_error = None
-                        break
-                    except sqlite3.OperationalError as e:
-                        if 'database is locked' in str(e):
-                            logging.warning("SQLite база заблокирована, пробуем снова через 3 секунды...")
-                            await asyncio.sleep(3)
-                        else:
-                            raise
-                else:
-                    raise RuntimeError("Не удалось подключиться к Telegram из-за блокировки SQLite.")
-                break
-            except Exception as e:
-                last_connect_error = e
-                if attempt == TELEGRAM_CONNECT_RETRIES:
-                    break
-                delay = TELEGRAM_RETRY_DELAYS_SEC[min(attempt - 1, len(TELEGRAM_RETRY_DELAYS_SEC) - 1)] + random.uniform(0, 15)
-                logging.warning(
-                    "Не удалось подключиться к Telegram, попытка %s/%s: %s. Повтор через %.1f сек.",
-                    attempt,
-                    TELEGRAM_CONNECT_RETRIES,
-                    e,
-                    delay
-                )
-                await asyncio.sleep(delay)
-
-        if last_connect_error is not None:
-            logging.error("Не удалось подключиться к Telegram после %s попыток.", TELEGRAM_CONNECT_RETRIES)
-            raise last_connect_error
 
-        if not await client.is_user_authorized():
-            logging.error(
-                "Telegram-сессия найдена, но не авторизована. "
-                "Запустите `docker exec telegram-to-sheets-app python -m telethon.sessions` и авторизуйтесь вручную."
-            )
-            return
-        last_id = read_last_id()
-        logging.info(f"Последний обработанный ID: {last_id}")
-        messages = await client.get_messages(int(config['chat_id']), limit=500, min_id=last_id)
-        new_messages = [m for m in messages if m.id > last_id]
-        if not new_messages:
-            logging.info("Новых сообщений нет.")
-            return
-        new_messages.sort(key=lambda m: m.id)
-        rows_raw = []
-        text_count = 0
-        for m in new_messages:
-            text = m.message.replace('\n', ' ') if m.message else ''
-            if text.strip():
-                text_count += 1
-            rows_raw.append([m.id, m.date.strftime('%Y-%m-%d %H:%M:%S'), text])
-        if text_count == 0:
-            logging.warning("В новых сообщениях нет текстов.")
-            return
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-        client_gs = gspread.authorize(creds)
-        google_creds = GoogleCreds.from_service_account_file(
-            CREDENTIALS_FILE,
-            scopes=['https://www.googleapis.com/auth/spreadsheets']
-        )
-        sheets_api = build('sheets', 'v4', credentials=google_creds, cache_discovery=False)
-        spreadsheet = await retry_gspread(client_gs.open_by_key, config['google_sheet_id'])
-        try:
-            sheet_raw = await retry_gspread(spreadsheet.worksheet, 'Original data')
-        except gspread.exceptions.WorksheetNotFound:
-            sheet_raw = await retry_gspread(
-                spreadsheet.add_worksheet,
-                title='Original data',
-                rows='1000',
-                cols='10'
-            )
+async def sync_raw_sheet(sheet_raw, plan: dict):
+    """Заголовок и новые строки Original data (остальное — через очередь записи)."""
+    if plan['rewrite']:
+        # Во вкладке не хватает строки из середины окна — переписываем целиком
+        await retry_gspread(sheet_raw.clear)
+        await retry_gspread(sheet_raw.append_rows, [RAW_HEADER] + plan['append'])
+        return
+    if plan['header']:
+        await retry_gspread(sheet_raw.insert_row, RAW_HEADER, index=1)
+    if plan['append']:
+        await retry_gspread(sheet_raw.append_rows, plan['append'])
 
-        # ✅ Добавление заголовков, если их нет
-        existing = await retry_gspread(sheet_raw.get_all_values)
-        if not existing or not any(cell.strip() for cell in existing[0]):
-            await retry_gspread(sheet_raw.insert_row, ['ID', 'Дата', 'Текст'], index=1)
-        try:
-            sheet_groups = await retry_gspread(spreadsheet.worksheet, 'Groups')
-        except gspread.exceptions.WorksheetNotFound:
-            sheet_groups = await retry_gspread(
-                spreadsheet.add_worksheet,
-                title='Groups',
-                rows='100',
-                cols='20'
-            )
 
-        # Гарантированно добавим заголовки, если пусто
-        group_values = await retry_gspread(sheet_groups.get_all_values)
-        if not group_values or not any(cell.strip() for cell in group_values[0]):
-            await update_range(spreadsheet, 'Groups!A1:N1', [GROUPS_HEADER])
+async def flush_writes(writes: WriteQueue):
+    for method, kwargs in writes.drain():
+        await retry_gspread(method, **kwargs)
 
-        category_rules = await load_category_rules(spreadsheet)
 
-        # Добавляем новые сообщения в первую вкладку
-        await retry_gspread(sheet_raw.append_rows, rows_raw)
-        save_last_id(new_messages[-1].id)
-        logging.info(f"Добавлено сообщений: {len(new_messages)} | Текстовых: {text_count}")
+async def write_tabs(spreadsheet, requests: list[dict], updates: list[tuple[str, list[list]]]):
+    """Правки Original data и Groups: сначала все структурные запросы обеих
+    вкладок (одним batchUpdate), затем все значения (одним values.batchUpdate).
+    Координаты updates — в состоянии вкладок ПОСЛЕ requests; запросы разных
+    вкладок друг друга не сдвигают."""
+    writes = WriteQueue(spreadsheet)
+    writes.request(*requests)
+    for range_name, values in updates:
+        writes.update(range_name, values)
+    await flush_writes(writes)
 
-        # Читаем ВСЕ логи с первой вкладки для анализа
-        # Удаляем строки из Original data старше 30 дней
-        raw_rows = await retry_gspread(sheet_raw.get_all_values)
-        header = raw_rows[0]
-        rows_to_keep = [header]
-        cutoff = datetime.now() - timedelta(days=30)
 
-        for row in raw_rows[1:]:
-            if len(row) < 2:
-                continue
+async def connect_telegram(config: dict, tmp_session_name: str, telegram_proxy):
+    """Подключённый TelegramClient: до TELEGRAM_CONNECT_RETRIES попыток с паузами
+    (ошибка последней попытки — наверх, клиент при этом уже отключён)."""
+    client = None
+    last_connect_error = None
+    for attempt in range(1, TELEGRAM_CONNECT_RETRIES + 1):
+        # Пересоздаём клиента на каждой попытке: при сбое прокси-пул отдаёт
+        # другой upstream-прокси. Иначе ретраи залипают на одном мёртвом прокси
+        # (одиночные коннекты проходят, а застрявший клиент таймаутит весь прогон).
+        if client is not None:
             try:
-                try:
-                    log_date = datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    try:
-                        log_date = datetime.fromisoformat(row[1])
-                    except Exception:
-                        continue
-                if log_date > cutoff:
-                    rows_to_keep.append(row)
+                await client.disconnect()
             except Exception:
-                rows_to_keep.append(row)  # если дата кривая — не удаляем
+                pass
+        client = TelegramClient(
+            tmp_session_name,
+            config['api_id'],
+            config['api_hash'],
+            proxy=telegram_proxy,
+            flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD,
+        )
+        try:
+            for i in range(5):
+                try:
+                    await client.connect()
+                    last_connect_error = None
+                    break
+                except sqlite3.OperationalError as e:
+                    if 'database is locked' in str(e):
+                        logging.warning("SQLite база заблокирована, пробуем снова через 3 секунды...")
+                        await asyncio.sleep(3)
+                    else:
+                        raise
+            else:
+                raise RuntimeError("Не удалось подключиться к Telegram из-за блокировки SQLite.")
+            break
+        except Exception as e:
+            last_connect_error = e
+            if attempt == TELEGRAM_CONNECT_RETRIES:
+                break
+            delay = TELEGRAM_RETRY_DELAYS_SEC[min(attempt - 1, len(TELEGRAM_RETRY_DELAYS_SEC) - 1)] + random.uniform(0, 15)
+            logging.warning(
+                "Не удалось подключиться к Telegram, попытка %s/%s: %s. Повтор через %.1f сек.",
+                attempt,
+                TELEGRAM_CONNECT_RETRIES,
+                e,
+                delay
+            )
+            await asyncio.sleep(delay)
 
-        # Полностью перезаписываем таблицу только нужными строками
-        await retry_gspread(sheet_raw.clear)
-        await retry_gspread(sheet_raw.append_rows, rows_to_keep)
+    if last_connect_error is not None:
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+        logging.error("Не удалось подключиться к Telegram после %s попыток.", TELEGRAM_CONNECT_RETRIES)
+        raise last_connect_error
+    return client
+
+
+async def run_pipeline(client, config: dict, raw_store: RawStore, sheets_task=None) -> int:
+    """Один проход сбора: хвост канала с курсора → хранилище и архив →
+    Original data и Groups. sheets_task — заранее запущенный open_sheets
+    (None — таблица открывается, только когда есть что писать). Возвращает
+    число принятых сообщений."""
+    store_empty = not len(raw_store)
+    cache = None
+    counters = None
+    raw_sheet_task = None
+    archive_task = None
+    try:
+        last_id = read_last_id()
+        logging.info(f"Последний обработанный ID: {last_id}")
+        sheets = None
+        if store_empty:
+            # Пустое хранилище сначала заполняется из вкладки, потом — новым
+            sheets = await (sheets_task or open_sheets(config, store_empty))
+            sheets_task = None
+            spreadsheet, snapshot, sheet_raw, sheet_groups, group_rows_all, category_rules = sheets
+            seeded = raw_store.seed(snapshot.values(RAW_SHEET_TITLE))
+            logging.info(f"Хранилище сырых логов заполнено из вкладки: {seeded} строк")
+        # Долгий архив (сжатые файлы по дням) — сверх 35 дней хранилища
+        raw_archive = None
+        archive_days = config.get('raw_archive_days', RAW_ARCHIVE_RETENTION_DAYS)
+        if archive_days:
+            try:
+                raw_archive = RawArchive(retention_days=archive_days)
+                raw_archive.expire()
+            except OSError as e:
+                logging.warning(f"Архив сырых логов недоступен: {e}")
+
+        # Догрузка по возрастанию id страницами: каждая страница склеивается,
+        # пишется в хранилище и архив, и только потом сдвигается курсор —
+        # всплеск больше страницы или простой не теряют сообщений
+        chain_state = read_chain_state()
+        message_count = text_count = row_count = 0
+        async with contextlib.aclosing(fetch_pages(client, int(config['chat_id']), last_id)) as pages:
+            async for page in pages:
+                batch = []
+                for m in page:
+                    text = m.message.replace('\n', ' ') if m.message else ''
+                    if text.strip():
+                        text_count += 1
+                    batch.append({'id': m.id, 'date': m.date.strftime('%Y-%m-%d %H:%M:%S'), 'text': text})
+                # Цепочки разрезанных сообщений склеиваются при приёме: хвост, пришедший
+                # в следующей пачке, приклеивается к голове из прошлой
+                stitched, extended, chain_state['chain'] = stitch_batch(batch, chain_state['chain'])
+                if extended is not None:
+                    chain_state['pending'][str(extended['id'])] = {'date': extended['date'], 'text': extended['text']}
+                # Новые сообщения (и дополненные хвостами головы) — сначала в хранилище
+                ingested = [[r['id'], r['date'], r['text']] for r in stitched] + [
+                    [int(head_id), chain['date'], chain['text']] for head_id, chain in chain_state['pending'].items()]
+                raw_store.put(ingested)
+                if raw_archive is not None:
+                    try:
+                        raw_archive.put(ingested)
+                    except OSError as e:
+                        logging.warning(f"Архив сырых логов недоступен: {e}")
+                        raw_archive = None
+                save_last_id(page[-1].id)
+                save_chain_state(chain_state)
+                message_count += len(page)
+                row_count += len(stitched)
+                logging.info(f"Страница истории: {len(page)} сообщений, курсор {page[-1].id}")
+                left = remaining()
+                if left is not None and left < CATCHUP_RESERVE_SEC:
+                    # Остаток хвоста — в следующий запуск (курсор уже сохранён)
+                    logging.warning(f"Догрузка остановлена по бюджету запуска на id {page[-1].id}")
+                    break
+        if not message_count:
+            logging.info("Новых сообщений нет.")
+            return 0
+        logging.info(
+            f"Добавлено сообщений: {message_count} | Текстовых: {text_count} | "
+            f"Строк после склейки: {row_count}")
+        if text_count == 0:
+            logging.warning("В новых сообщениях нет текстов.")
+            return message_count
+        if sheets is None:
+            sheets = await (sheets_task or open_sheets(config, store_empty))
+            sheets_task = None
+            spreadsheet, snapshot, sheet_raw, sheet_groups, group_rows_all, category_rules = sheets
+
+        # Окно 30 дней читаем локально; вкладка — проекция хранилища для людей:
+        # дописываем новое, правим дополненные головы, подрезаем протухший префикс
+        raw_store.expire()
+        cutoff = datetime.now() - timedelta(days=30)
+        window_rows = raw_store.rows(since=cutoff)
+        sheet_ids = [row[:2] for row in snapshot.values(RAW_SHEET_TITLE)]
+        plan = plan_sheet_sync(sheet_ids, window_rows, chain_state['pending'], cutoff)
+        # Новые строки дописываются в фоне, пока считаются группы;
+        # sleep(0) отдаёт управление задаче, чтобы запрос ушёл сейчас
+        raw_sheet_task = asyncio.create_task(sync_raw_sheet(sheet_raw, plan))
+        await asyncio.sleep(0)
+        # Удаление префикса и патчи голов уходят вместе с правками Groups двумя
+        # запросами: структура обеих вкладок одним batchUpdate, затем все
+        # значения одним values.batchUpdate (см. write_tabs)
+        raw_requests = []
+        if plan['expired']:
+            # Строки 2..expired+1 (индексы API — с нуля, конец не включается)
+            raw_requests.append({'deleteDimension': {'range': {
+                'sheetId': sheet_raw.id, 'dimension': 'ROWS',
+                'startIndex': 1, 'endIndex': 1 + plan['expired']}}})
+        # Номера строк — уже после удаления префикса
+        raw_updates = [(f"'{sheet_raw.title}'!C{row - plan['expired']}", [[text]])
+                       for row, text in plan['patches']]
+        if plan['rewrite']:
+            logging.warning(f"Original data: во вкладке нет головы из окна — "
+                            f"перезапись целиком ({len(plan['append'])} строк)")
+        else:
+            logging.info(f"Original data: дописано {len(plan['append'])}, дополнено голов "
+                         f"{len(plan['patches'])}, удалено протухших {plan['expired']}")
+        # Головы, дополненные хвостами: их вклад в счётчики пересчитывается
+        # (pending очищается после записи патчей в вкладку)
+        changed_ids = {int(head_id) for head_id in chain_state['pending']}
         logs_data = []
-        for row in rows_to_keep[1:]:  # пропускаем заголовок
+        for row in window_rows:
             if len(row) < 3:
                 continue
             try:
@@ -505,127 +724,186 @@ async def main():
                 logging.warning(f"Ошибка при разборе строки: {row} | {e}")
 
         # Анализируем все логи (со склейкой цепочек внутри count_and_aggregate)
-        error_data = count_and_aggregate(logs_data)
-
-        # Пересобираем вкладку Groups целиком:
-        # - счётчики свежих групп из error_data;
-        # - группы, не встреченные в 30-дневном окне, получают нулевые счётчики
-        #   (раньше хранили застывшие числа — это враньё в данных);
-        # - ручные колонки (Статус/Вердикт/Срочность/Причина/Действие/Оценено)
-        #   сохраняются как есть;
-        # - группы без появлений дольше RETENTION_DAYS уезжают в Archive.
-        group_rows_all = await retry_gspread(sheet_groups.get_all_values)
-        # Колонки читаем ПО ИМЕНАМ: порядок колонок менялся (ID переехал в начало),
-        # позиционное чтение затирало бы ручные вердикты при переходе.
-        old_header = group_rows_all[0] if group_rows_all else []
-        col_idx = {name.strip(): i for i, name in enumerate(old_header) if name.strip()}
-
-        def old_col(row, name):
-            i = col_idx.get(name)
-            return row[i].strip() if i is not None and len(row) > i else ''
-
-        existing_groups = {}  # шаблон -> сохранённые ручные колонки
-        for row in group_rows_all[1:]:
-            pattern = old_col(row, 'Ошибка (шаблон)')
-            if not pattern:
-                continue
-            existing_groups[pattern] = {
-                'category': old_col(row, 'Категория'),
-                'last_seen': old_col(row, 'Последнее появление'),
-                'status': old_col(row, 'Статус'),
-                'verdict': old_col(row, 'Вердикт'),
-                'urgency': old_col(row, 'Срочность'),
-                'cause': old_col(row, 'Причина'),
-                'action': old_col(row, 'Действие'),
-                'assessed': old_col(row, 'Оценено'),
-                'acting_since': old_col(row, 'Впервые в действовать'),
-            }
-
-        now_utc = datetime.now(timezone.utc)
-        retention_cutoff = (now_utc - timedelta(days=RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
-
-        final_rows = []
-        archive_rows = []
-        seen_patterns = set()
-
-        def build_row(pattern, counts, last_seen, saved):
-            category = (saved or {}).get('category', '').strip() or extract_category(pattern, category_rules)
-            status = (saved or {}).get('status', '').strip()
-            verdict = (saved or {}).get('verdict', '')
-            if not status:
-                status = 'не обработано' if not verdict.strip() else 'обработано'
-            s = saved or {}
-            # «Впервые в действовать»: ставится в день, когда группа получила
-            # вердикт «действовать», и держится, пока вердикт не сменится.
-            # По ней считается «висит N дней» в блоке 🔁 дайджеста.
-            acting_since = s.get('acting_since', '').strip()
-            if verdict.strip().lower() == 'действовать':
-                acting_since = acting_since or datetime.now().strftime('%Y-%m-%d')
-            else:
-                acting_since = ''
-            return [
-                group_id(pattern), category, pattern,
-                str(counts['1d']), str(counts['7d']), str(counts['30d']), last_seen,
-                status, verdict, s.get('urgency', ''),
-                s.get('cause', ''), s.get('action', ''), s.get('assessed', ''),
-                acting_since,
-            ]
-
-        # Порядок строк: сортировка по «За 1 день» (по требованию владельца).
-        # Ориентир в дайджестах — колонка ID (первая), а не номер строки.
-        zero = {'1d': 0, '7d': 0, '30d': 0}
-        for pattern, saved in existing_groups.items():
-            data = error_data.get(pattern)
-            if data is not None:
-                last_seen_str = data['last_seen'].strftime('%Y-%m-%d %H:%M:%S') if data['last_seen'] else ''
-                final_rows.append(build_row(
-                    pattern, data['counts'],
-                    max(last_seen_str, saved.get('last_seen', '')), saved
-                ))
-                seen_patterns.add(pattern)
-                continue
-            # Не встречалась в окне: счётчики в ноль; совсем протухшая — в архив
-            row = build_row(pattern, zero, saved.get('last_seen', ''), saved)
-            if saved.get('last_seen', '') and saved['last_seen'] < retention_cutoff:
-                archive_rows.append(row)
-            else:
-                final_rows.append(row)
-
-        # Новые группы — вниз, между собой по объёму за 30 дней
-        for pattern, data in sorted(error_data.items(), key=lambda x: x[1]['counts']['30d'], reverse=True):
-            if pattern in seen_patterns or pattern in existing_groups:
-                continue
-            last_seen_str = data['last_seen'].strftime('%Y-%m-%d %H:%M:%S') if data['last_seen'] else ''
-            final_rows.append(build_row(pattern, data['counts'], last_seen_str, None))
-            seen_patterns.add(pattern)
-
-        # Архив: дозаписываем протухшие группы (вердикты сохраняются в истории)
+        # Кэш шаблонов между запусками: нормализуются только новые тексты
+        engine = config.get('normalize_engine')
+        normalize = get_normalizer(engine, guard=config.get('normalize_guard'))
+        cache = open_cache(engine, normalize)
+        # Счётчики групп копятся между запусками: нормализуются только новые логи
+        counters = open_counters(rules_version(engine, getattr(normalize, 'label', '')))
+        miner = TemplateMiner.load() if config.get('template_miner') else None
+        # Groups собран прежними правилами нормализации — карта старый → новый
+        # ключ по сырым текстам окна (до майнера: старые ключи — его прежние шаблоны)
+        rules_migration = None
+        stale_version = cache.stale_groups_version if cache is not None else None
+        if stale_version is not None:
+            rules_migration = build_rules_migration(
+                logs_data, cache, normalize, stale_version, miner=miner,
+                workers=config.get('normalize_workers'))
+        error_data = count_and_aggregate(
+            logs_data, normalize=normalize, cache=cache, miner=miner,
+            workers=config.get('normalize_workers'), counters=counters, changed_ids=changed_ids)
+        if cache is not None:
+            logging.info("Кэш нормализации: попаданий %s, промахов %s", cache.hits, cache.misses)
+        if isinstance(normalize, GuardedNormalizer) and normalize.stats:
+            logging.warning("Защищённая нормализация: превышений бюджета %s, обрезано входов %s",
+                            normalize.stats['overruns'], normalize.stats['truncated'])
+        if miner is not None:
+            miner.save()
+            logging.info("Майнер шаблонов: кластеров %s, обобщено за прогон %s",
+                         len(miner.clusters), len(miner.renamed()))
+
+        # Пересобираем вкладку Groups целиком (правила — в build_group_rows)
+        existing_groups = read_existing_groups(group_rows_all)
+        if rules_migration is not None:
+            existing_groups, report = migrate_groups(existing_groups, rules_migration, normalize)
+            logging.info("Миграция Groups на правила %s (с %s): переименовано %s, разделено %s, "
+                         "слито %s, оставлено под старым ключом %s", cache.version, stale_version,
+                         report['renamed'], report['split'], report['merged'], report['kept'])
+        if miner is not None:
+            existing_groups = remap_groups_to_templates(existing_groups, miner)
+        final_rows, archive_rows, new_count = build_group_rows(
+            error_data, existing_groups, category_rules)
+
+        await raw_sheet_task
+        raw_sheet_task = None
+
+        # Архив: дозаписываем протухшие группы (вердикты сохраняются в истории).
+        # Запись идёт в фоне, пока перечитывается колонка ключей Groups и
+        # строится дифф; сам Groups пишется только после архива — его дифф
+        # удаляет заархивированные строки
         if archive_rows:
-            try:
-                sheet_archive = await retry_gspread(spreadsheet.worksheet, ARCHIVE_SHEET_TITLE)
-            except gspread.exceptions.WorksheetNotFound:
-                sheet_archive = await retry_gspread(
-                    spreadsheet.add_worksheet, title=ARCHIVE_SHEET_TITLE, rows='1000', cols='20')
-                await update_range(spreadsheet, f'{ARCHIVE_SHEET_TITLE}!A1:N1', [GROUPS_HEADER])
-            await retry_gspread(sheet_archive.append_rows, archive_rows)
+            async def append_archive():
+                sheet_archive = snapshot.worksheet(ARCHIVE_SHEET_TITLE)
+                if sheet_archive is None:
+                    sheet_archive = await retry_gspread(
+                        spreadsheet.add_worksheet, title=ARCHIVE_SHEET_TITLE, rows='1000', cols='20')
+                if not snapshot.values(ARCHIVE_SHEET_TITLE):
+                    # Новая или очищенная вручную вкладка — без заголовка
+                    await update_range(spreadsheet, f'{ARCHIVE_SHEET_TITLE}!A1:N1', [GROUPS_HEADER])
+                await retry_gspread(sheet_archive.append_rows, archive_rows)
+
+            archive_task = asyncio.create_task(append_archive())
+            await asyncio.sleep(0)
+
+        # Groups — дифф к прочитанному снимку: перестановки строк и только
+        # изменившиеся ячейки (вердикты триажа, записанные после чтения, не затираются).
+        # Номера строк плана — из снимка: если строки вкладки с тех пор
+        # вставили, удалили или переставили, дифф попал бы не в те строки
+        key_col = GROUPS_HEADER.index('Ошибка (шаблон)')
+        current_keys = await retry_gspread(sheet_groups.col_values, key_col + 1)
+        if same_key_column(group_rows_all, current_keys, key_col):
+            groups_plan = plan_table_update(sheet_groups.id, sheet_groups.title, GROUPS_HEADER,
+                                            group_rows_all, final_rows, key_col)
+        else:
+            logging.warning("Строки Groups изменились после чтения снимка — полная перезапись вместо диффа")
+            groups_plan = None
+        if archive_task is not None:
+            await archive_task
+            archive_task = None
             logging.info(f"В архив перенесено групп: {len(archive_rows)}")
+        if groups_plan is None:
+            # Колонки снимка не совпадают с GROUPS_HEADER или строки сдвинуты —
+            # полная перезапись (архив уже сохранён, потеря невозможна)
+            await write_tabs(spreadsheet, raw_requests, raw_updates)
+            await retry_gspread(sheet_groups.clear)
+            await retry_gspread(sheet_groups.append_rows, [GROUPS_HEADER] + final_rows)
+            logging.info(f"Groups перезаписан: {len(final_rows)} групп (новых: {new_count})")
+        else:
+            await write_tabs(spreadsheet, raw_requests + groups_plan['requests'],
+                             raw_updates + [(item['range'], item['values']) for item in groups_plan['data']])
+            logging.info(f"Groups обновлён: {len(final_rows)} групп (новых: {new_count}), "
+                         f"перестановок строк {groups_plan['moved']}, изменено ячеек {groups_plan['cells']}")
+        if chain_state['pending']:
+            chain_state['pending'] = {}
+            save_chain_state(chain_state)
+        if cache is not None:
+            cache.mark_groups_version()
+        return message_count
+    finally:
+        # Отдельная пересортировка не нужна: Groups перезаписывается
+        # уже отсортированным по "За 30 дней" в основном блоке.
+        if sheets_task is not None:
+            # Ранний выход (нет новых сообщений): снимок не нужен
+            sheets_task.cancel()
+            try:
+                await sheets_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if archive_task is not None:
+            # Прогон упал до записи Groups — архив всё равно доводим
+            try:
+                await archive_task
+            except Exception as e:
+                logging.error(f"Не удалось дописать архив групп: {e}")
+        if raw_sheet_task is not None:
+            # Прогон упал при подсчёте групп — дозапись Original data всё равно доводим
+            try:
+                await raw_sheet_task
+            except Exception as e:
+                logging.error(f"Не удалось дописать Original data: {e}")
+        if cache is not None:
+            cache.close()
+        if counters is not None:
+            counters.close()
+
+
+async def main():
+    config = {}
+    client = None
+    raw_store = None
+    sheets_task = None
+    session_host_path = None
+    tmp_session_file = None
+    try:
+        os.chdir(BASE_DIR)
+        clean_old_logs(LOG_PATH, days=7)
+        with open(CONFIG_PATH, 'r') as f:
+            config = json.load(f)
+        set_deadline(config.get('run_budget_sec', RUN_BUDGET_SEC))
+        session_host_path, tmp_session_name, tmp_session_file = prepare_session_paths(config.get('session_name', 'session'))
+        if not os.path.exists(session_host_path):
+            logging.error(
+                "Файл Telegram-сессии %s не найден. "
+                "Запустите `docker exec telegram-to-sheets-app python -m telethon.sessions` для авторизации.",
+                session_host_path
+            )
+            return
 
-        # Сортировка по «За 1 день», затем по «За 30 дней»
-        d1_i = GROUPS_HEADER.index('За 1 день')
-        d30_i = GROUPS_HEADER.index('За 30 дней')
-        final_rows.sort(key=lambda r: (int(r[d1_i] or 0), int(r[d30_i] or 0)), reverse=True)
+        os.makedirs(os.path.dirname(tmp_session_file), exist_ok=True)
+        shutil.copy2(session_host_path, tmp_session_file)
+
+        # Авторизация в Google, снимок таблицы и подготовка вкладок идут
+        # параллельно с подключением к Telegram и выгрузкой сообщений
+        raw_store = RawStore()
+        store_empty = not len(raw_store)
+        sheets_task = asyncio.create_task(open_sheets(config, store_empty))
 
-        # Полная перезапись Groups (архив уже сохранён, потеря невозможна)
-        await retry_gspread(sheet_groups.clear)
-        await retry_gspread(sheet_groups.append_rows, [GROUPS_HEADER] + final_rows)
-        logging.info(f"Groups перезаписан: {len(final_rows)} групп (новых: "
-                     f"{len(seen_patterns - set(existing_groups))})")
+        telegram_proxy = get_telegram_proxy(config)
+        if telegram_proxy:
+            logging.info("Telegram proxy enabled: %s:%s", telegram_proxy[1], telegram_proxy[2])
 
+        client = await connect_telegram(config, tmp_session_name, telegram_proxy)
+        if not await client.is_user_authorized():
+            logging.error(
+                "Telegram-сессия найдена, но не авторизована. "
+                "Запустите `docker exec telegram-to-sheets-app python -m telethon.sessions` и авторизуйтесь вручную."
+            )
+            return
+        # Дальше задачей владеет run_pipeline (и отменяет её при раннем выходе)
+        task, sheets_task = sheets_task, None
+        await run_pipeline(client, config, raw_store, task)
     except Exception as e:
         logging.error(f"Ошибка в main: {e}", exc_info=True)
     finally:
-        # Отдельная пересортировка не нужна: Groups перезаписывается
-        # уже отсортированным по "За 30 дней" в основном блоке.
+        if sheets_task is not None:
+            # Ранний выход (ошибка Telegram, сессия без авторизации): снимок не нужен
+            sheets_task.cancel()
+            try:
+                await sheets_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if raw_store is not None:
+            raw_store.close()
         if client is not None:
             await client.disconnect()
         if tmp_session_file and session_host_path and os.path.exists(tmp_session_file):
@@ -633,7 +911,17 @@ async def main():
                 shutil.copy2(tmp_session_file, session_host_path)
             except Exception as copy_err:
                 logging.error(f"Не удалось сохранить Telegram-сессию: {copy_err}")
+        logging.info("Повторы запросов к Sheets: %s", metrics_summary())
         logging.info("Скрипт успешно завершил работу.")
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    # Один сборщик на курсор: прогон cron не стартует, пока работает
+    # предыдущий или демон (collector_daemon.py держит тот же lock)
+    lock_file = acquire_lock()
+    if lock_file is None:
+        logging.info("Сборщик уже работает (предыдущий прогон или демон) — пропускаем запуск.")
+        raise SystemExit(0)
+    try:
+        asyncio.run(main())
+    finally:
+        release_lock(lock_file)
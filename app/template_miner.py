@@ -0,0 +1,213 @@
+"""
+Онлайн-майнер шаблонов в стиле Drain поверх normalize_error_pattern.
+
+Регулярные маски превращают в отдельную группу каждую мелкую вариацию
+текста («Account 5 is blocked by admin» / «… by system»). Майнер
+собирает такие вариации в кластер с шаблоном, где различающиеся слова
+заменены на <*>; шаблон кластера становится ключом группы в Groups.
+
+Дерево фиксированной глубины (как в Drain):
+  корень → число токенов → первые DEPTH-2 токена → лист со списком кластеров.
+В листе берётся кластер с максимальным сходством (доля позиций, где
+токен совпал с конкретным токеном шаблона; <*> допускает любой токен, но
+в долю не входит, при равенстве — кластер с большим числом <*>); при
+сходстве ≥ SIM_THRESHOLD сообщение присоединяется к кластеру, иначе
+создаётся новый. Поиск — O(глубина)
+плюс перебор кластеров одного листа.
+
+Токены с цифрами и обратным слешем — различители: после нормализации
+цифры остаются только в защищённых кодах (SQLSTATE[23000], error 28,
+`403 Forbidden`), слеш — в именах классов. Такие токены не обобщаются
+до <*>: расхождение в них запрещает слияние.
+
+Состояние (кластеры и пути к ним) хранится в template_miner.json между
+запусками; дерево восстанавливается из него при загрузке.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+
+BASE_DIR = '/app'
+STATE_PATH = os.path.join(BASE_DIR, 'template_miner.json')
+
+WILDCARD = '<*>'
+DEPTH = 4              # корень + длина + 2 префиксных токена
+SIM_THRESHOLD = 0.7    # консервативно: группы несут ручные вердикты
+MAX_CHILDREN = 100     # потолок ветвления узла, остальное — в <*>
+RETENTION_DAYS = 90    # кластеры без появлений дольше — удаляются (как Archive)
+
+_STATE_VERSION = 1
+_KEY_TOKEN_RE = re.compile(r'[\d\\]')
+
+
+def _today() -> int:
+    return int(time.time() // 86400)
+
+
+def _is_key_token(token: str) -> bool:
+    return token != WILDCARD and _KEY_TOKEN_RE.search(token) is not None
+
+
+class TemplateMiner:
+    def __init__(self, depth: int = DEPTH, sim_threshold: float = SIM_THRESHOLD,
+                 max_children: int = MAX_CHILDREN):
+        self.depth = depth
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.clusters: dict[int, dict] = {}   # id → {'template', 'path', 'size', 'last_day'}
+        self.tree: dict = {}
+        self.next_id = 1
+        # Шаблоны на момент загрузки — чтобы увидеть переименования за прогон
+        self._loaded_templates: dict[int, str] = {}
+
+    # ===== Дерево =====
+
+    def _path(self, tokens: list[str], node: dict | None = None, create: bool = False) -> list[str]:
+        """Путь к листу: токены префикса (цифровые и лишние — как <*>)."""
+        path = []
+        node = self.tree.get(len(tokens), {}) if node is None else node
+        for token in tokens[:self.depth - 2]:
+            key = WILDCARD if any(ch.isdigit() for ch in token) else token
+            if key not in node:
+                if not create and WILDCARD in node:
+                    key = WILDCARD
+                elif create and len(node) >= self.max_children:
+                    key = WILDCARD
+            path.append(key)
+            node = node.get(key, {}) if isinstance(node, dict) else {}
+        return path
+
+    def _leaf(self, length: int, path: list[str], create: bool = False) -> list[int] | None:
+        node = self.tree.setdefault(length, {}) if create else self.tree.get(length)
+        for i, key in enumerate(path):
+            if node is None:
+                return None
+            last = i == len(path) - 1
+            if create:
+                node = node.setdefault(key, [] if last else {})
+            else:
+                node = node.get(key)
+        if not path:
+            # Пустой шаблон/короче префикса — лист прямо под длиной
+            if create:
+                return node.setdefault('', [])
+            return node.get('') if node is not None else None
+        return node
+
+    def _insert(self, cid: int):
+        cluster = self.clusters[cid]
+        leaf = self._leaf(len(cluster['template']), cluster['path'], create=True)
+        leaf.append(cid)
+
+    # ===== Сходство =====
+
+    @staticmethod
+    def _similarity(template: list[str], tokens: list[str]) -> tuple[float, int]:
+        same = params = 0
+        for t, tok in zip(template, tokens):
+            if t == WILDCARD:
+                params += 1
+            elif t == tok:
+                same += 1
+            elif _is_key_token(t) or _is_key_token(tok):
+                return -1.0, 0
+        # Как в Drain: <*> не считается совпадением — иначе каждое обобщение
+        # облегчает следующее и шаблоны расползаются; params — только для
+        # выбора между равными по сходству кластерами
+        return same / max(len(template), 1), params
+
+    def _best(self, tokens: list[str], create: bool) -> int | None:
+        path = self._path(tokens, create=create)
+        leaf = self._leaf(len(tokens), path)
+        best, best_key = None, (self.sim_threshold, -1)
+        for cid in leaf or ():
+            sim, params = self._similarity(self.clusters[cid]['template'], tokens)
+            if (sim, params) >= best_key:
+                best, best_key = cid, (sim, params)
+        return best
+
+    # ===== API =====
+
+    def add(self, pattern: str) -> int:
+        """Присоединяет шаблон к кластеру (или создаёт новый), возвращает id."""
+        tokens = pattern.split()
+        cid = self._best(tokens, create=True)
+        today = _today()
+        if cid is None:
+            cid = self.next_id
+            self.next_id += 1
+            self.clusters[cid] = {'template': tokens, 'path': self._path(tokens, create=True),
+                                  'size': 1, 'last_day': today}
+            self._insert(cid)
+            return cid
+        cluster = self.clusters[cid]
+        cluster['template'] = [t if t == tok else WILDCARD
+                               for t, tok in zip(cluster['template'], tokens)]
+        cluster['size'] += 1
+        cluster['last_day'] = today
+        return cid
+
+    def match(self, pattern: str) -> str | None:
+        """Шаблон подходящего кластера без изменения дерева (для чтения)."""
+        cid = self._best(pattern.split(), create=False)
+        return self.template(cid) if cid is not None else None
+
+    def template(self, cid: int) -> str:
+        return ' '.join(self.clusters[cid]['template'])
+
+    def renamed(self) -> dict[str, str]:
+        """Шаблоны, обобщённые за прогон: старый → текущий."""
+        result = {}
+        for cid, old in self._loaded_templates.items():
+            cluster = self.clusters.get(cid)
+            if cluster is not None and ' '.join(cluster['template']) != old:
+                result[old] = ' '.join(cluster['template'])
+        return result
+
+    # ===== Состояние =====
+
+    @classmethod
+    def load(cls, path: str = STATE_PATH) -> 'TemplateMiner':
+        miner = cls()
+        if not os.path.exists(path):
+            return miner
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logging.error('Ошибка чтения %s: %s — майнер начинает с нуля.', path, e)
+            return miner
+        if state.get('version') != _STATE_VERSION:
+            return miner
+        miner.depth = state.get('depth', miner.depth)
+        miner.sim_threshold = state.get('sim_threshold', miner.sim_threshold)
+        miner.max_children = state.get('max_children', miner.max_children)
+        cutoff = _today() - RETENTION_DAYS
+        for item in sorted(state.get('clusters', []), key=lambda c: c['id']):
+            if item.get('last_day', 0) < cutoff:
+                continue
+            miner.clusters[item['id']] = {
+                'template': item['template'], 'path': item['path'],
+                'size': item.get('size', 1), 'last_day': item.get('last_day', 0),
+            }
+            miner._insert(item['id'])
+            miner._loaded_templates[item['id']] = ' '.join(item['template'])
+        miner.next_id = max(state.get('next_id', 1), max(miner.clusters, default=0) + 1)
+        return miner
+
+    def save(self, path: str = STATE_PATH):
+        state = {
+            'version': _STATE_VERSION,
+            'depth': self.depth,
+            'sim_threshold': self.sim_threshold,
+            'max_children': self.max_children,
+            'next_id': self.next_id,
+            'clusters': [{'id': cid, **cluster} for cid, cluster in self.clusters.items()],
+        }
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
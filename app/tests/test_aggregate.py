@@ -0,0 +1,58 @@
+"""Тесты подсчёта error_data: поштучный и векторный (NumPy) пути.
+
+Запуск: cd app && python3 -m unittest tests.test_aggregate
+"""
+
+import os
+import random
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import aggregate as agg  # noqa: E402
+
+NOW = datetime(2026, 7, 27, 12, 0, tzinfo=timezone.utc)
+
+
+def sample(count: int, seed: int = 7) -> tuple[list[datetime], list[str]]:
+    rnd = random.Random(seed)
+    dates = [datetime(2026, 7, 27, 12) - timedelta(seconds=rnd.randrange(32 * 86400))
+             for _ in range(count)]
+    patterns = [rnd.choice(['A', 'B', 'C', '']) + str(rnd.randrange(5)) if rnd.random() > 0.1 else ''
+                for _ in range(count)]
+    return dates, patterns
+
+
+class TestAggregate(unittest.TestCase):
+    def test_python_windows(self):
+        base = datetime(2026, 7, 27, 12)
+        dates = [base - timedelta(days=1), base - timedelta(days=1, seconds=1),
+                 base - timedelta(days=30), base + timedelta(hours=1), base]
+        data = agg.aggregate_python(dates, ['A', 'A', 'A', 'A', ''], NOW)
+        self.assertEqual(list(data), ['A'])
+        self.assertEqual(data['A']['counts'], {'1d': 2, '7d': 3, '30d': 4})
+        self.assertEqual(data['A']['last_seen'], (base + timedelta(hours=1)).astimezone(timezone.utc))
+
+    def test_small_batches_stay_python(self):
+        dates, patterns = sample(50)
+        self.assertEqual(agg.aggregate(dates, patterns, NOW), agg.aggregate_python(dates, patterns, NOW))
+
+    @unittest.skipIf(agg.np is None, 'NumPy не установлен')
+    def test_numpy_matches_python(self):
+        dates, patterns = sample(5000)
+        self.assertEqual(agg.aggregate_numpy(dates, patterns, NOW),
+                         agg.aggregate_python(dates, patterns, NOW))
+        self.assertEqual(agg.aggregate([], [], NOW, vectorized=True), {})
+
+    @unittest.skipIf(agg.np is None, 'NumPy не установлен')
+    def test_numpy_rejects_aware_dates(self):
+        dates = [datetime(2026, 7, 27, 9, tzinfo=timezone(timedelta(hours=3)))]
+        self.assertIsNone(agg.aggregate_numpy(dates, ['A'], NOW))
+        self.assertEqual(agg.aggregate(dates, ['A'], NOW, vectorized=True),
+                         agg.aggregate_python(dates, ['A'], NOW))
+
+
+if __name__ == '__main__':
+    unittest.main()
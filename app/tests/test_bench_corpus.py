@@ -0,0 +1,59 @@
+"""Тесты генератора синтетического корпуса для бенчмарков.
+
+Запуск: cd app && python3 -m unittest tests.test_bench_corpus
+"""
+
+import logging
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import run as bench_run  # noqa: E402
+from benchmarks.corpus import TELEGRAM_LIMIT, generate_logs, parse_size  # noqa: E402
+from normalize import is_fragment, merge_fragment_chains  # noqa: E402
+
+
+class TestCorpus(unittest.TestCase):
+    def test_deterministic(self):
+        self.assertEqual(generate_logs(500, seed=3), generate_logs(500, seed=3))
+        self.assertNotEqual(generate_logs(500, seed=3), generate_logs(500, seed=4))
+
+    def test_size_and_order(self):
+        logs = generate_logs(2000)
+        self.assertEqual(len(logs), 2000)
+        self.assertEqual([log['id'] for log in logs], list(range(1, 2001)))
+        self.assertTrue(all(a['date'] <= b['date'] for a, b in zip(logs, logs[1:])))
+        self.assertTrue(all(len(log['text']) <= TELEGRAM_LIMIT for log in logs))
+
+    def test_chains_merge_back(self):
+        logs = generate_logs(2000, long_share=0.2)
+        tails = [log for log in logs if is_fragment(log['text'])]
+        self.assertTrue(tails)
+        merged = merge_fragment_chains(logs)
+        self.assertEqual(len(merged), len(logs) - len(tails))
+        self.assertTrue(any(len(m['text']) > TELEGRAM_LIMIT for m in merged))
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('100k'), 100_000)
+        self.assertEqual(parse_size('1M'), 1_000_000)
+        self.assertEqual(parse_size('250'), 250)
+
+
+class TestBenchRun(unittest.TestCase):
+    def test_collector_stages_run_without_touching_logging(self):
+        # Свежий импорт сборщика при ненастроенном логировании: его
+        # basicConfig открыл бы /app/logs/telegram_to_sheets.log
+        with mock.patch.dict(sys.modules), mock.patch.object(logging.root, 'handlers', []):
+            sys.modules.pop('telegram_to_sheets', None)
+            results = bench_run.run(300, seed=1, memory=False)
+            self.assertEqual(logging.root.handlers, [])
+        by_name = {r['bench']: r for r in results}
+        for name in ('count_and_aggregate', 'extract_category', 'build_group_rows'):
+            self.assertNotIn('skipped', by_name[name], name)
+
+
+if __name__ == '__main__':
+    unittest.main()
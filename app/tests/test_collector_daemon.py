@@ -0,0 +1,221 @@
+"""Тесты демона сборщика (без Telegram и Google).
+
+Запуск: cd app && python3 -m unittest tests.test_collector_daemon
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from telethon import events
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Коллектор при импорте пишет лог в /app/logs — в тестах логирование по умолчанию
+with mock.patch('logging.basicConfig'):
+    import collector_daemon  # noqa: E402
+    import telegram_to_sheets as tts  # noqa: E402
+from raw_store import RawStore  # noqa: E402
+
+
+class FakeClient:
+    """Подписка на события и future обрыва, как у TelegramClient."""
+
+    def __init__(self):
+        self.handlers = []
+        self.disconnected = asyncio.get_running_loop().create_future()
+        self.disconnect_calls = 0
+
+    def add_event_handler(self, callback, event):
+        self.handlers.append((callback, event))
+
+    async def new_message(self):
+        for callback, _ in self.handlers:
+            await callback(None)
+
+    async def is_user_authorized(self):
+        return True
+
+    async def disconnect(self):
+        self.disconnect_calls += 1
+
+
+async def wait_for_calls(calls, count):
+    async def poll():
+        while len(calls) < count:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout=5)
+
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        for patcher in (mock.patch.object(collector_daemon, 'clean_old_logs'),
+                        mock.patch.object(collector_daemon, 'set_deadline')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.config = {'chat_id': '-100500'}
+
+    def serve(self, settings, results, scenario):
+        """serve с поддельным run_pipeline (возвращает results по очереди,
+        дальше 0); scenario(client, calls) управляет событиями и обрывом."""
+        calls = []
+
+        async def run_pipeline(client, config, raw_store):
+            calls.append(asyncio.get_running_loop().time())
+            result = results.pop(0) if results else 0
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        async def main():
+            client = FakeClient()
+            with mock.patch.object(collector_daemon, 'run_pipeline', side_effect=run_pipeline):
+                serving = asyncio.create_task(collector_daemon.serve(client, self.config, None, settings))
+                await scenario(client, calls)
+                await asyncio.wait_for(serving, timeout=5)
+            return client
+
+        return asyncio.run(main()), calls
+
+    def test_catchup_on_connect_and_wake_on_event(self):
+        async def scenario(client, calls):
+            await wait_for_calls(calls, 1)   # догрузка сразу после подключения
+            await client.new_message()
+            await wait_for_calls(calls, 3)   # проход по событию и добор хвоста
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(calls), 3)  # без событий до poll_sec — тишина
+            client.disconnected.set_result(None)
+
+        client, calls = self.serve({'batch_sec': 0, 'poll_sec': 60}, [0, 3], scenario)
+        (_, event), = client.handlers
+        self.assertIsInstance(event, events.NewMessage)
+        self.assertEqual(event.chats, -100500)
+        self.assertEqual(len(calls), 3)
+
+    def test_batch_collects_events_into_one_pass(self):
+        async def scenario(client, calls):
+            await wait_for_calls(calls, 1)
+            started = asyncio.get_running_loop().time()
+            for _ in range(5):
+                await client.new_message()
+            await wait_for_calls(calls, 2)
+            self.assertGreaterEqual(calls[1] - started, 0.1)
+            await asyncio.sleep(0.15)
+            self.assertEqual(len(calls), 2)
+            client.disconnected.set_result(None)
+
+        self.serve({'batch_sec': 0.1, 'poll_sec': 60}, [], scenario)
+
+    def test_poll_without_events(self):
+        async def scenario(client, calls):
+            await wait_for_calls(calls, 3)
+            client.disconnected.set_result(None)
+
+        _, calls = self.serve({'batch_sec': 0, 'poll_sec': 0.05}, [], scenario)
+        self.assertGreaterEqual(calls[2] - calls[1], 0.04)
+
+    def test_failed_pass_keeps_serving(self):
+        async def scenario(client, calls):
+            await wait_for_calls(calls, 2)
+            client.disconnected.set_result(None)
+
+        with self.assertLogs(level='ERROR'):
+            _, calls = self.serve({'batch_sec': 0, 'poll_sec': 0.05}, [RuntimeError('Sheets 503')], scenario)
+        self.assertGreaterEqual(len(calls), 2)
+
+    def test_disconnect_stops_serving_while_waiting(self):
+        async def scenario(client, calls):
+            await wait_for_calls(calls, 1)
+            client.disconnected.set_exception(ConnectionError('proxy reset'))
+
+        with self.assertLogs(level='WARNING') as logs:
+            _, calls = self.serve({'batch_sec': 0, 'poll_sec': 60}, [], scenario)
+        self.assertEqual(len(calls), 1)
+        self.assertIn('proxy reset', logs.output[-1])
+
+
+class TestRun(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.host_session = os.path.join(self.tmp.name, 'session.session')
+        self.tmp_session = os.path.join(self.tmp.name, 'tmp', 'session.session')
+        with open(self.host_session, 'w') as f:
+            f.write('host')
+        store_path = os.path.join(self.tmp.name, 'raw.sqlite')
+        for patcher in (
+                mock.patch.object(collector_daemon, 'prepare_session_paths',
+                                  return_value=(self.host_session, 'tmp_session', self.tmp_session)),
+                mock.patch.object(collector_daemon, 'get_telegram_proxy', return_value=None),
+                mock.patch.object(collector_daemon, 'RawStore', side_effect=lambda: RawStore(store_path)),
+                mock.patch.object(collector_daemon.random, 'uniform', return_value=0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reconnects_with_backoff_reset_after_success(self):
+        clients = []
+
+        async def connect_telegram(config, tmp_session_name, telegram_proxy):
+            attempt = len(clients)
+            clients.append(None)
+            if attempt in (0, 1):
+                raise ConnectionError('proxy down')
+            if attempt == 2:
+                clients[-1] = FakeClient()
+                return clients[-1]
+            raise asyncio.CancelledError()  # docker stop
+
+        async def serve(client, config, raw_store, settings):
+            with open(self.tmp_session, 'w') as f:
+                f.write('updated')
+
+        sleeps = []
+
+        async def sleep(delay):
+            sleeps.append(delay)
+
+        with mock.patch.object(collector_daemon, 'connect_telegram', side_effect=connect_telegram), \
+                mock.patch.object(collector_daemon, 'serve', side_effect=serve), \
+                mock.patch.object(collector_daemon.asyncio, 'sleep', side_effect=sleep), \
+                self.assertLogs(level='INFO'):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(collector_daemon.run({}, {'batch_sec': 0, 'poll_sec': 60}))
+        delays = collector_daemon.RECONNECT_DELAYS_SEC
+        self.assertEqual(sleeps, [delays[0], delays[1], delays[0]])
+        self.assertEqual(clients[2].disconnect_calls, 1)
+        with open(self.host_session) as f:
+            self.assertEqual(f.read(), 'updated')
+
+
+class TestCollectorLock(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'collector.lock')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cron_run_skipped_while_daemon_holds_lock(self):
+        daemon = tts.acquire_lock(self.path)
+        self.assertIsNotNone(daemon)
+        try:
+            self.assertIsNone(tts.acquire_lock(self.path))
+        finally:
+            tts.release_lock(daemon)
+        cron = tts.acquire_lock(self.path)
+        self.assertIsNotNone(cron)
+        tts.release_lock(cron)
+
+    def test_daemon_and_cron_share_lock(self):
+        self.assertIs(collector_daemon.acquire_lock, tts.acquire_lock)
+        self.assertEqual(tts.acquire_lock.__defaults__, (tts.LOCK_PATH,))
+
+
+if __name__ == '__main__':
+    unittest.main()
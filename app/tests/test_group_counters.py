@@ -0,0 +1,103 @@
+"""Тесты хранилища счётчиков групп по часовым корзинам.
+
+Запуск: cd app && python3 -m unittest tests.test_group_counters
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from group_counters import GroupCounters  # noqa: E402
+
+NOW = datetime(2026, 7, 27, 12, 30, tzinfo=timezone.utc)
+
+
+def ago(**kwargs) -> datetime:
+    return (NOW - timedelta(**kwargs)).replace(tzinfo=None)
+
+
+class TestGroupCounters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'counters.sqlite')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_windows(self):
+        store = GroupCounters(self.path, 'v1')
+        self.assertIsNone(store.last_id)
+        store.add([(1, 0, 'A', ago(days=20)), (2, 0, 'A', ago(days=3)),
+                   (3, 0, 'A', ago(hours=2)), (4, 0, 'B', ago(days=40)), (5, 0, '', ago(hours=1))])
+        counts = store.counts(NOW)
+        self.assertEqual(counts['A']['counts'], {'1d': 1, '7d': 2, '30d': 3})
+        self.assertEqual(counts['A']['last_seen'], ago(hours=2).astimezone(timezone.utc))
+        self.assertNotIn('B', counts)
+        self.assertEqual(store.last_id, 5)
+        store.close()
+
+    def test_last_seen_is_local_time_like_baseline(self):
+        # Прежний коллектор: log['date'].astimezone(timezone.utc) — naive-дата
+        # сообщения считается местным временем (TZ контейнера — Москва)
+        old_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Europe/Moscow'
+        time.tzset()
+        try:
+            store = GroupCounters(self.path, 'v1')
+            date = datetime(2026, 7, 27, 10, 0)
+            store.add([(1, 0, 'A', date)])
+            last_seen = store.counts(NOW)['A']['last_seen']
+            baseline = date.astimezone(timezone.utc)
+            store.close()
+        finally:
+            if old_tz is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = old_tz
+            time.tzset()
+        self.assertEqual(last_seen, baseline)
+        self.assertEqual(last_seen.strftime('%Y-%m-%d %H:%M:%S'), '2026-07-27 07:00:00')
+
+    def test_incremental_equals_full(self):
+        entries = [(i, 0, f'P{i % 3}', ago(hours=i * 7)) for i in range(1, 100)]
+        full = GroupCounters(os.path.join(self.tmp.name, 'full.sqlite'), 'v1')
+        full.add(entries)
+        store = GroupCounters(self.path, 'v1')
+        for i in range(0, len(entries), 10):
+            store.add(entries[i:i + 10])
+        self.assertEqual(store.counts(NOW), full.counts(NOW))
+
+    def test_readd_replaces_contribution(self):
+        store = GroupCounters(self.path, 'v1')
+        store.add([(1, 0, 'head only', ago(hours=1))])
+        # Цепочка дополнена хвостом: тот же id, другой шаблон и второй лог
+        store.add([(1, 0, 'head with tail', ago(hours=1)), (1, 1, 'glued next', ago(hours=1))])
+        store.add([(1, 0, 'head with tail', ago(hours=1)), (1, 1, 'glued next', ago(hours=1))])
+        counts = store.counts(NOW)
+        self.assertEqual(set(counts), {'head with tail', 'glued next'})
+        self.assertEqual(counts['head with tail']['counts']['30d'], 1)
+
+    def test_expire(self):
+        store = GroupCounters(self.path, 'v1')
+        store.add([(1, 0, 'old', ago(days=32)), (2, 0, 'new', ago(days=1))])
+        store.expire(NOW)
+        (groups,) = store.conn.execute('SELECT COUNT(*) FROM groups').fetchone()
+        (messages,) = store.conn.execute('SELECT COUNT(*) FROM messages').fetchone()
+        self.assertEqual((groups, messages), (1, 1))
+
+    def test_version_change_resets(self):
+        store = GroupCounters(self.path, 'v1')
+        store.add([(1, 0, 'A', ago(hours=1))])
+        store.close()
+        store = GroupCounters(self.path, 'v2')
+        self.assertIsNone(store.last_id)
+        self.assertEqual(store.counts(NOW), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
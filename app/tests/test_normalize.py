@@ -4,13 +4,19 @@
 или:    cd app && python3 -m unittest tests.test_normalize
 """
 
+import ast
 import os
 import sys
 import unittest
+from unittest import mock
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from normalize import is_fragment, merge_fragment_chains, normalize_error_pattern  # noqa: E402
+import normalize  # noqa: E402
+from normalize import (  # noqa: E402
+    _HEAD_RE, _mask_json, get_normalizer, is_fragment, iter_merged_logs, merge_fragment_chains,
+    normalize_error_pattern, normalize_many, stitch_batch, tokenize_error_pattern,
+)
 
 
 class TestMerging(unittest.TestCase):
@@ -145,6 +151,23 @@ class TestMergingJsonClasses(unittest.TestCase):
         self.assertEqual(normalize_error_pattern(a), normalize_error_pattern(b))
 
 
+class TestJsonCollapse(unittest.TestCase):
+    def test_braces_inside_strings(self):
+        self.assertEqual(_mask_json('x {"msg":"bad } here {"} tail'), 'x {}tail')
+        self.assertEqual(_mask_json('a {"k":"\\"}"} b'), 'a {}b')
+
+    def test_unbalanced_fragments(self):
+        self.assertEqual(_mask_json('x {"a":{"b":1}, "c": 2'), 'x {"a":{}"c": 2')
+        self.assertEqual(_mask_json('x } y {"a":1}, {"b":2}; z'), 'x } y {}z')
+        self.assertEqual(_mask_json('x {"a":"unterminated } y'), 'x {}y')
+
+    def test_deep_nesting(self):
+        body = '{"id":1}'
+        for level in range(50):
+            body = f'{{"f{level}":[{body},{body}],"n":{body}}}' if level < 3 else f'{{"n":{body}}}'
+        self.assertEqual(_mask_json(f'error: {body} tail'), 'error: {}tail')
+
+
 class TestGuzzleStatus(unittest.TestCase):
     def test_http_status_kept(self):
         a = "production.ERROR: Client error: `GET https://x/y?id=1` resulted in a `403 Forbidden` response:"
@@ -184,6 +207,24 @@ class TestFragments(unittest.TestCase):
         ]:
             self.assertFalse(is_fragment(head), head)
 
+    def test_agrees_with_full_normalization(self):
+        # Классификатор по началу текста обязан совпадать с исходным
+        # определением «заголовок в начале нормализованного шаблона»
+        def by_full_pattern(text):
+            return not text or _HEAD_RE.search(normalize_error_pattern(text)[:80]) is None
+
+        prefixes = ['', '  ', '[ ', '[2026-07-27T09:00:00.317859+03:00] ',
+                    '[2026-07-27 09:00:00] ', '26T14:59:20.317859 +03:00] ']
+        for raw in TestTokenizerEngine.corpus():
+            for prefix in prefixes:
+                for text in (prefix + raw, prefix + raw[:30]):
+                    self.assertEqual(is_fragment(text), by_full_pattern(text), text)
+
+    def test_long_tail_is_cheap(self):
+        text = '"x":1,' * 200_000 + ' production.ERROR: late'
+        self.assertTrue(is_fragment(text))
+        self.assertFalse(is_fragment('production.ERROR: head ' + '{"a":1}' * 200_000))
+
 
 class TestFragmentChains(unittest.TestCase):
     def test_chain_merged(self):
@@ -225,6 +266,90 @@ class TestFragmentChains(unittest.TestCase):
         self.assertEqual(len(merged), 1)
         self.assertEqual(merged[0]['text'], 'production.ERROR: head {}')
 
+    def test_streaming_yields_closed_chains_early(self):
+        def feed():
+            yield {'id': 1, 'date': 'd', 'text': 'production.ERROR: first {"a":'}
+            yield {'id': 2, 'date': 'd', 'text': '1}'}
+            yield {'id': 3, 'date': 'd', 'text': 'production.ERROR: second'}
+            raise AssertionError('прочитано дальше, чем нужно')
+
+        stream = iter_merged_logs(feed())
+        self.assertEqual(next(stream)['text'], 'production.ERROR: first {"a":1}')
+
+    def test_streaming_requires_id_order(self):
+        logs = [{'id': 2, 'date': 'd', 'text': 'production.ERROR: a'},
+                {'id': 1, 'date': 'd', 'text': 'production.ERROR: b'}]
+        with self.assertRaises(ValueError):
+            list(iter_merged_logs(logs))
+        self.assertEqual(len(merge_fragment_chains(logs)), 2)
+
+    def test_duplicated_rows_do_not_abort(self):
+        # Строки, дописанные во вкладку дважды (повтор append_rows после таймаута)
+        head = {'id': 1, 'date': 'd', 'text': 'production.ERROR: first {"a":'}
+        tail = {'id': 2, 'date': 'd', 'text': '1}'}
+        other = {'id': 3, 'date': 'd', 'text': 'production.ERROR: second'}
+        logs = [head, tail, other, head, tail, other]
+        expected = ['production.ERROR: first {"a":1}', 'production.ERROR: second']
+        self.assertEqual([m['text'] for m in merge_fragment_chains(logs)], expected)
+        streamed = iter_merged_logs([head, head, tail, tail, other, other])
+        self.assertEqual([m['text'] for m in streamed], expected)
+
+    def test_long_chain_joined(self):
+        part = 'x' * 4000
+        logs = [{'id': 1, 'date': 'd', 'text': 'production.ERROR: head '}]
+        logs += [{'id': i, 'date': 'd', 'text': part} for i in range(2, 2002)]
+        merged = merge_fragment_chains(logs)
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(len(merged[0]['text']), len('production.ERROR: head ') + 2000 * 4000)
+
+
+class TestStitchBatch(unittest.TestCase):
+    """Склейка при приёме: цепочка, разрезанная границей запуска."""
+
+    HEAD = {'id': 10, 'date': 'd', 'text': 'production.ERROR: Client error: `GET https://x?ids=1;2;'}
+    TAIL = {'id': 11, 'date': 'd', 'text': '3;4` resulted in a `403 Forbidden` response:'}
+    NEXT = {'id': 12, 'date': 'd', 'text': 'production.WARNING: other {}'}
+
+    def test_chain_across_batches(self):
+        rows, extended, chain = stitch_batch([self.HEAD])
+        self.assertEqual(rows, [self.HEAD])
+        self.assertIsNone(extended)
+        self.assertEqual(chain['id'], 10)
+
+        rows, extended, chain = stitch_batch([self.TAIL, self.NEXT], chain)
+        self.assertEqual(rows, [self.NEXT])
+        self.assertEqual(extended['id'], 10)
+        self.assertEqual(extended['text'], self.HEAD['text'] + self.TAIL['text'])
+        self.assertEqual(chain['id'], 12)
+        # Тот же результат, что и склейка всего окна
+        merged = merge_fragment_chains([self.HEAD, self.TAIL, self.NEXT])
+        self.assertEqual([extended['text'], rows[0]['text']], [m['text'] for m in merged])
+
+    def test_chain_inside_batch_is_one_row(self):
+        rows, extended, chain = stitch_batch([self.HEAD, self.TAIL])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['text'], self.HEAD['text'] + self.TAIL['text'])
+        self.assertEqual(chain['parts'], 2)
+        self.assertIsNone(extended)
+        self.assertNotIn(self.TAIL['text'], self.HEAD['text'])  # вход не изменён
+
+    def test_orphans_and_empty_kept(self):
+        orphan = dict(self.TAIL, id=30)
+        empty = {'id': 11, 'date': 'd', 'text': ''}
+        rows, extended, chain = stitch_batch([self.HEAD, empty, orphan])
+        self.assertEqual([r['id'] for r in rows], [10, 11, 30])
+        self.assertIsNone(chain)
+        rows, extended, chain = stitch_batch([orphan], {'id': 10, 'date': 'd', 'parts': 1, 'text': 'x'})
+        self.assertEqual(rows, [orphan])
+        self.assertIsNone(extended)
+
+    def test_cell_limit(self):
+        tails = [{'id': i, 'date': 'd', 'text': 'x' * 40} for i in range(11, 14)]
+        rows, _, chain = stitch_batch([self.HEAD] + tails, cell_limit=150)
+        self.assertEqual([r['id'] for r in rows], [10, 13])
+        self.assertLessEqual(len(rows[0]['text']), 150)
+        self.assertTrue(chain['full'])
+
 
 class TestStability(unittest.TestCase):
     def test_idempotent(self):
@@ -237,5 +362,58 @@ class TestStability(unittest.TestCase):
         self.assertEqual(normalize_error_pattern(None), '')
 
 
+class TestTokenizerEngine(unittest.TestCase):
+    """Однопроходный движок обязан давать тот же шаблон, что и regex-каскад."""
+
+    @staticmethod
+    def corpus():
+        # Корпус — все строковые литералы этого файла (примеры логов выше)
+        with open(__file__, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        return [n.value for n in ast.walk(tree)
+                if isinstance(n, ast.Constant) and isinstance(n.value, str)]
+
+    def test_same_output_on_corpus(self):
+        for raw in self.corpus():
+            for text in (raw, normalize_error_pattern(raw)):
+                self.assertEqual(tokenize_error_pattern(text), normalize_error_pattern(text), text)
+
+    def test_nested_and_unbalanced_json(self):
+        for text in [
+            'production.ERROR: x {"a":{"b":{"c":1}}}, {"d":2}; tail 5',
+            'production.ERROR: truncated {"a":{"b":1}, "c": SQLSTATE[HY000] 7',
+            'production.ERROR: stray } brace {"e":"App\\Exceptions\\FooException"}',
+            'SQLSTATE[23000]: dup (Connection: mysql, SQL: insert {"App\\Jobs\\X": 1})',
+        ]:
+            self.assertEqual(tokenize_error_pattern(text), normalize_error_pattern(text), text)
+
+    def test_engine_switch(self):
+        self.assertIs(get_normalizer(None), normalize_error_pattern)
+        self.assertIs(get_normalizer('tokenizer'), tokenize_error_pattern)
+        with self.assertRaises(ValueError):
+            get_normalizer('nope')
+
+
+class TestNormalizeMany(unittest.TestCase):
+    def test_serial_small_batch(self):
+        texts = TestTokenizerEngine.corpus()
+        self.assertEqual(normalize_many(texts, workers=4),
+                         [normalize_error_pattern(t) for t in texts])
+
+    def test_pool_preserves_order(self):
+        texts = [f'production.ERROR: Order {i} failed {{"id":{i}}} App\\Jobs\\Job{i % 7}'
+                 for i in range(6000)]
+        for engine in (normalize_error_pattern, tokenize_error_pattern):
+            self.assertEqual(normalize_many(texts, workers=2, normalize=engine),
+                             [normalize_error_pattern(t) for t in texts])
+
+    def test_pool_does_not_fork(self):
+        # Пул поднимается, пока работают потоки с запросами к Sheets
+        texts = [f'production.ERROR: Order {i} failed' for i in range(6000)]
+        with mock.patch('normalize.ProcessPoolExecutor', wraps=normalize.ProcessPoolExecutor) as pool:
+            normalize_many(texts, workers=2)
+        self.assertNotEqual(pool.call_args.kwargs['mp_context'].get_start_method(), 'fork')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,148 @@
+"""Тесты постоянного кэша нормализации.
+
+Запуск: cd app && python3 -m unittest tests.test_normalize_cache
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import normalize_cache  # noqa: E402
+from normalize import FALLBACK_MARK, GuardedNormalizer, normalize_error_pattern  # noqa: E402
+from normalize_cache import NormalizeCache  # noqa: E402
+
+
+class CountingNormalizer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return normalize_error_pattern(text)
+
+
+class SlowOnceNormalizer(CountingNormalizer):
+    """Первый вызов не укладывается в бюджет (занятая машина), дальше — быстро."""
+
+    def __call__(self, text):
+        self.calls += 1
+        if self.calls == 1:
+            started = time.process_time()
+            while time.process_time() - started < 0.1:
+                pass
+        return normalize_error_pattern(text)
+
+
+class TestNormalizeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_second_run_hits_cache(self):
+        texts = ['production.ERROR: Order 1 failed', 'production.ERROR: Order 2 failed', '']
+        norm = CountingNormalizer()
+        cache = NormalizeCache(self.path)
+        first = cache.lookup(texts, norm)
+        cache.close()
+        self.assertEqual(first, [normalize_error_pattern(t) for t in texts])
+        self.assertEqual(norm.calls, 3)
+
+        cache = NormalizeCache(self.path)
+        second = cache.lookup(texts + ['production.ERROR: new one'], norm)
+        cache.close()
+        self.assertEqual(second[:3], first)
+        self.assertEqual(norm.calls, 4)  # нормализован только новый текст
+
+    def test_duplicates_normalized_once(self):
+        norm = CountingNormalizer()
+        cache = NormalizeCache(self.path)
+        cache.lookup(['same 1'] * 5, norm)
+        cache.close()
+        self.assertEqual(norm.calls, 1)
+
+    def test_version_change_invalidates(self):
+        norm = CountingNormalizer()
+        cache = NormalizeCache(self.path)
+        cache.lookup(['text 1'], norm)
+        cache.close()
+        with mock.patch.object(normalize_cache, 'RULES_VERSION', 'other'):
+            cache = NormalizeCache(self.path)
+            cache.lookup(['text 1'], norm)
+            cache.close()
+        self.assertEqual(norm.calls, 2)
+
+    def test_version_change_keeps_history(self):
+        cache = NormalizeCache(self.path)
+        cache.lookup(['Order 1 failed'], normalize_error_pattern)
+        cache.mark_groups_version()
+        old_version = cache.version
+        self.assertIsNone(cache.stale_groups_version)
+        cache.close()
+        with mock.patch.object(normalize_cache, 'RULES_VERSION', 'other'):
+            cache = NormalizeCache(self.path)
+            self.assertEqual(cache.stale_groups_version, old_version)
+            self.assertEqual(cache.previous_patterns(['Order 1 failed', 'new'], old_version),
+                             ['Order <num> failed', None])
+            cache.mark_groups_version()
+            self.assertIsNone(cache.stale_groups_version)
+            self.assertEqual(cache.previous_patterns(['Order 1 failed'], old_version), [None])
+            cache.close()
+
+    def test_unmarked_groups_migrate_from_previous_version(self):
+        cache = NormalizeCache(self.path)
+        cache.lookup(['text 1'], normalize_error_pattern)
+        old_version = cache.version
+        cache.close()
+        with mock.patch.object(normalize_cache, 'RULES_VERSION', 'other'):
+            cache = NormalizeCache(self.path)
+            self.assertEqual(cache.stale_groups_version, old_version)
+            cache.close()
+
+    def test_lru_eviction(self):
+        cache = NormalizeCache(self.path, max_rows=2)
+        with mock.patch.object(normalize_cache, '_today', return_value=100):
+            cache.lookup(['old'], normalize_error_pattern)
+        with mock.patch.object(normalize_cache, '_today', return_value=101):
+            cache.lookup(['a', 'b'], normalize_error_pattern)
+            cache.evict()
+        keys = {row[0] for row in cache.conn.execute('SELECT pattern FROM patterns')}
+        cache.conn.close()
+        self.assertEqual(keys, {'a', 'b'})
+
+    def test_age_eviction(self):
+        cache = NormalizeCache(self.path, max_age_days=5)
+        with mock.patch.object(normalize_cache, '_today', return_value=100):
+            cache.lookup(['old'], normalize_error_pattern)
+        with mock.patch.object(normalize_cache, '_today', return_value=110):
+            cache.evict()
+        (count,) = cache.conn.execute('SELECT COUNT(*) FROM patterns').fetchone()
+        cache.conn.close()
+        self.assertEqual(count, 0)
+
+    def test_fallback_patterns_are_not_cached(self):
+        text = 'production.ERROR: Order 1 failed'
+        guarded = GuardedNormalizer(SlowOnceNormalizer(), budget_ms=20)
+        cache = NormalizeCache(self.path, guard=guarded.label)
+        first = cache.lookup([text], guarded)
+        cache.close()
+        self.assertTrue(first[0].endswith(FALLBACK_MARK))
+
+        cache = NormalizeCache(self.path, guard=guarded.label)
+        second = cache.lookup([text], guarded)
+        third = cache.lookup([text], guarded)
+        cache.close()
+        self.assertEqual(second, [normalize_error_pattern(text)])
+        self.assertEqual(third, second)
+        self.assertEqual(cache.misses, 1)  # после пересчёта — уже из кэша
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Фазз-тесты времени нормализации на худших для регулярок входах.
+
+Для каждого шаблона из _PROTECT_RE и _MASKS — «почти совпадающие» звенья,
+повторённые до лимита длины защищённого режима: длинные прогоны без
+завершающего символа, незакрытые скобки и т.п. Время должно оставаться
+линейным — ни одна маска не должна перебирать прогон заново с каждой позиции.
+
+Запуск: cd app && python3 -m unittest tests.test_normalize_fuzz
+"""
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import normalize  # noqa: E402
+from normalize import (  # noqa: E402
+    _MASKS, _PROTECT_RE, FALLBACK_MARK, GUARD_MAX_CHARS, GuardedNormalizer, get_normalizer,
+    normalize_error_pattern, normalize_many, tokenize_error_pattern,
+)
+
+# Запас на медленную машину CI: линейный проход по 20 КБ — миллисекунды,
+# квадратичный — секунды.
+REGEX_LIMIT_S = 0.5
+NORMALIZE_LIMIT_S = 1.5
+
+# Звенья худших входов: по списку на каждый шаблон, в порядке _PROTECT_RE + _MASKS
+WORST_UNITS = [
+    # _PROTECT_RE
+    ['SQLSTATE[', 'SQLSTATE[1234567', 'SQLSTATE'],
+    ['error ', 'error :=', 'code 1234', 'HTTP'],
+    ['A\\', 'A\\a', 'Ab_\\1', 'A\\B\\'],
+    ['`1', '`123 ', '`123' + 'x' * 40, '` 404'],
+    # _MASKS
+    ['(Connection: ', '(Connection'],
+    ['2026-07-26 ', '2026-07-26T03:40:1', '1-1-1 1:1:1.', '2026-07-26 03:40:11.'],
+    ['2026-07-', '1111-11-1', '2026-'],
+    ['11:1', '1:11:', '11:11:1'],
+    ['a', 'a.', 'a@', 'x@a', 'a+*-', 'a@a-', '@a.'],
+    ['a1b2c3d4-', 'ffffffff-ffff-ffff-ffff-', 'f-'],
+    ['f', 'a0', 'ffff-'],
+    ['a1', 'a', '1', 'Z9_'],
+    ['.php:', '.php', 'x.php:1.'],
+    ['a_', 'a-', 'ab_1a', 'aa1'],
+    ['1.', '1.1.', '.1'],
+    ['1', '1-', '1a'],
+]
+
+
+def worst_inputs(units: list[str], length: int = GUARD_MAX_CHARS, seed: int = 7):
+    """Повторы каждого звена до length и случайная смесь звеньев."""
+    for unit in units:
+        yield unit * (length // len(unit))
+    rnd = random.Random(seed)
+    mixed, size = [], 0
+    while size < length:
+        mixed.append(rnd.choice(units))
+        size += len(mixed[-1])
+    yield ''.join(mixed)[:length]
+
+
+class TestWorstCaseRegex(unittest.TestCase):
+    def test_every_pattern_covered(self):
+        self.assertEqual(len(WORST_UNITS), len(_PROTECT_RE) + len(_MASKS))
+
+    def test_patterns_linear(self):
+        patterns = list(_PROTECT_RE) + [rx for rx, _ in _MASKS]
+        for rx, units in zip(patterns, WORST_UNITS):
+            for text in worst_inputs(units):
+                started = time.perf_counter()
+                rx.sub('', text)
+                elapsed = time.perf_counter() - started
+                self.assertLess(elapsed, REGEX_LIMIT_S, f'{rx.pattern} на {text[:40]!r}')
+
+    def test_engines_bounded(self):
+        for engine in (normalize_error_pattern, tokenize_error_pattern):
+            guarded = GuardedNormalizer(engine)
+            for units in WORST_UNITS:
+                for text in worst_inputs(units):
+                    started = time.perf_counter()
+                    guarded(text)
+                    elapsed = time.perf_counter() - started
+                    self.assertLess(elapsed, NORMALIZE_LIMIT_S, f'{engine.__name__} на {text[:40]!r}')
+
+
+def _catastrophic(text: str) -> str:
+    """Нормализатор с экспоненциальным откатом на 'aaa…b'."""
+    re.match(r'(?:a|aa)+$', text)
+    return normalize_error_pattern(text)
+
+
+class TestGuardedNormalizer(unittest.TestCase):
+    def test_same_as_engine_within_budget(self):
+        guarded = get_normalizer('tokenizer', guard=True)
+        text = 'production.ERROR: Order 123 failed {"a":1} App\\Jobs\\SyncJob'
+        self.assertEqual(guarded(text), tokenize_error_pattern(text))
+        self.assertEqual(guarded(''), '')
+        self.assertFalse(guarded.stats)
+
+    def test_overrun_falls_back_to_prefix(self):
+        guarded = GuardedNormalizer(_catastrophic, budget_ms=50)
+        text = 'a' * 40 + 'b'
+        started = time.perf_counter()
+        result = guarded(text)
+        self.assertLess(time.perf_counter() - started, NORMALIZE_LIMIT_S)
+        self.assertTrue(result.endswith(FALLBACK_MARK))
+        self.assertEqual(guarded.stats['overruns'], 1)
+
+    def test_overrun_outside_main_thread(self):
+        def slow(text):
+            started = time.process_time()
+            while time.process_time() - started < 0.1:
+                pass
+            return text
+
+        guarded = GuardedNormalizer(slow, budget_ms=20)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(guarded('production.ERROR: x')))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, ['production.ERROR: x' + FALLBACK_MARK])
+        self.assertEqual(guarded.stats['overruns'], 1)
+
+    def test_long_input_truncated(self):
+        guarded = GuardedNormalizer(normalize_error_pattern, max_chars=100)
+        text = 'production.ERROR: head ' + 'tail ' * 1000
+        self.assertEqual(guarded(text), normalize_error_pattern(text[:100]))
+        self.assertEqual(guarded.stats['truncated'], 1)
+
+    def test_pool_returns_stats(self):
+        guarded = GuardedNormalizer(normalize_error_pattern, max_chars=20)
+        texts = [f'production.ERROR: Order {i} failed' for i in range(60)]
+        with mock.patch.object(normalize, 'PARALLEL_MIN_BATCH', 10), \
+                mock.patch.object(normalize, 'CHUNK_SIZE', 20):
+            result = normalize_many(texts, workers=2, normalize=guarded)
+        self.assertEqual(result, [normalize_error_pattern(t[:20]) for t in texts])
+        self.assertEqual(guarded.stats['truncated'], 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""Тесты архива сырых сообщений по дням.
+
+Запуск: cd app && python3 -m unittest tests.test_raw_archive
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from raw_archive import INDEX_FILE, RawArchive  # noqa: E402
+
+
+class TestRawArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_day_files_and_index(self):
+        archive = RawArchive(self.path)
+        archive.put([[10, '2025-06-01 23:59:00', 'a'], [11, '2025-06-02 00:01:00', 'b']])
+        archive.put([[12, '2025-06-02 10:00:00', 'c']])
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['2025-06-01.jsonl.gz', '2025-06-02.jsonl.gz', INDEX_FILE])
+        self.assertEqual(archive.index['2025-06-02'], {'min_id': 11, 'max_id': 12, 'count': 2})
+        # Индекс переживает переоткрытие, а потерянный — восстанавливается по файлам
+        self.assertEqual(RawArchive(self.path).index, archive.index)
+        os.remove(os.path.join(self.path, INDEX_FILE))
+        self.assertEqual(RawArchive(self.path).index, archive.index)
+
+    def test_range_read_keeps_latest_version(self):
+        archive = RawArchive(self.path)
+        archive.put([[1, '2025-06-01 08:00:00', 'head'], [2, '2025-06-01 09:00:00', 'x'],
+                     [3, '2025-06-03 09:00:00', 'y']])
+        archive.put([[1, '2025-06-01 08:00:00', 'head + tail']])
+        records = list(archive.iter_records(datetime(2025, 6, 1, 8, 30), datetime(2025, 6, 3)))
+        self.assertEqual([r['id'] for r in records], [2])
+        records = list(archive.iter_records())
+        self.assertEqual([(r['id'], r['text']) for r in records],
+                         [(1, 'head + tail'), (2, 'x'), (3, 'y')])
+        self.assertEqual(archive.find(1)['text'], 'head + tail')
+        self.assertIsNone(archive.find(99))
+
+    def test_truncated_member_is_tolerated(self):
+        archive = RawArchive(self.path)
+        archive.put([[1, '2025-06-01 08:00:00', 'ok']])
+        with open(os.path.join(self.path, '2025-06-01.jsonl.gz'), 'ab') as f:
+            f.write(gzip.compress(b'{"id": 2, "date": "2025-06-01 09:00:00", "text": "lost"}\n')[:20])
+        self.assertEqual([r['id'] for r in archive.iter_records()], [1])
+        archive.put([[3, '2025-06-01 10:00:00', 'after crash']])
+        self.assertEqual([r['id'] for r in archive.iter_records()], [1, 3])
+
+    def test_expire(self):
+        archive = RawArchive(self.path, retention_days=30)
+        archive.put([[1, '2025-01-01 00:00:00', 'old'], [2, '2025-06-01 00:00:00', 'new']])
+        self.assertEqual(archive.expire(now=datetime(2025, 6, 15)), 1)
+        self.assertEqual(archive.days(), ['2025-06-01'])
+        self.assertFalse(os.path.exists(os.path.join(self.path, '2025-01-01.jsonl.gz')))
+
+
+if __name__ == '__main__':
+    unittest.main()
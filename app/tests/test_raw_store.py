@@ -0,0 +1,118 @@
+"""Тесты локального хранилища сырых логов.
+
+Запуск: cd app && python3 -m unittest tests.test_raw_store
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from raw_store import RawStore, plan_sheet_sync, read_original_rows  # noqa: E402
+
+
+def stamp(**ago) -> str:
+    return (datetime.now() - timedelta(**ago)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class FakeSpreadsheet:
+    """Вкладка Original data: только get_all_values."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def worksheet(self, title):
+        return self
+
+    def get_all_values(self):
+        self.reads += 1
+        return self.rows
+
+
+class TestRawStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'raw.sqlite')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_is_idempotent_and_ordered(self):
+        store = RawStore(self.path)
+        store.put([[12, stamp(hours=1), 'production.ERROR: b'], [10, stamp(hours=2), 'production.ERROR: a']])
+        store.put([[10, stamp(hours=2), 'production.ERROR: a + tail']])
+        self.assertEqual(len(store), 2)
+        self.assertEqual([r[0] for r in store.rows()], ['10', '12'])
+        self.assertEqual(store.rows()[0][2], 'production.ERROR: a + tail')
+
+    def test_window_and_expire(self):
+        store = RawStore(self.path)
+        store.put([[1, stamp(days=40), 'old'], [2, stamp(days=31), 'edge'], [3, stamp(days=1), 'new']])
+        self.assertEqual([r[2] for r in store.rows(since=datetime.now() - timedelta(days=30))], ['new'])
+        self.assertEqual(store.expire(35), 1)
+        self.assertEqual(len(store), 2)
+
+    def test_seed_skips_header_and_junk(self):
+        store = RawStore(self.path)
+        seeded = store.seed([['ID', 'Дата', 'Текст'], ['5', stamp(hours=1), 'x'], ['', '', ''], ['7', stamp(hours=1)]])
+        self.assertEqual(seeded, 2)
+        self.assertEqual(store.rows()[1], ['7', store.rows()[1][1], ''])
+
+    def test_read_prefers_store(self):
+        sheet = FakeSpreadsheet([['ID', 'Дата', 'Текст'], ['1', stamp(hours=1), 'from sheet']])
+        self.assertEqual(read_original_rows(sheet, path=self.path), sheet.rows[1:])
+        store = RawStore(self.path)
+        store.put([[2, stamp(hours=1), 'from store']])
+        store.close()
+        self.assertEqual([r[2] for r in read_original_rows(sheet, path=self.path)], ['from store'])
+        self.assertEqual(sheet.reads, 1)
+
+
+class TestPlanSheetSync(unittest.TestCase):
+    CUTOFF = datetime.now() - timedelta(days=30)
+
+    def test_trims_prefix_and_appends_new(self):
+        sheet = [['ID', 'Дата'], ['1', stamp(days=32)], ['2', stamp(days=31)], ['3', stamp(days=2)]]
+        store = [['3', sheet[3][1], 'c'], ['4', stamp(hours=1), 'd']]
+        plan = plan_sheet_sync(sheet, store, {}, self.CUTOFF)
+        self.assertEqual(plan, {'header': False, 'patches': [], 'append': [[4, store[1][1], 'd']],
+                                'expired': 2, 'rewrite': False})
+
+    def test_bad_date_stops_prefix(self):
+        sheet = [['ID', 'Дата'], ['1', stamp(days=32)], ['2', 'вчера'], ['3', stamp(days=31)]]
+        self.assertEqual(plan_sheet_sync(sheet, [], {}, self.CUTOFF)['expired'], 1)
+
+    def test_pending_heads(self):
+        sheet = [['ID', 'Дата'], ['1', stamp(days=32)], ['5', stamp(days=1)], ['9', stamp(hours=1)]]
+        pending = {'1': {'date': 'd', 'text': 'expired'}, '5': {'date': 'd', 'text': 'head+tail'},
+                   '3': {'date': stamp(days=31), 'text': 'lost expired head'}}
+        plan = plan_sheet_sync(sheet, [], pending, self.CUTOFF)
+        self.assertFalse(plan['rewrite'])
+        self.assertEqual(plan['patches'], [(3, 'head+tail')])
+        self.assertEqual(plan['append'], [])
+
+    def test_lost_head_in_window_rewrites_sorted(self):
+        # Голова 7 есть в хранилище, но не дошла до вкладки: в конец (после 9)
+        # её дописывать нельзя — вкладка перестала бы быть отсортированной
+        sheet = [['ID', 'Дата'], ['1', stamp(days=32)], ['5', stamp(days=1)], ['9', stamp(hours=1)]]
+        store = [['5', sheet[2][1], 'e'], ['7', stamp(hours=5), 'lost head'], ['9', sheet[3][1], 'f'],
+                 ['10', stamp(minutes=5), 'g']]
+        pending = {'7': {'date': store[1][1], 'text': 'lost head'}}
+        plan = plan_sheet_sync(sheet, store, pending, self.CUTOFF)
+        self.assertTrue(plan['rewrite'])
+        self.assertEqual([row[0] for row in plan['append']], [5, 7, 9, 10])
+        self.assertEqual((plan['header'], plan['patches'], plan['expired']), (False, [], 0))
+
+    def test_empty_sheet_gets_header(self):
+        store = [['4', stamp(hours=1), 'd']]
+        plan = plan_sheet_sync([], store, {}, self.CUTOFF)
+        self.assertTrue(plan['header'])
+        self.assertEqual(plan['append'], [[4, store[0][1], 'd']])
+
+
+if __name__ == '__main__':
+    unittest.main()
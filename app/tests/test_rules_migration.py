@@ -0,0 +1,78 @@
+"""Тесты миграции ключей Groups при смене правил нормализации.
+
+Запуск: cd app && python3 -m unittest tests.test_rules_migration
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from rules_migration import merge_saved, migrate_groups, migration_map  # noqa: E402
+
+
+def saved(verdict='', acting_since='', last_seen='2026-07-20 10:00:00', action=''):
+    return {'category': '', 'last_seen': last_seen, 'status': 'обработано' if verdict else '',
+            'verdict': verdict, 'urgency': '', 'cause': '', 'action': action,
+            'assessed': '', 'acting_since': acting_since}
+
+
+class TestRulesMigration(unittest.TestCase):
+    def test_unaffected_groups_untouched(self):
+        groups = {'A': saved('игнорировать')}
+        result, report = migrate_groups(groups, migration_map(['A', 'A'], ['A', 'A']))
+        self.assertEqual(result, groups)
+        self.assertFalse(report)
+
+    def test_rename(self):
+        groups = {'old': saved('действовать', '2026-07-01', action='чинить')}
+        result, report = migrate_groups(groups, migration_map(['old'], ['new']))
+        self.assertEqual(list(result), ['new'])
+        self.assertEqual(result['new']['action'], 'чинить')
+        self.assertEqual(report['renamed'], 1)
+
+    def test_split_copies_columns(self):
+        groups = {'old': saved('понаблюдать')}
+        result, report = migrate_groups(groups, migration_map(['old'] * 3, ['x', 'y', 'x']))
+        self.assertEqual(set(result), {'x', 'y'})
+        self.assertEqual(result['x']['verdict'], 'понаблюдать')
+        self.assertEqual(result['y']['verdict'], 'понаблюдать')
+        self.assertEqual(report['split'], 1)
+
+    def test_merge_keeps_strictest_verdict(self):
+        groups = {
+            'a': saved('игнорировать', last_seen='2026-07-25 00:00:00'),
+            'b': saved('действовать', '2026-07-10', action='чинить'),
+            'c': saved('действовать', '2026-07-05'),
+        }
+        mapping = migration_map(['a'] * 10 + ['b', 'b', 'c'], ['n'] * 13)
+        result, report = migrate_groups(groups, mapping)
+        self.assertEqual(list(result), ['n'])
+        self.assertEqual(result['n']['verdict'], 'действовать')
+        self.assertEqual(result['n']['action'], 'чинить')           # b весомее c
+        self.assertEqual(result['n']['acting_since'], '2026-07-05')  # самая ранняя
+        self.assertEqual(result['n']['last_seen'], '2026-07-25 00:00:00')
+        self.assertEqual(report['merged'], 1)
+
+    def test_existing_key_has_priority(self):
+        groups = {'new': saved('игнорировать'), 'old': saved('действовать')}
+        mapping = migration_map(['new', 'old'], ['new', 'new'])
+        result, report = migrate_groups(groups, mapping)
+        self.assertEqual(result['new']['verdict'], 'игнорировать')
+        self.assertEqual(result['old']['verdict'], 'действовать')
+        self.assertEqual(report['kept'], 1)
+
+    def test_groups_outside_window_renormalized(self):
+        groups = {'Order <num> failed': saved('игнорировать'), 'stable': saved()}
+        result, _ = migrate_groups(groups, {}, renormalize=lambda p: p.replace('<num>', '<id>'))
+        self.assertEqual(set(result), {'Order <id> failed', 'stable'})
+
+    def test_merge_saved_without_acting(self):
+        merged = merge_saved([(saved('понаблюдать'), 1), (saved(''), 5)])
+        self.assertEqual(merged['verdict'], 'понаблюдать')
+        self.assertEqual(merged['acting_since'], '')
+
+
+if __name__ == '__main__':
+    unittest.main()
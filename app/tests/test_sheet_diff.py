@@ -0,0 +1,112 @@
+"""Тесты дифф-записи вкладок (Groups).
+
+Запуск: cd app && python3 -m unittest tests.test_sheet_diff
+"""
+
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sheet_diff import col_letter, plan_table_update, same_key_column  # noqa: E402
+
+HEADER = ['ID', 'Шаблон', 'За 1 день', 'Вердикт']
+
+
+def apply_plan(snapshot: list[list[str]], plan: dict) -> list[list[str]]:
+    """Семантика Sheets API на списке строк."""
+    grid = [list(row) for row in snapshot]
+    for request in plan['requests']:
+        (kind, body), = request.items()
+        if kind == 'deleteDimension':
+            del grid[body['range']['startIndex']:body['range']['endIndex']]
+        elif kind == 'insertDimension':
+            grid.insert(body['range']['startIndex'], [''] * len(HEADER))
+        elif kind == 'moveDimension':
+            src, dest = body['source']['startIndex'], body['destinationIndex']
+            row = grid.pop(src)
+            grid.insert(dest - 1 if src < dest else dest, row)
+    for item in plan['data']:
+        m = re.fullmatch(r"'[^']+'!([A-Z]+)(\d+):([A-Z]+)\d+", item['range'])
+        first = [col_letter(i) for i in range(26)].index(m.group(1))
+        row = grid[int(m.group(2)) - 1]
+        row[first:first + len(item['values'][0])] = item['values'][0]
+    return grid
+
+
+def table(keys, counts=None, verdicts=None):
+    return [[f'id{k}', f'pattern {k}', str((counts or {}).get(k, 0)), (verdicts or {}).get(k, '')]
+            for k in keys]
+
+
+class TestSheetDiff(unittest.TestCase):
+    def plan(self, snapshot, new_rows):
+        plan = plan_table_update(7, 'Groups', HEADER, snapshot, new_rows, key_col=1)
+        self.assertEqual(apply_plan(snapshot, plan), [HEADER] + new_rows)
+        return plan
+
+    def test_unchanged_writes_nothing(self):
+        rows = table(range(5))
+        plan = self.plan([HEADER] + rows, rows)
+        self.assertEqual((plan['requests'], plan['data']), ([], []))
+
+    def test_counter_change_is_one_cell(self):
+        old = table(range(5))
+        new = table(range(5), counts={3: 9})
+        plan = self.plan([HEADER] + old, new)
+        self.assertEqual(plan['requests'], [])
+        self.assertEqual(plan['data'], [{'range': "'Groups'!C5:C5", 'values': [['9']]}])
+
+    def test_verdict_from_snapshot_not_rewritten(self):
+        old = table(range(3), verdicts={1: 'игнорировать'})
+        new = table([1, 0, 2], counts={1: 5}, verdicts={1: 'игнорировать'})
+        plan = self.plan([HEADER] + old, new)
+        self.assertEqual(plan['moved'], 1)
+        self.assertFalse(any(item['range'].startswith("'Groups'!D") for item in plan['data']))
+
+    def test_archive_new_and_reorder(self):
+        old = table(range(8))
+        new = table([7, 0, 1, 9, 3, 2, 5, 6], counts={9: 1})  # 4 → архив, 9 — новая
+        plan = self.plan([HEADER] + old, new)
+        self.assertEqual(sum('deleteDimension' in r for r in plan['requests']), 1)
+        self.assertEqual(plan['moved'], 3)  # 7 и 2 переехали, 9 вставлена
+
+    def test_random_permutations(self):
+        rnd = random.Random(5)
+        for _ in range(200):
+            old_keys = rnd.sample(range(30), rnd.randint(0, 15))
+            new_keys = rnd.sample(range(30), rnd.randint(0, 15))
+            old = table(old_keys + old_keys[:1])  # с дублем
+            new = table(new_keys, counts={k: rnd.randint(0, 3) for k in new_keys})
+            self.plan([HEADER] + old, new)
+
+    def test_header_mismatch_needs_full_rewrite(self):
+        self.assertIsNone(plan_table_update(7, 'Groups', HEADER, [], [], key_col=1))
+        self.assertIsNone(plan_table_update(7, 'Groups', HEADER, [['ID', 'Другое']], [], key_col=1))
+
+
+class TestSameKeyColumn(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = [HEADER] + table(range(4)) + [['', '', '', '']]
+
+    def column(self, keys):
+        return ['Шаблон'] + [f'pattern {k}' for k in keys]
+
+    def test_unchanged(self):
+        self.assertTrue(same_key_column(self.snapshot, self.column(range(4)), key_col=1))
+        self.assertTrue(same_key_column(self.snapshot, self.column(range(4)) + ['', None], key_col=1))
+
+    def test_manual_edits_are_detected(self):
+        for keys in ([0, 1, 'new', 2, 3], [0, 2, 3], [1, 0, 2, 3], [0, 1, 2, 3, 4]):
+            self.assertFalse(same_key_column(self.snapshot, self.column(keys), key_col=1), keys)
+
+    def test_empty_row_in_the_middle(self):
+        column = self.column(range(4))
+        self.assertFalse(same_key_column(self.snapshot, column[:2] + [''] + column[2:], key_col=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
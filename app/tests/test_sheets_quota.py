@@ -0,0 +1,110 @@
+"""Тесты общей квоты Sheets и очереди записи.
+
+Запуск: cd app && python3 -m unittest tests.test_sheets_quota
+"""
+
+import inspect
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gspread  # noqa: E402
+
+from sheets_quota import reserve  # noqa: E402
+from sheets_write_queue import WriteQueue  # noqa: E402
+
+
+class TestReserve(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'quota.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def take(self, now, kind='write'):
+        return reserve(kind, path=self.path, now=now, per_minute=60, burst=3)
+
+    def test_burst_then_paced(self):
+        self.assertEqual([self.take(100.0) for _ in range(3)], [0, 0, 0])
+        # Ведро пусто: каждый следующий ждёт на секунду дольше (в долг)
+        self.assertEqual([self.take(100.0) for _ in range(3)], [1.0, 2.0, 3.0])
+        self.assertEqual(self.take(104.0), 0.0)
+
+    def test_window_never_exceeds_quota(self):
+        # 200 запросов сразу: за любые 60 с уходит не больше burst + per_minute
+        starts = sorted(100.0 + self.take(100.0) for _ in range(200))
+        for i, start in enumerate(starts):
+            in_window = sum(1 for s in starts[i:] if s < start + 60)
+            self.assertLessEqual(in_window, 63)
+
+    def test_buckets_are_separate_and_shared_via_file(self):
+        for _ in range(3):
+            self.take(100.0, 'write')
+        self.assertEqual(self.take(100.0, 'read'), 0)
+        # Другой «процесс» видит то же состояние
+        self.assertEqual(reserve('write', path=self.path, now=100.0, per_minute=60, burst=3), 1.0)
+
+
+class FakeSpreadsheet:
+    """Сигнатуры — как у gspread.Spreadsheet (5.x): тело values_batch_update
+    вторым параметром, после params."""
+
+    def __init__(self):
+        self.sent = []
+
+    def values_batch_update(self, params=None, body=None):
+        self.sent.append(('values', params, body))
+
+    def batch_update(self, body):
+        self.sent.append(('requests', None, body))
+
+
+class TestWriteQueue(unittest.TestCase):
+    def test_coalesces_runs_in_order(self):
+        sheet = FakeSpreadsheet()
+        queue = WriteQueue(sheet)
+        queue.request({'deleteDimension': 1})
+        queue.request({'moveDimension': 2}, {'insertDimension': 3})
+        queue.update("'Groups'!D2", [['1']])
+        queue.update("'Groups'!E2", [['2']])
+        queue.update("'Groups'!D2", [['3']])
+        queue.request({'deleteDimension': 4})
+        calls = queue.drain()
+        self.assertEqual([method.__name__ for method, _ in calls],
+                         ['batch_update', 'values_batch_update', 'batch_update'])
+        self.assertEqual(len(calls[0][1]['body']['requests']), 3)
+        self.assertEqual(calls[1][1]['body']['data'], [{'range': "'Groups'!D2", 'values': [['3']]},
+                                               {'range': "'Groups'!E2", 'values': [['2']]}])
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.drain(), [])
+
+    def test_body_is_passed_by_keyword(self):
+        # Позиционное тело у values_batch_update попадает в params
+        sheet = FakeSpreadsheet()
+        queue = WriteQueue(sheet)
+        queue.request({'deleteDimension': 1})
+        queue.update("'Groups'!D2", [['1']])
+        for method, kwargs in queue.drain():
+            method(**kwargs)
+        self.assertEqual([kind for kind, _, _ in sheet.sent], ['requests', 'values'])
+        for kind, params, body in sheet.sent:
+            self.assertIsNone(params)
+            self.assertIn('requests' if kind == 'requests' else 'data', body)
+
+    def test_kwargs_bind_to_gspread_signature(self):
+        queue = WriteQueue(FakeSpreadsheet())
+        queue.update("'Groups'!D2", [['1']])
+        queue.request({'deleteDimension': 1})
+        for method, kwargs in queue.drain():
+            real = getattr(gspread.Spreadsheet, method.__name__)
+            bound = inspect.signature(real).bind(None, **kwargs)
+            self.assertIs(bound.arguments['body'], kwargs['body'])
+            self.assertIsNone(bound.arguments.get('params'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Тесты политики повторов запросов к Sheets.
+
+Запуск: cd app && python3 -m unittest tests.test_sheets_retry
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gspread  # noqa: E402
+
+import sheets_retry  # noqa: E402
+from sheets_retry import CircuitOpenError, call_gspread  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+        self.text = f'error {status}'
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': self.text}}
+
+
+def api_error(status, **headers):
+    return gspread.exceptions.APIError(FakeResponse(status, headers))
+
+
+class Flaky:
+    """Падает заданными ошибками, потом возвращает 'ok'."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.__name__ = 'flaky'
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        sheets_retry.METRICS.clear()
+        sheets_retry._breakers.clear()
+        sheets_retry.set_deadline(None)
+        self.sleeps = []
+
+        async def fake_sleep(seconds):
+            self.sleeps.append(seconds)
+
+        patcher = mock.patch.object(sheets_retry.asyncio, 'sleep', fake_sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(sheets_retry.set_deadline, None)
+
+    def test_retry_after_is_honoured(self):
+        func = Flaky(api_error(429, **{'Retry-After': '7'}), api_error(503))
+        self.assertEqual(call_gspread(func), 'ok')
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(self.sleeps[0], 7.0)
+        self.assertLess(self.sleeps[1], sheets_retry.QUOTA_MIN_WAIT)
+        self.assertEqual(sheets_retry.METRICS['retries.flaky'], 2)
+
+    def test_quota_without_hint_waits_at_least_floor(self):
+        call_gspread(Flaky(api_error(429)))
+        self.assertGreaterEqual(self.sleeps[0], sheets_retry.QUOTA_MIN_WAIT)
+
+    def test_programming_and_permanent_errors_are_not_retried(self):
+        for error in (KeyError('x'), TypeError('bad'), api_error(400)):
+            func = Flaky(error)
+            with self.assertRaises(type(error)):
+                call_gspread(func)
+            self.assertEqual(func.calls, 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_deadline_stops_retrying(self):
+        sheets_retry.set_deadline(5)
+        func = Flaky(api_error(429))
+        with self.assertRaises(gspread.exceptions.APIError):
+            call_gspread(func)
+        self.assertEqual(func.calls, 1)
+        self.assertEqual(sheets_retry.METRICS['deadline_exceeded'], 1)
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        func = Flaky(*[api_error(503)] * sheets_retry.BREAKER_THRESHOLD)
+        with self.assertRaises(gspread.exceptions.APIError):
+            call_gspread(func, retries=sheets_retry.BREAKER_THRESHOLD)
+        with self.assertRaises(CircuitOpenError):
+            call_gspread(func)
+        self.assertEqual(func.calls, sheets_retry.BREAKER_THRESHOLD)
+        # После остывания — пробный вызов, успех замыкает предохранитель
+        sheets_retry._breakers['flaky']['open_until'] = 0.0
+        self.assertEqual(call_gspread(func), 'ok')
+        self.assertEqual(sheets_retry._breakers['flaky']['failures'], 0)
+
+    def test_runs_sync_calls_off_loop(self):
+        async def main():
+            worker = await sheets_retry.retry_gspread(threading.get_ident)
+            return worker, threading.get_ident()
+
+        worker, loop_thread = asyncio.run(main())
+        self.assertNotEqual(worker, loop_thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
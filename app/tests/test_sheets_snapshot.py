@@ -0,0 +1,76 @@
+"""Тесты снимка таблицы (метаданные + values.batchGet).
+
+Запуск: cd app && python3 -m unittest tests.test_sheets_snapshot
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sheets_snapshot import a1_range, load_snapshot  # noqa: E402
+
+
+class FakeSpreadsheet:
+    """Таблица: вкладки {title: rows}; считает запросы к API."""
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.calls = []
+
+    def fetch_sheet_metadata(self, params=None):
+        self.calls.append('metadata')
+        return {'sheets': [{'properties': {'sheetId': i, 'title': title, 'index': i}}
+                           for i, title in enumerate(self.sheets)]}
+
+    def values_batch_get(self, ranges, params=None):
+        self.calls.append(('batchGet', list(ranges)))
+        value_ranges = []
+        for a1 in ranges:
+            title, _, cols = a1.partition('!')
+            rows = self.sheets[title[1:-1].replace("''", "'")]
+            if cols:
+                width = ord(cols.split(':')[-1][0]) - ord('A') + 1
+                rows = [row[:width] for row in rows]
+            value_ranges.append({'range': a1, 'values': rows} if rows else {'range': a1})
+        return {'valueRanges': value_ranges}
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_a1_range_quotes_title(self):
+        self.assertEqual(a1_range('Original data', 'A:B'), "'Original data'!A:B")
+        self.assertEqual(a1_range("Bob's"), "'Bob''s'")
+
+    def test_single_batch_with_projection(self):
+        sheet = FakeSpreadsheet({
+            'Original data': [['ID', 'Дата', 'Текст'], ['1', '2025-01-01 00:00:00', 'long text']],
+            'Groups': [['ID', 'Категория'], ['1', 'db']],
+            'Bob\'s': [['x']],
+        })
+        snapshot = load_snapshot(sheet, {'Original data': 'A:B', 'Groups': None,
+                                         'Categories': 'A:C', "Bob's": None})
+        self.assertEqual(sheet.calls, ['metadata', ('batchGet', [
+            "'Original data'!A:B", "'Groups'", "'Bob''s'"])])
+        self.assertEqual(snapshot.values('Original data')[1], ['1', '2025-01-01 00:00:00'])
+        self.assertEqual(snapshot.values('Groups'), [['ID', 'Категория'], ['1', 'db']])
+        self.assertEqual(snapshot.values("Bob's"), [['x']])
+
+    def test_missing_and_empty_sheets(self):
+        sheet = FakeSpreadsheet({'Archive': []})
+        snapshot = load_snapshot(sheet, {'Archive': 'A1:N1', 'Groups': None})
+        self.assertTrue(snapshot.has('Archive'))
+        self.assertFalse(snapshot.has('Groups'))
+        self.assertEqual(snapshot.values('Archive'), [])
+        self.assertEqual(snapshot.values('Groups'), [])
+        self.assertIsNone(snapshot.worksheet('Groups'))
+        self.assertEqual(snapshot.sheet_id('Archive'), 0)
+
+    def test_no_batch_when_nothing_exists(self):
+        sheet = FakeSpreadsheet({})
+        load_snapshot(sheet, {'Groups': None})
+        self.assertEqual(sheet.calls, ['metadata'])
+
+
+if __name__ == '__main__':
+    unittest.main()
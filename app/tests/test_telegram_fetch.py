@@ -0,0 +1,63 @@
+"""Тесты постраничной догрузки истории Telegram.
+
+Запуск: cd app && python3 -m unittest tests.test_telegram_fetch
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from telegram_fetch import fetch_pages  # noqa: E402
+
+
+class FakeClient:
+    """iter_messages по возрастанию id, как Telethon с reverse=True."""
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self.calls = []
+
+    async def iter_messages(self, chat_id, min_id=0, reverse=False, wait_time=None):
+        self.calls.append({'min_id': min_id, 'reverse': reverse})
+        for message_id in self.ids:
+            if message_id > min_id:
+                yield SimpleNamespace(id=message_id)
+
+
+def collect(client, min_id, page_size, stop_after=None):
+    async def main():
+        pages = []
+        async for page in fetch_pages(client, 1, min_id, page_size=page_size, wait_time=0):
+            pages.append([m.id for m in page])
+            if stop_after and len(pages) == stop_after:
+                break
+        return pages
+
+    return asyncio.run(main())
+
+
+class TestFetchPages(unittest.TestCase):
+    def test_burst_larger_than_page_is_fetched_in_order(self):
+        client = FakeClient(range(1, 1201))
+        pages = collect(client, 0, page_size=500)
+        self.assertEqual([len(p) for p in pages], [500, 500, 200])
+        self.assertEqual(sum(pages, []), list(range(1, 1201)))
+        self.assertTrue(client.calls[0]['reverse'])
+
+    def test_interrupted_catchup_resumes_from_checkpoint(self):
+        client = FakeClient(range(1, 26))
+        first = collect(client, 0, page_size=10, stop_after=1)
+        cursor = first[-1][-1]
+        rest = collect(client, cursor, page_size=10)
+        self.assertEqual(sum(first + rest, []), list(range(1, 26)))
+
+    def test_nothing_new(self):
+        self.assertEqual(collect(FakeClient([1, 2, 3]), 3, page_size=10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,308 @@
+"""Тесты коллектора telegram_to_sheets.py (без Telegram и Google).
+
+Запуск: cd app && python3 -m unittest tests.test_telegram_to_sheets
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Модуль при импорте пишет лог в /app/logs — в тестах логирование по умолчанию
+with mock.patch('logging.basicConfig'):
+    import telegram_to_sheets as tts  # noqa: E402
+from raw_store import RAW_SHEET_TITLE, RawStore  # noqa: E402
+from sheets_retry import set_deadline  # noqa: E402
+
+
+class FakeMiner:
+    def __init__(self, renamed=None, matches=None):
+        self._renamed = renamed or {}
+        self._matches = matches or {}
+
+    def renamed(self):
+        return dict(self._renamed)
+
+    def match(self, pattern):
+        return self._matches.get(pattern)
+
+
+class TestRemapGroupsToTemplates(unittest.TestCase):
+    def test_colliding_rows_keep_strictest_verdict(self):
+        existing = {
+            'sync failed reason <*>': {'verdict': 'игнорировать', 'last_seen': '2026-07-01 10:00:00'},
+            'sync failed reason timeout': {'verdict': 'действовать', 'acting_since': '2026-06-20',
+                                           'last_seen': '2026-07-03 10:00:00'},
+            'sync failed reason blocked': {'verdict': 'понаблюдать', 'last_seen': '2026-07-02 10:00:00'},
+        }
+        miner = FakeMiner(matches={p: 'sync failed reason <*>' for p in existing})
+        result = tts.remap_groups_to_templates(existing, miner)
+        self.assertEqual(list(result), ['sync failed reason <*>'])
+        merged = result['sync failed reason <*>']
+        self.assertEqual(merged['verdict'], 'действовать')
+        self.assertEqual(merged['acting_since'], '2026-06-20')
+        self.assertEqual(merged['last_seen'], '2026-07-03 10:00:00')
+
+    def test_equal_verdicts_prefer_row_already_on_template(self):
+        existing = {
+            'export failed for <*>': {'verdict': 'понаблюдать', 'reason': 'шаблонная'},
+            'export failed for csv': {'verdict': 'понаблюдать', 'reason': 'старая'},
+        }
+        miner = FakeMiner(renamed={'export failed for csv': 'export failed for <*>'})
+        result = tts.remap_groups_to_templates(existing, miner)
+        self.assertEqual(result, {'export failed for <*>': {'verdict': 'понаблюдать', 'reason': 'шаблонная',
+                                                           'last_seen': ''}})
+
+    def test_unmatched_rows_keep_their_key(self):
+        existing = {'a': {'verdict': ''}, 'b': {'verdict': 'игнорировать'}}
+        self.assertEqual(tts.remap_groups_to_templates(existing, FakeMiner()), existing)
+
+
+class FakeSpreadsheet:
+    """Записывает вызовы batchUpdate (сигнатуры gspread 5.x)."""
+
+    def __init__(self):
+        self.calls = []
+
+    def batch_update(self, body):
+        self.calls.append(('batch_update', body))
+
+    def values_batch_update(self, params=None, body=None):
+        self.calls.append(('values_batch_update', body))
+
+
+class TestWriteTabs(unittest.TestCase):
+    def test_both_tabs_go_out_in_two_requests(self):
+        sheet = FakeSpreadsheet()
+        raw_delete = {'deleteDimension': {'range': {'sheetId': 1, 'startIndex': 1, 'endIndex': 3}}}
+        groups_move = {'moveDimension': {'source': {'sheetId': 2}}}
+        asyncio.run(tts.write_tabs(
+            sheet, [raw_delete, groups_move],
+            [("'Original data'!C4", [['голова + хвост']]), ("'Groups'!D2:F2", [['1', '2', '3']])]))
+        self.assertEqual([method for method, _ in sheet.calls], ['batch_update', 'values_batch_update'])
+        self.assertEqual(sheet.calls[0][1]['requests'], [raw_delete, groups_move])
+        self.assertEqual([item['range'] for item in sheet.calls[1][1]['data']],
+                         ["'Original data'!C4", "'Groups'!D2:F2"])
+
+    def test_nothing_to_write(self):
+        sheet = FakeSpreadsheet()
+        asyncio.run(tts.write_tabs(sheet, [], []))
+        self.assertEqual(sheet.calls, [])
+
+
+class FakeClient:
+    """iter_messages по возрастанию id (как Telethon с reverse=True)."""
+
+    def __init__(self, messages, error=None):
+        self.messages = messages
+        self.error = error
+
+    async def iter_messages(self, chat_id, min_id=0, reverse=False, wait_time=None):
+        if self.error is not None:
+            raise self.error
+        for message in self.messages:
+            if message.id > min_id:
+                yield message
+
+
+class FakeWorksheet:
+    def __init__(self, log, title, sheet_id, keys=None, block=None, keys_read=None):
+        self.log = log
+        self.title = title
+        self.id = sheet_id
+        self.keys = keys or []
+        self.block = block
+        self.keys_read = keys_read
+        self.overlapped = None
+
+    def insert_row(self, values, index=1):
+        self.log.append((self.title, 'insert_row'))
+
+    def append_rows(self, rows):
+        if self.block is not None:
+            # Дозапись ждёт события параллельного этапа: при
+            # последовательном выполнении оно не наступит
+            self.overlapped = self.block.wait(timeout=5)
+        self.log.append((self.title, 'append_rows'))
+
+    def clear(self):
+        self.log.append((self.title, 'clear'))
+
+    def col_values(self, col):
+        self.log.append((self.title, 'col_values'))
+        if self.keys_read is not None:
+            self.keys_read.set()
+        return list(self.keys)
+
+
+class FakeSnapshot:
+    def __init__(self, values, worksheets):
+        self._values = values
+        self._worksheets = worksheets
+
+    def values(self, title):
+        return self._values.get(title, [])
+
+    def worksheet(self, title):
+        return self._worksheets.get(title)
+
+
+class RecordingSpreadsheet:
+    def __init__(self, log):
+        self.log = log
+
+    def batch_update(self, body):
+        self.log.append(('spreadsheet', 'batch_update'))
+
+    def values_batch_update(self, params=None, body=None):
+        self.log.append(('spreadsheet', 'values_batch_update'))
+
+
+def message(message_id, text, minutes_ago=10):
+    return SimpleNamespace(id=message_id, message=text, date=datetime.now() - timedelta(minutes=minutes_ago))
+
+
+class TestRunPipeline(unittest.TestCase):
+    """Проход сбора на поддельных Telegram и таблице: порядок записи
+    и судьба фоновых задач при раннем выходе и ошибке."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        last_id_file = os.path.join(self.tmp.name, 'last_message_id.txt')
+        with open(last_id_file, 'w') as f:
+            f.write('10')
+        for patcher in (
+                mock.patch.object(tts, 'LAST_ID_FILE', last_id_file),
+                mock.patch.object(tts, 'CHAIN_STATE_FILE', os.path.join(self.tmp.name, 'open_chain.json')),
+                mock.patch.object(tts, 'open_cache', return_value=None),
+                mock.patch.object(tts, 'open_counters', return_value=None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        set_deadline(None)
+        self.raw_store = RawStore(os.path.join(self.tmp.name, 'raw.sqlite'))
+        stamp = (datetime.now() - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+        self.raw_store.put([[10, stamp, 'production.ERROR: Order 10 failed']])
+        self.config = {'chat_id': '1', 'raw_archive_days': 0}
+        self.log = []
+        self.counted = threading.Event()
+        self.keys_read = threading.Event()
+        self.sheet_raw = FakeWorksheet(self.log, RAW_SHEET_TITLE, 1, block=self.counted)
+        self.sheet_groups = FakeWorksheet(self.log, 'Groups', 2, keys=['Ошибка (шаблон)'],
+                                          keys_read=self.keys_read)
+        self.sheet_archive = FakeWorksheet(self.log, tts.ARCHIVE_SHEET_TITLE, 3, block=self.keys_read)
+        snapshot = FakeSnapshot(
+            {RAW_SHEET_TITLE: [['ID', 'Дата'], ['10', stamp]], 'Groups': [tts.GROUPS_HEADER],
+             tts.ARCHIVE_SHEET_TITLE: [tts.GROUPS_HEADER]},
+            {RAW_SHEET_TITLE: self.sheet_raw, 'Groups': self.sheet_groups,
+             tts.ARCHIVE_SHEET_TITLE: self.sheet_archive})
+        self.sheets = (RecordingSpreadsheet(self.log), snapshot, self.sheet_raw, self.sheet_groups,
+                       [tts.GROUPS_HEADER], {})
+
+    def tearDown(self):
+        self.raw_store.close()
+        self.tmp.cleanup()
+
+    def run_pipeline(self, client, open_sheets=None):
+        """(результат или исключение, задача open_sheets)."""
+        async def scenario():
+            async def default_open_sheets():
+                return self.sheets
+
+            sheets_task = asyncio.create_task((open_sheets or default_open_sheets)())
+            try:
+                result = await tts.run_pipeline(client, self.config, self.raw_store, sheets_task)
+            except Exception as e:
+                result = e
+            return result, sheets_task
+
+        return asyncio.run(scenario())
+
+    def counting(self, error=None):
+        original = tts.count_and_aggregate
+
+        def count_and_aggregate(*args, **kwargs):
+            self.log.append(('groups', 'count'))
+            self.counted.set()
+            if error is not None:
+                raise error
+            return original(*args, **kwargs)
+
+        return mock.patch.object(tts, 'count_and_aggregate', side_effect=count_and_aggregate)
+
+    def test_raw_sheet_overlaps_counting_and_tabs_go_in_two_requests(self):
+        client = FakeClient([message(11, 'production.ERROR: Order 11 failed'),
+                             message(12, 'production.ERROR: Order 12 failed')])
+        with self.counting():
+            result, _ = self.run_pipeline(client)
+        self.assertEqual(result, 2)
+        self.assertTrue(self.sheet_raw.overlapped)
+        self.assertEqual(self.log, [
+            ('groups', 'count'),
+            (RAW_SHEET_TITLE, 'append_rows'),
+            ('Groups', 'col_values'),
+            ('spreadsheet', 'batch_update'),
+            ('spreadsheet', 'values_batch_update'),
+        ])
+        self.assertEqual(tts.read_last_id(), 12)
+        self.assertEqual([row[0] for row in self.raw_store.rows()], ['10', '11', '12'])
+
+    def test_archive_overlaps_groups_key_read(self):
+        original = tts.build_group_rows
+
+        def build_group_rows(*args, **kwargs):
+            final_rows, _, new_count = original(*args, **kwargs)
+            return final_rows, [['old', 'ПРОЧЕЕ', 'expired pattern']], new_count
+
+        client = FakeClient([message(11, 'production.ERROR: Order 11 failed')])
+        with self.counting(), mock.patch.object(tts, 'build_group_rows', side_effect=build_group_rows):
+            result, _ = self.run_pipeline(client)
+        self.assertEqual(result, 1)
+        self.assertTrue(self.sheet_archive.overlapped)
+        # Groups пишется только после архива
+        self.assertEqual(self.log[2:], [
+            ('Groups', 'col_values'),
+            (tts.ARCHIVE_SHEET_TITLE, 'append_rows'),
+            ('spreadsheet', 'batch_update'),
+            ('spreadsheet', 'values_batch_update'),
+        ])
+
+    def test_no_new_messages_cancels_sheets_task(self):
+        async def never_opens():
+            await asyncio.Event().wait()
+
+        result, sheets_task = self.run_pipeline(FakeClient([]), open_sheets=never_opens)
+        self.assertEqual(result, 0)
+        self.assertTrue(sheets_task.cancelled())
+        self.assertEqual(self.log, [])
+
+    def test_telegram_error_cancels_sheets_task(self):
+        async def never_opens():
+            await asyncio.Event().wait()
+
+        result, sheets_task = self.run_pipeline(FakeClient([], error=ConnectionError('proxy')),
+                                                open_sheets=never_opens)
+        self.assertIsInstance(result, ConnectionError)
+        self.assertTrue(sheets_task.cancelled())
+
+    def test_failed_counting_still_finishes_raw_sheet(self):
+        client = FakeClient([message(11, 'production.ERROR: Order 11 failed')])
+        with self.counting(error=RuntimeError('boom')):
+            result, _ = self.run_pipeline(client)
+        self.assertIsInstance(result, RuntimeError)
+        # Original data дописан, Groups не тронут; курсор и хранилище — уже сдвинуты
+        self.assertEqual(self.log, [('groups', 'count'), (RAW_SHEET_TITLE, 'append_rows')])
+        self.assertEqual(tts.read_last_id(), 11)
+        with open(tts.CHAIN_STATE_FILE, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['pending'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
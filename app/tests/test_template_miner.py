@@ -0,0 +1,82 @@
+"""Тесты майнера шаблонов (Drain).
+
+Запуск: cd app && python3 -m unittest tests.test_template_miner
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from normalize import normalize_error_pattern  # noqa: E402
+from template_miner import TemplateMiner  # noqa: E402
+
+
+class TestTemplateMiner(unittest.TestCase):
+    def test_variations_merge_into_template(self):
+        miner = TemplateMiner()
+        a = miner.add('production.ERROR: Sync failed for account <num> reason timeout from supplier api')
+        b = miner.add('production.ERROR: Sync failed for account <num> reason blocked from supplier api')
+        self.assertEqual(a, b)
+        self.assertEqual(miner.template(a),
+                         'production.ERROR: Sync failed for account <num> reason <*> from supplier api')
+
+    def test_discriminators_not_generalized(self):
+        miner = TemplateMiner()
+        a = miner.add(normalize_error_pattern(
+            'production.ERROR: Job failed with SQLSTATE[23000]: Integrity constraint violation now'))
+        b = miner.add(normalize_error_pattern(
+            'production.ERROR: Job failed with SQLSTATE[42S02]: Integrity constraint violation now'))
+        self.assertNotEqual(a, b)
+        c = miner.add('production.ERROR: Job App\\Jobs\\SyncOrdersJob failed on queue default')
+        d = miner.add('production.ERROR: Job App\\Jobs\\SyncStocksJob failed on queue default')
+        self.assertNotEqual(c, d)
+
+    def test_dissimilar_not_merged(self):
+        miner = TemplateMiner()
+        a = miner.add('production.ERROR: Account is blocked')
+        b = miner.add('production.ERROR: Partner not found')
+        self.assertNotEqual(a, b)
+
+    def test_wildcards_do_not_snowball(self):
+        # <*> не засчитывается как совпадение: обобщённый шаблон не
+        # притягивает тексты, совпадающие с ним только по <*>
+        miner = TemplateMiner()
+        a = miner.add('production.ERROR: sync of orders stalled at stage fetch for partner')
+        b = miner.add('production.ERROR: sync of orders stalled at stage other step again')
+        self.assertEqual(a, b)
+        self.assertEqual(miner.template(a), 'production.ERROR: sync of orders stalled at stage <*> <*> <*>')
+        # 4 из 10 позиций совпали, ещё 3 — только по <*>
+        c = miner.add('production.ERROR: sync of orders was reset elsewhere fetch for partner')
+        self.assertNotEqual(a, c)
+
+    def test_match_is_read_only(self):
+        miner = TemplateMiner()
+        miner.add('production.WARNING: lock renew failed for worker alpha on node main')
+        self.assertIsNone(miner.match('production.WARNING: other text entirely'))
+        self.assertEqual(
+            miner.match('production.WARNING: lock renew failed for worker beta on node main'),
+            'production.WARNING: lock renew failed for worker alpha on node main')
+        self.assertEqual(len(miner.clusters), 1)
+
+    def test_state_roundtrip_and_renames(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'miner.json')
+            miner = TemplateMiner()
+            cid = miner.add('production.ERROR: Export failed for report daily in format csv')
+            miner.save(path)
+
+            loaded = TemplateMiner.load(path)
+            self.assertEqual(loaded.add('production.ERROR: Export failed for report weekly in format csv'), cid)
+            self.assertEqual(loaded.renamed(), {
+                'production.ERROR: Export failed for report daily in format csv':
+                    'production.ERROR: Export failed for report <*> in format csv',
+            })
+            new_id = loaded.add('production.ERROR: something different')
+            self.assertGreater(new_id, cid)
+
+
+if __name__ == '__main__':
+    unittest.main()
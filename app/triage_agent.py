@@ -27,14 +27,17 @@ from datetime import datetime
 
 import gspread
 import httpx
-from oauth2client.service_account import ServiceAccountCredentials
 from openai import OpenAI
 
-from normalize import merge_fragment_chains, normalize_error_pattern
+from normalize import get_normalizer, merge_fragment_chains, normalize_many
+from normalize_cache import open_cache
+from raw_store import read_original_rows
+from sheets_client import open_spreadsheet
+from sheets_snapshot import load_snapshot
+from template_miner import TemplateMiner
 
 BASE_DIR = '/app'
 CONFIG_PATH = os.path.join(BASE_DIR, 'config.json')
-CREDENTIALS_FILE = os.path.join(BASE_DIR, 'google-credentials.json')
 LOG_PATH = os.path.join(BASE_DIR, 'logs/triage_agent.log')
 LOCK_PATH = os.path.join(BASE_DIR, 'triage_agent.lock')
 
@@ -111,12 +114,6 @@ def tool_prod_sql(config, query: str) -> str:
 
 # ===== Google Sheets =====
 
-def open_spreadsheet(config):
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    return gspread.authorize(creds).open_by_key(config['google_sheet_id'])
-
-
 def sheet_cols(rows):
     """Индексы колонок по именам заголовка (порядок колонок может меняться)."""
     header = rows[0] if rows else []
@@ -280,19 +277,24 @@ def main():
     model = os.environ.get('TRIAGE_MODEL') or config.get('openai_model', 'gpt-5.1')
     effort = os.environ.get('TRIAGE_EFFORT') or config.get('openai_reasoning_effort', 'low')
 
-    ss = open_spreadsheet(config)
+    ss = open_spreadsheet(config['google_sheet_id'])
+    # Метка дайджеста и Groups — одним снимком (метаданные + values.batchGet)
+    snapshot = load_snapshot(ss, {'Digest': 'A1', 'Groups': None})
 
     today = datetime.now().strftime('%Y-%m-%d')
-    try:
-        digest_ws = ss.worksheet('Digest')
-        if not test_mode and not no_digest and (digest_ws.acell('A1').value or '').strip() == today:
+    digest_ws = snapshot.worksheet('Digest')
+    if digest_ws is None:
+        digest_ws = ss.add_worksheet(title='Digest', rows='10', cols='2')
+    else:
+        stamp = snapshot.values('Digest')
+        if not test_mode and not no_digest and stamp and stamp[0] and stamp[0][0].strip() == today:
             logging.info('Дайджест за %s уже записан — выходим.', today)
             return
-    except gspread.exceptions.WorksheetNotFound:
-        digest_ws = ss.add_worksheet(title='Digest', rows='10', cols='2')
 
-    groups_ws = ss.worksheet('Groups')
-    rows = groups_ws.get_all_values()
+    groups_ws = snapshot.worksheet('Groups')
+    if groups_ws is None:
+        raise gspread.exceptions.WorksheetNotFound('Groups')
+    rows = snapshot.values('Groups')
     worklist, n_backlog, n_spikes, n_systemic = build_worklist(
         rows, weekday=int(weekday_override) if weekday_override else None)
     if only_systemic:
@@ -310,13 +312,30 @@ def main():
               if col(r, 'Вердикт') == 'действовать'][:30]
 
     # Кэш сырых примеров
-    raw_rows = ss.worksheet('Original data').get_all_values()
+    # Окно 30 дней — из локального хранилища коллектора (вкладка — запасной путь)
+    raw_rows = read_original_rows(ss)
     logs = [{'id': int(r[0]), 'date': r[1], 'text': r[2]}
-            for r in raw_rows[1:] if len(r) >= 3 and r[0].strip().isdigit()]
+            for r in raw_rows if len(r) >= 3 and r[0].strip().isdigit()]
     raw_cache = defaultdict(list)
-    for m in merge_fragment_chains(logs):
-        p = normalize_error_pattern(m['text'])[:250]
-        raw_cache[p].append((m['date'], m['text']))
+    normalize = get_normalizer(config.get('normalize_engine'), guard=config.get('normalize_guard'))
+    merged = merge_fragment_chains(logs)
+    cache = open_cache(config.get('normalize_engine'), normalize)
+    try:
+        texts = [m['text'] for m in merged]
+        workers = config.get('normalize_workers')
+        if cache is not None:
+            patterns = cache.lookup(texts, normalize, workers=workers)
+        else:
+            patterns = normalize_many(texts, workers=workers, normalize=normalize)
+    finally:
+        if cache is not None:
+            cache.close()
+    # С майнером шаблонов ключи Groups — шаблоны кластеров (только чтение)
+    miner = TemplateMiner.load() if config.get('template_miner') else None
+    for m, p in zip(merged, patterns):
+        if miner is not None and p:
+            p = miner.match(p) or p
+        raw_cache[p[:250]].append((m['date'], m['text']))
 
     # OpenAI блокирует регион сервера — ходим через локальный прокси-пул
     # (тот же, что для Telegram). Отключается пустым значением openai_proxy.
@@ -7,7 +7,11 @@ from collections import defaultdict
 from datetime import datetime, timedelta
 
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+
+from raw_store import read_original_rows
+from sheets_client import open_spreadsheet
+from sheets_retry import call_gspread
+from sheets_snapshot import load_snapshot
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,20 +29,11 @@ with open(os.path.join(script_dir, 'config.json'), 'r') as f:
 
 GOOGLE_SHEET_ID = config['google_sheet_id']
 
-# Авторизация
-scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-creds_path = os.path.join(script_dir, 'google-credentials.json')
-creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
-client = gspread.authorize(creds)
-
-# Доступ к таблице
-spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
+# Доступ к таблице (общий клиент sheets_client)
+spreadsheet = call_gspread(open_spreadsheet, GOOGLE_SHEET_ID)
 
-# Лист с оригинальными логами
-sheet = spreadsheet.worksheet('Original data')
-rows = sheet.get_all_values()
-header = rows[0]
-data = rows[1:]
+# Оригинальные логи: локальное хранилище коллектора (вкладка — запасной путь)
+data = read_original_rows(spreadsheet)
 id_col_index = 0
 
 cutoff_1d = datetime.now() - timedelta(days=1)
@@ -104,18 +99,21 @@ def history_id(key) -> str:
     return hashlib.sha1('|'.join(key).encode('utf-8')).hexdigest()[:8]
 
 
-def update_history(spreadsheet, groups_data):
+def update_history(spreadsheet, groups_data, snapshot=None):
     """Upsert типов в историю: новые добавляются, у известных обновляются
     «Последний раз», счётчик и сумма. Комментарий (ручная колонка) не трогаем.
-    Строки старше HISTORY_RETENTION_DAYS от первого появления удаляются."""
+    Строки старше HISTORY_RETENTION_DAYS от первого появления удаляются.
+    snapshot (SheetsSnapshot) — вкладка берётся из уже прочитанного снимка."""
     today = datetime.now().strftime('%Y-%m-%d')
-    try:
-        sheet = spreadsheet.worksheet(HISTORY_SHEET)
-    except gspread.exceptions.WorksheetNotFound:
-        sheet = spreadsheet.add_worksheet(title=HISTORY_SHEET, rows='500', cols='12')
-        sheet.append_row(HISTORY_HEADER)
-
-    existing_rows = sheet.get_all_values()
+    if snapshot is not None and snapshot.has(HISTORY_SHEET):
+        sheet = snapshot.worksheet(HISTORY_SHEET)
+        existing_rows = snapshot.values(HISTORY_SHEET)
+    else:
+        try:
+            sheet = call_gspread(spreadsheet.worksheet, HISTORY_SHEET)
+        except gspread.exceptions.WorksheetNotFound:
+            sheet = call_gspread(spreadsheet.add_worksheet, title=HISTORY_SHEET, rows='500', cols='12')
+        existing_rows = call_gspread(sheet.get_all_values)
     header = existing_rows[0] if existing_rows else HISTORY_HEADER
     idx = {name.strip(): i for i, name in enumerate(header) if name.strip()}
 
@@ -171,20 +169,23 @@ def update_history(spreadsheet, groups_data):
             out.append([cell(row, name) for name in HISTORY_HEADER])
 
     out.sort(key=lambda r: (r[8], r[7]), reverse=True)  # свежие сверху
-    sheet.clear()
-    sheet.append_rows([HISTORY_HEADER] + out)
+    call_gspread(sheet.clear)
+    call_gspread(sheet.append_rows, [HISTORY_HEADER] + out)
     logging.info('История неучтённых операций: %s типов (новых: %s)', len(out), added)
     print(f"История неучтённых операций обновлена: {len(out)} типов (новых: {added}).")
 
+# Метаданные вкладок и история — одним снимком (без worksheet() на каждую вкладку)
+snapshot = call_gspread(load_snapshot, spreadsheet, {HISTORY_SHEET: None})
+
 # Подготовка листа (очистка до начала обработки)
-try:
-    sheet_tx = spreadsheet.worksheet('Unknown tx')
-except gspread.exceptions.WorksheetNotFound:
-    sheet_tx = spreadsheet.add_worksheet(title='Unknown tx', rows='100', cols='12')
+sheet_tx = snapshot.worksheet('Unknown tx')
+if sheet_tx is None:
+    sheet_tx = call_gspread(spreadsheet.add_worksheet, title='Unknown tx', rows='100', cols='12')
 else:
-    sheet_tx.clear()
+    call_gspread(sheet_tx.clear)
 
-sheet_tx.append_row([
+# Таблица собирается в памяти и пишется одним запросом (квота — 60 записей в минуту)
+table = [[
     'Платформа (ВБ/ОЗОН/Некорректный лог)',
     'operation_type',
     'doc_type_name',
@@ -194,7 +195,7 @@ sheet_tx.append_row([
     'bonus_type_name',
     'За 1 день',
     'ID некорректных логов из Original data'
-])
+]]
 
 for row in data:
     if len(row) < 3:
@@ -257,19 +258,21 @@ for row in data:
 platform_priority = {'ВБ': 0, 'ОЗОН': 1, 'Некорректный лог': 2}
 sorted_keys = sorted(groups.items(), key=lambda x: (platform_priority.get(x[0][0], 99), -x[1]['1d']))
 
-# Запись строк
 for key, stats in sorted_keys:
     if key[0] == 'Некорректный лог':
         row = list(key) + [stats['1d'], ', '.join(ids_for_dash_group)]
     else:
         row = list(key) + [stats['1d'], '']
-    sheet_tx.append_row(row)
+    table.append(row)
+
+# Запись таблицы целиком: один values.append (сетка вкладки растёт сама)
+call_gspread(sheet_tx.append_rows, table)
 
 print("Сводка по 'Unknown transaction type' успешно записана.")
 
 # История неучтённых операций (отдельная вкладка, живёт 30 дней от первого появления)
 try:
-    update_history(spreadsheet, groups)
+    update_history(spreadsheet, groups, snapshot)
 except Exception as exc:
     logging.error('Не удалось обновить историю неучтённых операций: %s', exc, exc_info=True)
     print(f"Ошибка обновления истории: {exc}")